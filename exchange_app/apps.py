@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class ExchangeAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'exchange_app'
+
+    def ready(self):
+        from django.db import connections
+
+        from . import signals  # noqa: F401
+        from .metrics import install_query_counter
+
+        for connection in connections.all(initialized_only=True):
+            install_query_counter(connection)
@@ -0,0 +1,145 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponse
+from django.template.response import TemplateResponse
+from django.views import View
+
+from .conditional import has_pending_messages, make_etag, not_modified, set_validators
+from .cache import acached, ad_list_generations, ad_namespace, get_generation, versioned_key
+from .forms import AdFilterForm, ProposalFilterForm
+from .models import Ad, ExchangeProposal
+from .pagination import InvalidCursor, KeysetPaginator, pagination_context
+from .renderers import json_bytes
+from .serializers import AdSerializer
+from .sse import EVENTS_PATH
+from .views import AD_CACHE_TIMEOUT, AdListView, AdViewSet, ExchangeProposalListView, render_ad_cards
+
+# Асинхронные версии самых нагруженных страниц. Запросы к БД идут через
+# асинхронный ORM, поэтому медленный запрос не занимает поток воркера.
+# Подключаются через test_project.async_urls при запуске под ASGI.
+
+
+async def _auth_user(request):
+    user = await request.auser()
+    # Шаблоны и формы обращаются к request.user; подставляем уже загруженного пользователя.
+    request.user = user
+    return user
+
+
+async def _page(queryset, request, page_size):
+    try:
+        return await KeysetPaginator(queryset, page_size).apage(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Неверный курсор')
+
+
+class AsyncAdListView(View):
+    template_name = AdListView.template_name
+    paginate_by = AdListView.paginate_by
+
+    async def get(self, request):
+        user = await _auth_user(request)
+        etag = make_etag(await sync_to_async(ad_list_generations)(), sorted(request.GET.lists()), user.pk)
+        if await sync_to_async(has_pending_messages)(request):
+            return await self.render(request, user)
+        return (
+            not_modified(request, etag, private=True)
+            or set_validators(await self.render(request, user), etag, private=True)
+        )
+
+    async def render(self, request, user):
+        form = AdFilterForm(request.GET)
+        queryset = Ad.objects.order_by('-created_at')
+        if form.is_valid():
+            queryset = form.filter_queryset(queryset)
+
+        generations = await sync_to_async(ad_list_generations)(request.GET.get('category'))
+        key = versioned_key('ad-list', generations, sorted(request.GET.lists()), self.paginate_by)
+
+        async def compute():
+            page = await _page(queryset, request, self.paginate_by)
+            # Тот же формат, что у AdListView.paginate_queryset, чтобы кэш был общим.
+            return None, page, page.object_list, page.has_other_pages()
+
+        (_, page, ads, _), _ = await acached('ad-list', key, compute, AD_CACHE_TIMEOUT)
+
+        facets = await sync_to_async(form.get_facets)()
+        form.add_facet_counts(facets)
+        context = {
+            'ads': ads,
+            'ad_cards': await sync_to_async(render_ad_cards)(ads, generations),
+            'form': form,
+            'facets': facets,
+            'user': user,
+            **pagination_context(request, page),
+        }
+        return TemplateResponse(request, self.template_name, context)
+
+
+class AsyncAdDetailView(View):
+    async def get(self, request, pk):
+        namespace = ad_namespace(pk)
+        generation = await sync_to_async(get_generation)(namespace)
+        key = versioned_key('api-ads-detail', {namespace: generation}, str(pk), sorted(request.GET.lists()))
+
+        async def compute():
+            try:
+                ad = await Ad.objects.aget(pk=pk)
+            except Ad.DoesNotExist:
+                raise Http404
+            return AdSerializer(ad).data
+
+        etag = make_etag(key)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        data, hit = await acached('api-ads', key, compute, AD_CACHE_TIMEOUT)
+        last_modified = data.get('updated_at')
+        return not_modified(request, etag, last_modified) or set_validators(
+            HttpResponse(json_bytes(data), content_type='application/json', headers={'X-Cache': 'HIT' if hit else 'MISS'}),
+            etag, last_modified,
+        )
+
+
+class AsyncExchangeProposalListView(View):
+    template_name = ExchangeProposalListView.template_name
+    paginate_by = ExchangeProposalListView.paginate_by
+
+    async def get(self, request):
+        user = await _auth_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+
+        form = ProposalFilterForm(request.GET)
+        queryset = ExchangeProposal.objects.select_related('ad_sender', 'ad_receiver')
+        if form.is_valid():
+            queryset = form.filter_queryset(queryset, user)
+        else:
+            queryset = queryset.for_user(user)
+
+        page = await _page(queryset, request, self.paginate_by)
+        context = {
+            'object_list': page.object_list,
+            'form': form,
+            'user': user,
+            'events_url': EVENTS_PATH,
+            **pagination_context(request, page),
+        }
+        return TemplateResponse(request, self.template_name, context)
+
+
+_sync_ad_detail = AdViewSet.as_view({
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+})
+_async_ad_detail = AsyncAdDetailView.as_view()
+
+
+async def ad_detail(request, pk):
+    # Чтение идёт через асинхронный ORM, изменения и ?fields= — через обычный AdViewSet.
+    if request.method in ('GET', 'HEAD') and 'fields' not in request.GET:
+        return await _async_ad_detail(request, pk=pk)
+    return await sync_to_async(_sync_ad_detail)(request, pk=str(pk))
@@ -0,0 +1,46 @@
+"""Пользователь сессии из кэша.
+
+``AuthenticationMiddleware`` на каждый запрос читает пользователя через
+``get_user`` бэкенда — отдельный SELECT до начала работы представления.
+``CachedModelBackend`` хранит загруженного пользователя в кэше; запись
+удаляется при сохранении и удалении пользователя (в том числе при смене
+пароля и обновлении last_login при входе) и при выходе. Хэш пароля в
+кэше актуален, поэтому проверка ``get_session_auth_hash`` по-прежнему
+завершает чужие сессии после смены пароля.
+
+Включается настройкой ``AUTH_CACHE`` вместе с сессиями ``cached_db``.
+При нескольких воркерах кэш должен быть общим (``REDIS_URL``), иначе
+другой процесс увидит изменения пользователя только через ``USER_CACHE_TIMEOUT``.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+USER_CACHE_TIMEOUT = 300
+
+
+def user_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def forget_user(user_id):
+    key = user_key(user_id)
+    cache.delete(key)
+    # Как ads_changed: параллельный запрос мог положить в кэш строку,
+    # прочитанную до коммита.
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        if not settings.AUTH_CACHE:
+            return super().get_user(user_id)
+        key = user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
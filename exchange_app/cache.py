@@ -0,0 +1,140 @@
+import hashlib
+import secrets
+from collections import Counter
+
+from django.core.cache import cache
+
+from .metrics import record_cache
+
+GENERATION_TIMEOUT = None
+# Сколько хранится журнал изменений поколения (record_changes).
+CHANGES_TIMEOUT = 24 * 60 * 60
+
+# Попадания и промахи по пространствам имён в пределах процесса.
+stats = Counter()
+
+
+def _key(namespace):
+    return f'generation:{namespace}'
+
+
+def _initial_generation():
+    # Случайное начало, а не 1: после очистки или вытеснения счётчика из кэша
+    # номера не повторяются, и старые ключи и ETag не совпадут с новыми.
+    return secrets.randbits(62)
+
+
+def get_generations(namespaces):
+    keys = {_key(namespace): namespace for namespace in namespaces}
+    found = cache.get_many(keys)
+    generations = {}
+    for key, namespace in keys.items():
+        if key not in found:
+            initial = _initial_generation()
+            cache.add(key, initial, GENERATION_TIMEOUT)
+            found[key] = cache.get(key, initial)
+        generations[namespace] = found[key]
+    return generations
+
+
+def get_generation(namespace):
+    return get_generations([namespace])[namespace]
+
+
+def bump_generation(namespace):
+    # Ключи кэша содержат номер поколения, поэтому инвалидация — это один
+    # инкремент счётчика, а не перебор ключей.
+    try:
+        return cache.incr(_key(namespace))
+    except ValueError:
+        generation = _initial_generation()
+        cache.set(_key(namespace), generation, GENERATION_TIMEOUT)
+        return generation
+
+
+def _changes_key(namespace, generation):
+    return f'changes:{namespace}:{generation}'
+
+
+def record_changes(namespace, ids, timeout=CHANGES_TIMEOUT):
+    """Поднимает поколение ``namespace`` и сохраняет под новым номером изменённые ``ids``.
+
+    По журналу процесс, отставший на несколько поколений, догоняет их
+    (``changes_between``) вместо полной перестройки.
+    """
+    generation = bump_generation(namespace)
+    cache.set(_changes_key(namespace, generation), list(ids), timeout)
+    return generation
+
+
+def changes_between(namespace, start, end, limit):
+    """id, изменённые в поколениях ``start`` + 1 … ``end``.
+
+    None, если поколений больше ``limit``, номера не идут подряд (счётчик
+    сброшен) или часть журнала уже вытеснена из кэша.
+    """
+    if not 0 < end - start <= limit:
+        return None
+    keys = [_changes_key(namespace, generation) for generation in range(start + 1, end + 1)]
+    found = cache.get_many(keys)
+    if len(found) != len(keys):
+        return None
+    return {pk for key in keys for pk in found[key]}
+
+
+def versioned_key(prefix, generations, *parts):
+    raw = repr((sorted(generations.items()), parts)).encode()
+    return f'{prefix}:{hashlib.md5(raw).hexdigest()}'
+
+
+def record(namespace, hit):
+    stats[(namespace, 'hit' if hit else 'miss')] += 1
+    record_cache(namespace, hit)
+
+
+def cache_stats():
+    result = {}
+    for (namespace, kind), count in stats.items():
+        result.setdefault(namespace, {'hit': 0, 'miss': 0})[kind] = count
+    return result
+
+
+def cached(namespace, key, compute, timeout):
+    """Возвращает (значение, попадание) и учитывает результат в ``stats``."""
+    value = cache.get(key)
+    if value is not None:
+        record(namespace, True)
+        return value, True
+    record(namespace, False)
+    value = compute()
+    cache.set(key, value, timeout)
+    return value, False
+
+
+def category_namespace(category):
+    return f'ads:{category}'
+
+
+def ad_namespace(pk):
+    return f'ad:{pk}'
+
+
+def ad_list_generations(category=None):
+    from .models import Ad
+
+    categories = [value for value, _ in Ad.CATEGORY_CHOICES]
+    if category in categories:
+        categories = [category]
+    return get_generations(category_namespace(value) for value in categories)
+
+
+async def acached(namespace, key, compute, timeout):
+    """Асинхронный вариант ``cached``: ``compute`` — корутинная функция."""
+    value = await cache.aget(key)
+    if value is not None:
+        record(namespace, True)
+        return value, True
+    record(namespace, False)
+    value = await compute()
+    await cache.aset(key, value, timeout)
+    return value, False
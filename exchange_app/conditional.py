@@ -0,0 +1,48 @@
+import hashlib
+
+from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+
+# Условные GET (If-None-Match / If-Modified-Since). Валидаторы считаются до
+# построения ответа — из номеров поколений кэша или агрегатов по updated_at,
+# поэтому ответ 304 обходится без сериализации и рендеринга шаблонов.
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def _timestamp(value):
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    return int(value.timestamp()) if value else None
+
+
+def not_modified(request, etag=None, last_modified=None, private=False):
+    """Ответ 304 (412 для If-Match), если у клиента актуальная версия, иначе None."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(request, etag=etag, last_modified=_timestamp(last_modified))
+    if response is not None:
+        set_validators(response, etag, last_modified, private)
+    return response
+
+
+def set_validators(response, etag=None, last_modified=None, private=False):
+    if not 200 <= response.status_code < 300 and response.status_code != 304:
+        return response
+    if etag and not response.has_header('ETag'):
+        response['ETag'] = etag
+    timestamp = _timestamp(last_modified)
+    if timestamp is not None and not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date(timestamp)
+    # no-cache: хранить можно, но перед использованием — проверить у сервера.
+    patch_cache_control(response, no_cache=True, **({'private': True} if private else {}))
+    return response
+
+
+def has_pending_messages(request):
+    # Сообщение показывается один раз: страницу с ним нельзя отдавать из кэша клиента.
+    return bool(len(messages.get_messages(request)))
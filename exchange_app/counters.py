@@ -0,0 +1,125 @@
+"""Счётчики предложений на объявлении.
+
+Полученные предложения считаются по статусам, отправленные — общим числом.
+Счётчики меняются одним UPDATE с F-выражениями в транзакции, которая
+создаёт, меняет или удаляет предложения, поэтому одновременные записи не
+теряют приращений, а откат транзакции откатывает и счётчики.
+``recompute`` пересчитывает их по таблице предложений.
+"""
+from collections import Counter, defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest, Now
+
+from .models import Ad
+
+RECEIVED_FIELDS = {
+    'pending': 'received_pending_count',
+    'accepted': 'received_accepted_count',
+    'rejected': 'received_rejected_count',
+}
+SENT_FIELD = 'sent_count'
+
+
+class Deltas:
+    """Изменения счётчиков по объявлениям, накопленные для одного UPDATE."""
+
+    def __init__(self):
+        self.by_ad = defaultdict(Counter)
+
+    def added(self, sender, receiver, status, sign=1):
+        self.by_ad[sender][SENT_FIELD] += sign
+        self.by_ad[receiver][RECEIVED_FIELDS[status]] += sign
+
+    def removed(self, sender, receiver, status):
+        self.added(sender, receiver, status, sign=-1)
+
+    def status_changed(self, receiver, old, new):
+        # Неизвестный прежний статус (объект не из базы) не угадываем.
+        if old is None or old == new:
+            return
+        self.by_ad[receiver][RECEIVED_FIELDS[old]] -= 1
+        self.by_ad[receiver][RECEIVED_FIELDS[new]] += 1
+
+    def changes(self):
+        changes = {}
+        for ad, counts in self.by_ad.items():
+            counts = {field: delta for field, delta in counts.items() if delta}
+            if counts:
+                changes[ad] = counts
+        return changes
+
+
+def apply(deltas):
+    """Применяет ``deltas`` одним UPDATE и возвращает id изменённых объявлений."""
+    changes = deltas.changes()
+    if not changes:
+        return []
+
+    values = {}
+    for field in Ad.COUNTER_FIELDS:
+        ads_by_delta = defaultdict(list)
+        for ad, counts in changes.items():
+            if counts.get(field):
+                ads_by_delta[counts[field]].append(ad)
+        if ads_by_delta:
+            delta = Case(*(When(pk__in=ads, then=Value(value)) for value, ads in ads_by_delta.items()), default=Value(0))
+            # Расхождение исправляет recompute; уйти ниже нуля и сорвать
+            # удаление предложения на CHECK-ограничении счётчик не должен.
+            values[field] = Greatest(F(field) + delta, Value(0))
+
+    # updated_at: счётчики входят в ответ API, от него зависит Last-Modified.
+    Ad.objects.filter(pk__in=changes).update(**values, updated_at=Now())
+    return list(changes)
+
+
+def expected_counts(ad_model=Ad):
+    """Подзапросы с настоящими значениями счётчиков для каждого объявления."""
+    proposals = ad_model._meta.get_field('received_proposals').related_model
+
+    def count(field, **filters):
+        counted = (
+            proposals.objects.filter(**{field: OuterRef('pk')}, **filters)
+            .order_by().values(field).annotate(total=Count('pk')).values('total')
+        )
+        return Coalesce(Subquery(counted), Value(0))
+
+    expressions = {field: count('ad_receiver', status=status) for status, field in RECEIVED_FIELDS.items()}
+    expressions[SENT_FIELD] = count('ad_sender')
+    return expressions
+
+
+def recompute(ads=None, batch_size=1000):
+    """Пересчитывает счётчики ``ads`` пачками по ``batch_size`` объявлений.
+
+    Переписываются только расходящиеся строки; возвращает их id.
+    """
+    if ads is None:
+        ads = Ad.objects.all()
+    model = ads.model
+    expressions = expected_counts(model)
+    expected = {f'expected_{field}': expression for field, expression in expressions.items()}
+    differs = reduce(or_, (~Q(**{field: F(f'expected_{field}')}) for field in expressions))
+
+    fixed = []
+    last = None
+    while True:
+        batch = ads.order_by('pk')
+        if last is not None:
+            batch = batch.filter(pk__gt=last)
+        batch = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return fixed
+        last = batch[-1]
+        with transaction.atomic():
+            stale = list(
+                model.objects.filter(pk__in=batch).annotate(**expected).filter(differs).values_list('pk', flat=True)
+            )
+            if stale:
+                # Пересчёт в самом UPDATE, а не значения из SELECT выше: между
+                # ними могли появиться новые предложения.
+                model.objects.filter(pk__in=stale).update(**expressions)
+        fixed.extend(stale)
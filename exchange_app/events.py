@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import threading
+
+import orjson
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100
+REDIS_CHANNEL_PREFIX = 'exchange:events:'
+
+
+class Subscription:
+    def __init__(self, broker, user_id, loop):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def put(self, event):
+        # Медленный клиент не должен копить события бесконечно: лишние
+        # отбрасываются, список он всё равно увидит при обновлении.
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Рассылка событий подписчикам своего процесса.
+
+    Подписки — очереди asyncio в цикле событий ASGI-воркера; публиковать
+    можно из любого потока (синхронные представления, сигналы).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def deliver(self, user_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # Цикл событий уже остановлен (воркер завершается).
+                self.unsubscribe(subscription)
+
+    def publish(self, user_id, event):
+        self.deliver(user_id, event)
+
+
+class RedisBroker(InProcessBroker):
+    """Рассылка через Redis pub/sub: событие доходит до подписчиков во всех воркерах.
+
+    Каждый воркер держит одно соединение с подпиской на все каналы и
+    раздаёт полученные события своим подписчикам.
+    """
+
+    def __init__(self, url=None):
+        super().__init__()
+        import redis
+
+        self.url = url or settings.REDIS_URL
+        self._publisher = redis.Redis.from_url(self.url)
+        self._listener = None
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        return subscription
+
+    def publish(self, user_id, event):
+        self._publisher.publish(f'{REDIS_CHANNEL_PREFIX}{user_id}', orjson.dumps(event))
+
+    async def _listen(self):
+        import redis.asyncio
+
+        while True:
+            try:
+                client = redis.asyncio.Redis.from_url(self.url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(f'{REDIS_CHANNEL_PREFIX}*')
+                    async for message in pubsub.listen():
+                        if message['type'] != 'pmessage':
+                            continue
+                        user_id = int(message['channel'][len(REDIS_CHANNEL_PREFIX):])
+                        self.deliver(user_id, orjson.loads(message['data']))
+            except redis.ConnectionError:
+                logger.warning('Соединение с Redis для событий потеряно, переподключение')
+                await asyncio.sleep(1)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.EVENTS_BACKEND)()
+        return _broker
+
+
+def reset():
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def publish(user_ids, event):
+    """Отправляет событие пользователям ``user_ids`` после коммита транзакции."""
+    user_ids = set(user_ids) - {None}
+
+    def send():
+        broker = get_broker()
+        for user_id in user_ids:
+            broker.publish(user_id, event)
+
+    transaction.on_commit(send)
+
+
+def proposal_event(kind, proposal_id, status, ad_sender, ad_receiver):
+    return {
+        'type': kind,
+        'id': proposal_id,
+        'status': status,
+        'ad_sender': ad_sender,
+        'ad_receiver': ad_receiver,
+    }
+
+
+def format_sse(event):
+    return b'event: ' + event['type'].encode() + b'\ndata: ' + orjson.dumps(event) + b'\n\n'
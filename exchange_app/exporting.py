@@ -0,0 +1,66 @@
+import csv
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+
+CONTENT_TYPES = {
+    CSV: 'text/csv; charset=utf-8',
+    NDJSON: 'application/x-ndjson',
+}
+
+CHUNK_SIZE = 2000
+
+
+def iter_rows(queryset, fields, chunk_size=CHUNK_SIZE):
+    """Отдаёт кортежи значений полей, читая таблицу кусками по первичному ключу.
+
+    Каждый кусок — отдельный короткий запрос ``WHERE id > последний id
+    ORDER BY id LIMIT n``, поэтому в памяти держится не больше одного
+    куска, а курсор БД не остаётся открытым на всё время ответа.
+    """
+    columns = ['pk', *fields]
+    queryset = queryset.order_by('pk').values_list(*columns)
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            return
+        last_pk = rows[-1][0]
+        yield [row[1:] for row in rows]
+
+
+def csv_chunks(fields, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(fields, chunks):
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for rows in chunks:
+        yield ''.join(encoder.encode(dict(zip(fields, row))) + '\n' for row in rows)
+
+
+def export_response(queryset, fields, fmt, filename):
+    chunks = iter_rows(queryset, fields)
+    if fmt == NDJSON:
+        content = ndjson_chunks(fields, chunks)
+    else:
+        fmt = CSV
+        content = csv_chunks(fields, chunks)
+
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
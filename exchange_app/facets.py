@@ -0,0 +1,47 @@
+from django.db.models import Count
+
+from .cache import ad_list_generations, cached, versioned_key
+from .models import Ad
+from .search import search_ads
+
+TIMEOUT = 300
+
+
+def _grid(search):
+    queryset = Ad.objects.all()
+    if search:
+        queryset = search_ads(queryset, search)
+    rows = queryset.order_by().values_list('category', 'condition').annotate(count=Count('pk'))
+    return {(category, condition): count for category, condition, count in rows}
+
+
+def facet_grid(search=''):
+    """Число объявлений для каждой пары (категория, состояние).
+
+    Считается одним GROUP BY с учётом поиска и кэшируется до следующего
+    изменения объявлений.
+    """
+    # Счётчики зависят от всех категорий, поэтому в ключ входят поколения каждой из них.
+    key = versioned_key('ad-facets', ad_list_generations(), (search or '').strip().lower())
+    grid, _ = cached('ad-facets', key, lambda: _grid(search), TIMEOUT)
+    return grid
+
+
+def ad_facets(search='', category='', condition=''):
+    """Счётчики для фильтров списка объявлений.
+
+    Счётчики категорий учитывают выбранное состояние, а счётчики состояний —
+    выбранную категорию, как это принято в фасетном поиске.
+    """
+    grid = facet_grid(search)
+    categories = {value: 0 for value, _ in Ad.CATEGORY_CHOICES}
+    conditions = {value: 0 for value, _ in Ad.CONDITION_CHOICES}
+    total = 0
+    for (row_category, row_condition), count in grid.items():
+        if not condition or row_condition == condition:
+            categories[row_category] = categories.get(row_category, 0) + count
+        if not category or row_category == category:
+            conditions[row_condition] = conditions.get(row_condition, 0) + count
+        if (not category or row_category == category) and (not condition or row_condition == condition):
+            total += count
+    return {'total': total, 'category': categories, 'condition': conditions}
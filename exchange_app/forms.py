@@ -1,15 +1,18 @@
 # exchange_app/forms.py
 from django import forms
 from .models import Ad, ExchangeProposal
+from .facets import ad_facets
+from .search import search_ads
+from .widgets import AutocompleteSelect
 
 class AdFilterForm(forms.Form):
     category = forms.ChoiceField(
-        choices=Ad.CATEGORY_CHOICES,
+        choices=[('', 'Все'), *Ad.CATEGORY_CHOICES],
         required=False,
         label='Категория'
     )
     condition = forms.ChoiceField(
-        choices=Ad.CONDITION_CHOICES,
+        choices=[('', 'Все'), *Ad.CONDITION_CHOICES],
         required=False,
         label='Состояние'
     )
@@ -19,6 +22,32 @@ class AdFilterForm(forms.Form):
         widget=forms.TextInput(attrs={'placeholder': 'Название или описание'})
     )
 
+    def filter_queryset(self, queryset):
+        data = self.cleaned_data
+
+        if data.get('category'):
+            queryset = queryset.filter(category=data['category'])
+
+        if data.get('condition'):
+            queryset = queryset.filter(condition=data['condition'])
+
+        if data.get('search'):
+            queryset = search_ads(queryset, data['search'])
+
+        return queryset
+
+    def get_facets(self):
+        data = self.cleaned_data if self.is_valid() else {}
+        return ad_facets(data.get('search', ''), data.get('category', ''), data.get('condition', ''))
+
+    def add_facet_counts(self, facets):
+        for name in ('category', 'condition'):
+            counts = facets[name]
+            self.fields[name].choices = [
+                (value, f'{label} ({counts.get(value, 0) if value else sum(counts.values())})')
+                for value, label in self.fields[name].choices
+            ]
+
 
 class AdCreateForm(forms.ModelForm):
     class Meta:
@@ -39,6 +68,7 @@ class ExchangeProposalForm(forms.ModelForm):
         model = ExchangeProposal
         fields = ['ad_sender', 'ad_receiver', 'comment']
         widgets = {
+            'ad_receiver': AutocompleteSelect('api-ads-autocomplete'),
             'comment': forms.Textarea(attrs={'rows': 3}),
         }
 
@@ -49,22 +79,11 @@ class ExchangeProposalForm(forms.ModelForm):
             self.fields['ad_sender'].queryset = Ad.objects.filter(user=user)
             self.fields['ad_receiver'].queryset = Ad.objects.exclude(user=user)
 
-    def clean(self):
-        cleaned_data = super().clean()
-        ad_sender = cleaned_data.get('ad_sender')
-        ad_receiver = cleaned_data.get('ad_receiver')
-
-        if ad_sender and ad_receiver:
-            if ad_sender.user == ad_receiver.user:
-                raise forms.ValidationError("Нельзя создавать предложение между своими объявлениями")
-            
-            if ExchangeProposal.objects.filter(
-                ad_sender=ad_sender, 
-                ad_receiver=ad_receiver
-            ).exists():
-                raise forms.ValidationError("Предложение уже существует")
-            
-        return cleaned_data
+    def _get_validation_exclusions(self):
+        # Объявления уже найдены полями формы (для своего пользователя — среди
+        # нужных владельцев), поэтому модель не перепроверяет их запросами.
+        # Пара и ad_sender ≠ ad_receiver проверяются ограничениями БД в save().
+        return super()._get_validation_exclusions() | {'ad_sender', 'ad_receiver'}
 
 class ProposalFilterForm(forms.Form):
     STATUS_CHOICES = [
@@ -74,9 +93,18 @@ class ProposalFilterForm(forms.Form):
     
     status = forms.ChoiceField(choices=STATUS_CHOICES, required=False)
     direction = forms.ChoiceField(
-        choices=[('sent', 'Отправленные'), ('received', 'Полученные')],
+        choices=[('', 'Все'), ('sent', 'Отправленные'), ('received', 'Полученные')],
         required=False
     )
 
+    def filter_queryset(self, queryset, user):
+        data = self.cleaned_data
+        queryset = queryset.for_user(user, data.get('direction'))
+
+        if data.get('status'):
+            queryset = queryset.filter(status=data['status'])
+
+        return queryset
+
 
 
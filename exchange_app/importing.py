@@ -0,0 +1,108 @@
+import codecs
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import Ad
+from .serializers import AdSerializer
+from .signals import ads_changed, similar_ads_changed
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+
+CONTENT_TYPES = {
+    'text/csv': CSV,
+    'application/x-ndjson': NDJSON,
+    'application/ndjson': NDJSON,
+    'application/jsonl': NDJSON,
+}
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def as_dict(self):
+        return {'created': self.created, 'errors': self.errors}
+
+
+def decode_lines(chunks, encoding='utf-8'):
+    """Превращает поток байтовых кусков в поток текстовых строк."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    tail = ''
+    for chunk in chunks:
+        tail += decoder.decode(chunk)
+        *lines, tail = tail.split('\n')
+        yield from (line + '\n' for line in lines)
+    tail += decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def parse_rows(lines, fmt):
+    """Возвращает пары (номер строки, данные или ошибка разбора)."""
+    if fmt == CSV:
+        reader = csv.DictReader(lines)
+        for number, row in enumerate(reader, start=1):
+            yield number, {key: value for key, value in row.items() if key}
+    elif fmt == NDJSON:
+        number = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield number, ValidationError({'non_field_errors': ['Некорректный JSON']})
+                continue
+            if not isinstance(row, dict):
+                yield number, ValidationError({'non_field_errors': ['Ожидается JSON-объект']})
+                continue
+            yield number, row
+    else:
+        raise ValueError(f'Неизвестный формат: {fmt}')
+
+
+def import_ads(rows, user, batch_size=1000):
+    """Создаёт объявления пачками через bulk_create.
+
+    Каждая строка проверяется AdSerializer; строки с ошибками попадают в
+    ``errors`` и не мешают сохранению остальных. Каждая пачка сохраняется
+    в отдельной транзакции.
+    """
+    serializer = AdSerializer()
+    result = ImportResult()
+    rows = iter(rows)
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+
+        ads = []
+        for number, row in batch:
+            try:
+                if isinstance(row, ValidationError):
+                    raise row
+                data = serializer.run_validation(row)
+            except ValidationError as exc:
+                result.errors.append({'row': number, 'errors': exc.detail})
+                continue
+            ads.append(Ad(user=user, **data))
+
+        if not ads:
+            continue
+        with transaction.atomic():
+            Ad.objects.bulk_create(ads, batch_size=batch_size)
+            # bulk_create не отправляет post_save, поэтому кэши сбрасываем сами —
+            # для каждой пачки: если следующая упадёт, эта уже сохранена.
+            ads_changed({ad.category for ad in ads})
+            similar_ads_changed(ad.pk for ad in ads)
+        result.created += len(ads)
+
+    return result
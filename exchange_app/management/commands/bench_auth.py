@@ -0,0 +1,47 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from exchange_app.management.commands.bench_endpoints import client_host, measure
+
+MODES = {
+    'db': {'SESSION_ENGINE': 'django.contrib.sessions.backends.db', 'AUTH_CACHE': False},
+    'cached': {'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db', 'AUTH_CACHE': True},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает авторизованный GET ad-list с сессией и пользователем из БД и из кэша: '
+        'перцентили задержки и число SQL-запросов. Данные: python manage.py seed_marketplace'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--path', default=reverse('ad-list'))
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(ad__isnull=False).first() or User.objects.first()
+        if user is None:
+            raise CommandError('Нет пользователей: сначала запустите seed_marketplace')
+
+        results = {}
+        for mode, overrides in MODES.items():
+            with override_settings(**overrides):
+                # Новый клиент — новый обработчик: SessionMiddleware читает SESSION_ENGINE при создании.
+                client = Client(HTTP_HOST=client_host())
+                client.force_login(user)
+                results[mode] = measure(client, options['path'], options['requests'], options['warmup'])
+                client.logout()
+
+        db, cached = results['db'], results['cached']
+        results['saved'] = {
+            'queries': db['queries'] - cached['queries'],
+            'p50_ms': round(db['p50_ms'] - cached['p50_ms'], 2),
+            'p95_ms': round(db['p95_ms'] - cached['p95_ms'], 2),
+        }
+        self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
@@ -0,0 +1,142 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, reverse
+
+from exchange_app import urls
+from exchange_app.management.commands.bench_http import percentile
+from exchange_app.models import ExchangeProposal
+
+
+def iter_url_names(patterns):
+    """Имена маршрутов и их параметры; варианты DRF с суффиксом формата пропускаются."""
+    seen = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_url_names(pattern.url_patterns)
+            continue
+        params = set(pattern.pattern.regex.groupindex)
+        if not pattern.name or 'format' in params or pattern.name in seen:
+            continue
+        seen.add(pattern.name)
+        yield pattern.name, params, pattern.callback
+
+
+def client_host():
+    # При DEBUG и пустом ALLOWED_HOSTS Django принимает localhost, но не testserver.
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def allows_get(callback):
+    actions = getattr(callback, 'actions', None)
+    if actions is not None:
+        return 'get' in actions
+    view_class = getattr(callback, 'view_class', None)
+    return view_class is None or hasattr(view_class, 'get')
+
+
+def compare(results, baseline, tolerance):
+    """Регрессии относительно сохранённого прогона: p95 выше на ``tolerance`` или больше запросов."""
+    regressions = {}
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        reasons = []
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            reasons.append(f"p95 {previous['p95_ms']} -> {current['p95_ms']} мс")
+        if current['queries'] > previous['queries']:
+            reasons.append(f"запросов {previous['queries']} -> {current['queries']}")
+        if reasons:
+            regressions[name] = reasons
+    return regressions
+
+
+def measure(client, path, requests, warmup=2, cold=False):
+    """Перцентили задержки ``client.get(path)`` и наибольшее число SQL-запросов за запрос."""
+    for _ in range(warmup):
+        client.get(path)
+
+    latencies, queries = [], 0
+    for _ in range(requests):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(path)
+            if response.streaming:
+                response.getvalue()
+            latencies.append(time.perf_counter() - started)
+        queries = max(queries, len(captured))
+
+    return {
+        'path': path,
+        'status': response.status_code,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries': queries,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет GET-запросы по всем маршрутам exchange_app.urls (включая роутер DRF) '
+        'и печатает JSON с перцентилями задержки и числом SQL-запросов. '
+        'Данные для прогона: python manage.py seed_marketplace'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Замеров на маршрут')
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--cold', action='store_true', help='Очищать кэш перед каждым запросом')
+        parser.add_argument('--save', help='Сохранить результат как базовый')
+        parser.add_argument('--baseline', help='Сравнить с сохранённым результатом')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Допустимый рост p95 (доля)')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        proposal = ExchangeProposal.objects.select_related('ad_receiver__user').order_by('-pk').first()
+        if proposal is None:
+            raise CommandError('Нет данных: сначала запустите seed_marketplace')
+
+        # Пользователь-получатель видит и свои объявления, и форму ответа на предложение.
+        user = proposal.ad_receiver.user
+        client = Client(HTTP_HOST=client_host())
+        client.force_login(user)
+        ids = {'ad': proposal.ad_receiver_id, 'proposal': proposal.pk}
+
+        results, paths = {}, set()
+        for name, params, callback in iter_url_names(urls.urlpatterns):
+            if not allows_get(callback):
+                continue
+            kind = 'proposal' if 'proposal' in name else 'ad'
+            path = reverse(name, kwargs={param: ids[kind] for param in params})
+            # Корень API (api-root) перекрыт списком объявлений на том же пути.
+            if path in paths:
+                continue
+            paths.add(path)
+            results[name] = measure(client, path, options['requests'], options['warmup'], options['cold'])
+
+        report = {'endpoints': results}
+        if options['baseline']:
+            with open(options['baseline']) as stream:
+                baseline = json.load(stream)['endpoints']
+            report['regressions'] = compare(results, baseline, options['tolerance'])
+
+        if options['save']:
+            with open(options['save'], 'w') as stream:
+                json.dump({'endpoints': results}, stream, ensure_ascii=False, indent=2)
+
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        if options['fail_on_regression'] and report.get('regressions'):
+            raise CommandError(f"Регрессии: {', '.join(report['regressions'])}")
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+
+import httpx
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.middleware.csrf import CSRF_ALLOWED_CHARS, CSRF_SECRET_LENGTH
+from django.test import Client
+from django.utils.crypto import get_random_string
+
+from exchange_app.management.commands.bench_http import percentile
+from exchange_app.models import Ad
+
+
+def session_cookies(user):
+    client = Client()
+    client.force_login(user)
+    return {settings.SESSION_COOKIE_NAME: client.cookies[settings.SESSION_COOKIE_NAME].value}
+
+
+def summary(values):
+    if not values:
+        return None
+    return {
+        'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+        'max_ms': round(max(values) * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест SSE запущенного ASGI-сервера: открывает N подписок '
+        '/proposals/events/ одного пользователя, создаёт предложения через API '
+        'и замеряет время подключения и доставки каждого события каждому подписчику. '
+        'Сервер должен работать с той же базой данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help='Например, http://localhost:8001')
+        parser.add_argument('--subscribers', type=int, default=1000)
+        parser.add_argument('--events', type=int, default=10)
+        parser.add_argument('--interval', type=float, default=0.2, help='Пауза между событиями, с')
+        parser.add_argument('--timeout', type=float, default=60)
+
+    def handle(self, *args, **options):
+        receiver, _ = User.objects.get_or_create(username='bench-events-receiver')
+        sender, _ = User.objects.get_or_create(username='bench-events-sender')
+        target = Ad.objects.create(user=receiver, title='Цель', description='bench_events', category='other', condition='used')
+        offers = Ad.objects.bulk_create(
+            Ad(user=sender, title=f'Предложение {number}', description='bench_events', category='other', condition='used')
+            for number in range(options['events'])
+        )
+        try:
+            report = asyncio.run(self._run(
+                options['base_url'].rstrip('/'), session_cookies(receiver), session_cookies(sender),
+                target, offers, options,
+            ))
+        finally:
+            Ad.objects.filter(pk__in=[target.pk, *(offer.pk for offer in offers)]).delete()
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+
+    async def _run(self, base_url, receiver_cookies, sender_cookies, target, offers, options):
+        count = options['subscribers']
+        connected = asyncio.Semaphore(0)
+        connect_times, delivery_times, sent = [], [], {}
+        failures = []
+
+        async def subscribe(client):
+            started = time.perf_counter()
+            received = 0
+            try:
+                async with client.stream('GET', f'{base_url}/proposals/events/', cookies=receiver_cookies) as response:
+                    if response.status_code != 200:
+                        raise CommandError(f'/proposals/events/ ответил {response.status_code}')
+                    async for line in response.aiter_lines():
+                        if line.startswith('retry:'):
+                            connect_times.append(time.perf_counter() - started)
+                            connected.release()
+                        elif line.startswith('data:'):
+                            event = json.loads(line[5:])
+                            delivery_times.append(time.perf_counter() - sent[event['ad_sender']])
+                            received += 1
+                            if received == len(offers):
+                                return
+            except (httpx.HTTPError, CommandError) as error:
+                failures.append(str(error) or type(error).__name__)
+                connected.release()
+
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        timeout = httpx.Timeout(options['timeout'], connect=options['timeout'])
+        async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+            subscribers = [asyncio.create_task(subscribe(client)) for _ in range(count)]
+            for _ in range(count):
+                await asyncio.wait_for(connected.acquire(), options['timeout'])
+
+            csrf = get_random_string(CSRF_SECRET_LENGTH, allowed_chars=CSRF_ALLOWED_CHARS)
+            cookies = {**sender_cookies, settings.CSRF_COOKIE_NAME: csrf}
+            for offer in offers:
+                sent[offer.pk] = time.perf_counter()
+                response = await client.post(
+                    f'{base_url}/api/proposals/',
+                    json={'ad_sender': offer.pk, 'ad_receiver': target.pk},
+                    cookies=cookies,
+                    headers={'X-CSRFToken': csrf},
+                )
+                if response.status_code != 201:
+                    raise CommandError(f'Создание предложения: {response.status_code} {response.text[:200]}')
+                await asyncio.sleep(options['interval'])
+
+            done, pending = await asyncio.wait(subscribers, timeout=options['timeout'])
+            for task in pending:
+                task.cancel()
+
+        return {
+            'subscribers': count,
+            'connected': len(connect_times),
+            'failures': len(failures),
+            'connect': summary(connect_times),
+            'events': len(offers),
+            'deliveries_expected': len(connect_times) * len(offers),
+            'delivered': len(delivery_times),
+            'delivery': summary(delivery_times),
+        }
@@ -0,0 +1,74 @@
+import json
+import resource
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from exchange_app.models import Ad
+from exchange_app.views import AdExportView
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Замеряет потоковую выгрузку объявлений: время, первый кусок и пик памяти процесса'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._populate(options['rows'], options['batch_size'])
+                result = self._measure(options['format'])
+                raise _Rollback
+        except _Rollback:
+            pass
+        self.stdout.write(json.dumps(result))
+
+    def _populate(self, rows, batch_size):
+        user = User.objects.create(username='bench-export')
+        for start in range(0, rows, batch_size):
+            Ad.objects.bulk_create(
+                Ad(user=user, title=f'Товар {n}', description='Описание товара', category='books', condition='new')
+                for n in range(start, min(start + batch_size, rows))
+            )
+
+    def _measure(self, fmt):
+        request = RequestFactory().get('/ads/export/', {'format': fmt})
+        # ru_maxrss — пик за всю жизнь процесса, поэтому важен прирост после
+        # заполнения базы; tracemalloc — пик объектов Python во время выгрузки.
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = AdExportView.as_view()(request)
+        first_chunk = None
+        lines = size = 0
+        for chunk in response.streaming_content:
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - started
+            lines += chunk.count(b'\n')
+            size += len(chunk)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+
+        return {
+            'format': fmt,
+            'rows': lines - (fmt == 'csv'),
+            'bytes': size,
+            'first_chunk_ms': round((first_chunk or 0) * 1000, 1),
+            'total_s': round(elapsed, 2),
+            'python_peak_mb': round(peak / 2**20, 1),
+            # На Linux ru_maxrss в килобайтах.
+            'rss_growth_mb': round(rss_growth / 1024, 1),
+        }
@@ -0,0 +1,66 @@
+import asyncio
+import json
+import time
+
+import httpx
+from django.core.management.base import BaseCommand
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_load(urls, concurrency, total, timeout=30.0):
+    """Отправляет ``total`` GET-запросов по кругу по ``urls`` с заданной конкурентностью."""
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker(client):
+        nonlocal errors
+        for number in counter:
+            url = urls[number % len(urls)]
+            started = time.perf_counter()
+            try:
+                response = await client.get(url)
+                if response.status_code >= 500:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест запущенного сервера: запросы в секунду и p99. '
+        'Для сравнения запустите его против runserver (WSGI) и uvicorn (ASGI).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help='Например, http://localhost:8000')
+        parser.add_argument('--path', action='append', dest='paths', help='Можно указать несколько раз')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        paths = options['paths'] or ['/', '/?category=books', '/api/ads/']
+        urls = [base_url + path for path in paths]
+        result = asyncio.run(run_load(urls, options['concurrency'], options['requests']))
+        self.stdout.write(json.dumps({'base_url': base_url, 'concurrency': options['concurrency'], **result}))
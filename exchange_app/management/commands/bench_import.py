@@ -0,0 +1,64 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from exchange_app.importing import import_ads
+from exchange_app.models import Ad
+from exchange_app.serializers import AdSerializer
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость пакетного импорта объявлений с созданием по одному'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rows = list(self._rows(options['rows']))
+        single = self._run(lambda user: self._create_one_by_one(rows, user))
+        bulk = self._run(lambda user: import_ads(enumerate(rows, start=1), user, batch_size=options['batch_size']))
+        self.stdout.write(f'по одному:  {len(rows) / single:10.0f} строк/с')
+        self.stdout.write(f'пакетами:   {len(rows) / bulk:10.0f} строк/с  (x{single / bulk:.1f})')
+
+    @staticmethod
+    def _rows(count):
+        rng = random.Random(count)
+        categories = [value for value, _ in Ad.CATEGORY_CHOICES]
+        conditions = [value for value, _ in Ad.CONDITION_CHOICES]
+        for i in range(count):
+            yield {
+                'title': f'Товар {i}',
+                'description': 'Описание товара для импорта',
+                'image_url': f'https://example.com/{i}.jpg',
+                'category': rng.choice(categories),
+                'condition': rng.choice(conditions),
+            }
+
+    @staticmethod
+    def _create_one_by_one(rows, user):
+        # Тот же путь, что у AdViewSet.create: сериализатор и транзакция на каждую строку.
+        for row in rows:
+            with transaction.atomic():
+                serializer = AdSerializer(data=row)
+                serializer.is_valid(raise_exception=True)
+                serializer.save(user=user)
+
+    @staticmethod
+    def _run(load):
+        try:
+            with transaction.atomic():
+                user = User.objects.create(username='bench-import')
+                started = time.perf_counter()
+                load(user)
+                elapsed = time.perf_counter() - started
+                raise _Rollback
+        except _Rollback:
+            return elapsed
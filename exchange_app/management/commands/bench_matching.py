@@ -0,0 +1,72 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from exchange_app.management.commands.bench_http import percentile
+from exchange_app.matching import DEFAULT_MAX_LENGTH, ExchangeGraph
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет граф обменов на синтетических данных в памяти: построение, '
+        'инкрементальные изменения, поиск циклов для пользователя и полный перебор'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--proposals', type=int, default=100_000)
+        parser.add_argument('--ads', type=int, default=50_000)
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--max-length', type=int, default=DEFAULT_MAX_LENGTH)
+        parser.add_argument('--queries', type=int, default=1000, help='Запросов циклов для случайных пользователей')
+        parser.add_argument('--full', action='store_true', help='Также перебрать все циклы графа')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        owners = [rng.randrange(options['users']) for _ in range(options['ads'])]
+        rows = self._rows(rng, owners, options['proposals'])
+        max_length = options['max_length']
+        result = {'proposals': len(rows), 'ads': options['ads'], 'max_length': max_length}
+
+        started = time.perf_counter()
+        graph = ExchangeGraph.from_rows(rows)
+        result['build_s'] = round(time.perf_counter() - started, 3)
+
+        extra = self._rows(rng, owners, 1000, start=len(rows))
+        started = time.perf_counter()
+        for row in extra:
+            graph.add(*row)
+        for row in extra:
+            graph.remove(row[1], row[2])
+        result['update_us'] = round((time.perf_counter() - started) / (2 * len(extra)) * 1e6, 2)
+
+        latencies, found = [], 0
+        for _ in range(options['queries']):
+            user = owners[rng.randrange(len(owners))]
+            started = time.perf_counter()
+            found += len(graph.cycles_through(graph.user_ads(user), max_length))
+            latencies.append(time.perf_counter() - started)
+        result.update({
+            'user_query_p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'user_query_p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'user_query_cycles': found,
+        })
+
+        if options['full']:
+            started = time.perf_counter()
+            result['all_cycles'] = sum(1 for _ in graph.all_cycles(max_length))
+            result['all_cycles_s'] = round(time.perf_counter() - started, 3)
+
+        self.stdout.write(json.dumps(result))
+
+    @staticmethod
+    def _rows(rng, owners, count, start=0):
+        rows, pairs = [], set()
+        while len(rows) < count:
+            sender, receiver = rng.randrange(len(owners)), rng.randrange(len(owners))
+            if owners[sender] == owners[receiver] or (sender, receiver) in pairs:
+                continue
+            pairs.add((sender, receiver))
+            rows.append((start + len(rows) + 1, sender, receiver, owners[sender], owners[receiver]))
+        return rows
@@ -0,0 +1,78 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from exchange_app.models import Ad
+from exchange_app.search import search_ads
+
+WORDS = (
+    'телефон ноутбук книга роман куртка пальто зимний летний новый старый '
+    'рабочий чехол зарядка детектив учебник платье кроссовки гитара лампа '
+    'стол стул монитор клавиатура мышь наушники рюкзак сумка часы камера'
+).split()
+
+QUERIES = ['телефон', 'зимн', 'детектив роман', 'гитара новая']
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает полнотекстовый поиск объявлений с поиском через icontains'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self._populate(size, options['batch_size'])
+                    self._measure(size, options['repeat'])
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def _populate(self, size, batch_size):
+        rng = random.Random(size)
+        user = User.objects.create(username=f'bench-search-{size}')
+        categories = [value for value, _ in Ad.CATEGORY_CHOICES]
+        conditions = [value for value, _ in Ad.CONDITION_CHOICES]
+        for start in range(0, size, batch_size):
+            Ad.objects.bulk_create(
+                Ad(
+                    user=user,
+                    title=' '.join(rng.choices(WORDS, k=3)),
+                    description=' '.join(rng.choices(WORDS, k=40)),
+                    category=rng.choice(categories),
+                    condition=rng.choice(conditions),
+                )
+                for _ in range(min(batch_size, size - start))
+            )
+
+    def _measure(self, size, repeat):
+        base = Ad.objects.order_by('-created_at')
+        for query in QUERIES:
+            icontains = base.filter(Q(title__icontains=query) | Q(description__icontains=query))
+            indexed = search_ads(base, query)
+            self.stdout.write(
+                f'{size:>9} ads  {query!r:<18} '
+                f'icontains {self._time(icontains, repeat):8.2f} ms  '
+                f'fts {self._time(indexed, repeat):8.2f} ms'
+            )
+
+    @staticmethod
+    def _time(queryset, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset[:10])
+            best = min(best, time.perf_counter() - started)
+        return best * 1000
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from exchange_app.models import Ad
+from exchange_app.renderers import ORJSONRenderer
+from exchange_app.serializers import AdListSerializer, AdSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает сериализацию списка объявлений: AdSerializer + JSONRenderer и AdListSerializer + orjson'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        # Объекты в памяти: замеряется только сериализация, без БД.
+        ads = [
+            Ad(
+                pk=i, user_id=i % 100, title=f'Товар {i}', description='Описание товара ' * 5,
+                image_url=f'https://example.com/{i}.jpg', category='books', condition='used', created_at=now,
+            )
+            for i in range(1, options['rows'] + 1)
+        ]
+        cases = [
+            ('AdSerializer + JSONRenderer', AdSerializer, JSONRenderer()),
+            ('AdListSerializer + orjson', AdListSerializer, ORJSONRenderer()),
+        ]
+
+        baseline = None
+        for label, serializer_class, renderer in cases:
+            serialize, render = self._best(ads, serializer_class, renderer, options['repeat'])
+            total = serialize + render
+            baseline = baseline or total
+            self.stdout.write(
+                f'{label:30} сериализация {serialize * 1000:8.1f} мс  рендеринг {render * 1000:7.1f} мс  '
+                f'всего {total * 1000:8.1f} мс  (x{baseline / total:.1f})'
+            )
+
+    @staticmethod
+    def _best(ads, serializer_class, renderer, repeat):
+        best = (float('inf'), float('inf'))
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = serializer_class(ads, many=True).data
+            serialized = time.perf_counter()
+            renderer.render(data)
+            rendered = time.perf_counter()
+            best = min(best, (serialized - started, rendered - serialized), key=sum)
+        return best
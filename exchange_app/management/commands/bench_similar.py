@@ -0,0 +1,78 @@
+import json
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from exchange_app.management.commands.bench_http import percentile
+from exchange_app.similar import CATEGORIES, CONDITIONS, SimilarAdsIndex, vectorize
+
+WORDS = (
+    'ноутбук смартфон наушники планшет роман учебник детектив куртка платье кроссовки свитер '
+    'велосипед гитара лампа палатка новый отличный состояние почти идеальный чехол зарядка '
+    'коробка документы размер цвет чёрный белый красный синий зимний летний детский большой'
+).split()
+
+
+class Command(BaseCommand):
+    help = 'Замеряет индекс похожих объявлений на синтетических данных: сборку, запись/mmap и top-k запросы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=1_000_000)
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--k', type=int, default=10)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        started = time.perf_counter()
+        rows = [self._row(rng, ad_id, options['users']) for ad_id in range(1, options['ads'] + 1)]
+        result = {'ads': len(rows), 'vectorize_s': round(time.perf_counter() - started, 1)}
+
+        started = time.perf_counter()
+        index = SimilarAdsIndex.build(rows)
+        result['build_s'] = round(time.perf_counter() - started, 1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            started = time.perf_counter()
+            index.save(directory)
+            result['save_s'] = round(time.perf_counter() - started, 1)
+            started = time.perf_counter()
+            index = SimilarAdsIndex.load(directory)
+            result['load_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+            for _ in range(1000):
+                index.add(self._row(rng, len(rows) + rng.randrange(1_000_000), options['users']))
+
+            latencies = []
+            for _ in range(options['queries']):
+                row = rows[rng.randrange(len(rows))]
+                started = time.perf_counter()
+                index.query(row, options['k'])
+                latencies.append(time.perf_counter() - started)
+
+            # Доля настоящего top-k (полный перебор всех кластеров), найденная через nprobe.
+            hits = 0
+            checks = min(50, options['queries'])
+            for _ in range(checks):
+                row = rows[rng.randrange(len(rows))]
+                exact = {ad_id for ad_id, _ in index.query(row, options['k'], nprobe=len(index.centroids))}
+                hits += len(exact & {ad_id for ad_id, _ in index.query(row, options['k'])})
+
+        result.update({
+            'recall_at_k': round(hits / (checks * options['k']), 3),
+            'clusters': len(index.centroids),
+            'query_p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'query_p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        })
+        self.stdout.write(json.dumps(result))
+
+    @staticmethod
+    def _row(rng, ad_id, users):
+        title = ' '.join(rng.sample(WORDS, 3))
+        description = ' '.join(rng.choices(WORDS, k=12))
+        return (
+            ad_id, rng.randrange(users), vectorize(title, description),
+            rng.randrange(len(CATEGORIES)), rng.randrange(len(CONDITIONS)),
+        )
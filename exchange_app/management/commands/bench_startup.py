@@ -0,0 +1,37 @@
+import json
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exchange_app.startup import cold_start
+
+
+class Command(BaseCommand):
+    help = (
+        'Холодный старт воркера: несколько новых процессов до первого ответа на GET. '
+        'Печатает JSON с медианой и максимумом и падает, если медиана выше бюджета '
+        'или до первого ответа загружены тяжёлые пакеты из LAZY_MODULES'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/')
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--budget-ms', type=float, default=1000, help='Бюджет медианы первого ответа, мс')
+
+    def handle(self, *args, **options):
+        runs = [cold_start(options['path'])[0] for _ in range(options['runs'])]
+        report = {'path': options['path'], 'runs': len(runs), 'budget_ms': options['budget_ms']}
+        for key in ('setup_ms', 'first_request_ms', 'process_ms'):
+            values = [run[key] for run in runs]
+            report[key] = {'median': round(statistics.median(values), 1), 'max': max(values)}
+        report['status'] = runs[-1]['status']
+        report['lazy_modules_loaded'] = runs[-1]['lazy_modules_loaded']
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+
+        problems = []
+        if report['first_request_ms']['median'] > options['budget_ms']:
+            problems.append(f"первый ответ {report['first_request_ms']['median']} мс > {options['budget_ms']} мс")
+        if report['lazy_modules_loaded']:
+            problems.append(f"загружены {', '.join(report['lazy_modules_loaded'])}")
+        if problems:
+            raise CommandError('Бюджет старта превышен: ' + '; '.join(problems))
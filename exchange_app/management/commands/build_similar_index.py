@@ -0,0 +1,23 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from exchange_app.similar import SimilarAdsIndex
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает индекс похожих объявлений и сохраняет его в SIMILAR_INDEX_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.SIMILAR_INDEX_DIR)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        index = SimilarAdsIndex.from_db()
+        built = time.perf_counter()
+        index.save(options['dir'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Объявлений: {len(index)}, кластеров: {len(index.centroids)}; '
+            f'сборка {built - started:.1f} с, запись {time.perf_counter() - built:.1f} с -> {options["dir"]}'
+        ))
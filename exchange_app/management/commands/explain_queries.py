@@ -0,0 +1,68 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from exchange_app.models import ExchangeProposal
+from exchange_app.views import AdListView, ExchangeProposalListView
+
+AD_LIST_CASES = [
+    {},
+    {'category': 'books'},
+    {'condition': 'used'},
+    {'category': 'books', 'condition': 'used'},
+    {'search': 'телефон'},
+]
+
+PROPOSAL_LIST_CASES = [
+    {},
+    {'direction': 'sent'},
+    {'direction': 'received', 'status': 'pending'},
+]
+
+
+class Command(BaseCommand):
+    help = 'Печатает планы выполнения (EXPLAIN) запросов списков объявлений и предложений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Имя пользователя для запросов предложений')
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--sql', action='store_true', help='Печатать также текст запросов')
+
+    def handle(self, *args, **options):
+        self.show_sql = options['sql']
+        factory = RequestFactory()
+        user = self._get_user(options['user'])
+        limit = options['page_size'] + 1
+
+        for params in AD_LIST_CASES:
+            view = self._view(AdListView, factory, params, user)
+            queryset = view.get_queryset().order_by('-created_at', '-id')[:limit]
+            self._print('ad-list', params, queryset)
+
+        for params in PROPOSAL_LIST_CASES:
+            view = self._view(ExchangeProposalListView, factory, params, user)
+            self._print('proposal-list', params, view.get_queryset())
+
+        duplicate_check = ExchangeProposal.objects.filter(ad_sender_id=1, ad_receiver_id=2)
+        self._print('proposal-create', {'duplicate check': True}, duplicate_check)
+
+    @staticmethod
+    def _get_user(username):
+        if username:
+            return User.objects.get(username=username)
+        return User.objects.order_by('pk').first() or User(pk=1)
+
+    @staticmethod
+    def _view(view_class, factory, params, user):
+        request = factory.get('/', params)
+        request.user = user
+        view = view_class()
+        view.setup(request)
+        return view
+
+    def _print(self, name, params, queryset):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{name} {params}'))
+        if self.show_sql:
+            self.stdout.write(str(queryset.query))
+        self.stdout.write(queryset.explain())
+        self.stdout.write('')
@@ -0,0 +1,37 @@
+import json
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from exchange_app.matching import DEFAULT_MAX_LENGTH, MAX_LENGTH, ExchangeGraph
+
+
+class Command(BaseCommand):
+    help = 'Находит все обмены по кругу среди ожидающих предложений и печатает их в NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-length', type=int, default=DEFAULT_MAX_LENGTH)
+        parser.add_argument('--limit', type=int, help='Остановиться после N циклов')
+
+    def handle(self, *args, **options):
+        max_length = options['max_length']
+        if not 2 <= max_length <= MAX_LENGTH:
+            raise CommandError(f'--max-length должен быть от 2 до {MAX_LENGTH}')
+
+        started = time.perf_counter()
+        graph = ExchangeGraph.from_db()
+        built = time.perf_counter()
+
+        lengths = Counter()
+        for cycle in graph.all_cycles(max_length):
+            self.stdout.write(json.dumps(graph.describe(cycle)))
+            lengths[len(cycle)] += 1
+            if options['limit'] and sum(lengths.values()) >= options['limit']:
+                break
+
+        # Итоги — в stderr, чтобы stdout оставался чистым NDJSON.
+        self.stderr.write(
+            f'Предложений: {len(graph)}, циклов: {sum(lengths.values())} '
+            f'{dict(sorted(lengths.items()))}; граф {built - started:.2f} с, поиск {time.perf_counter() - built:.2f} с'
+        )
@@ -0,0 +1,41 @@
+import json
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from exchange_app.importing import CSV, NDJSON, decode_lines, import_ads, parse_rows
+
+
+class Command(BaseCommand):
+    help = 'Импортирует объявления из CSV или NDJSON (путь к файлу или "-" для stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--user', required=True, help='Владелец импортируемых объявлений')
+        parser.add_argument('--format', choices=[CSV, NDJSON], help='По умолчанию определяется по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {options["user"]} не найден')
+
+        path = options['path']
+        fmt = options['format'] or (CSV if path.endswith('.csv') else NDJSON)
+
+        if path == '-':
+            result = self._import(sys.stdin.buffer, fmt, user, options['batch_size'])
+        else:
+            with open(path, 'rb') as stream:
+                result = self._import(stream, fmt, user, options['batch_size'])
+
+        for error in result.errors:
+            self.stderr.write(json.dumps(error, ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(f'Создано: {result.created}, ошибок: {len(result.errors)}'))
+
+    @staticmethod
+    def _import(stream, fmt, user, batch_size):
+        lines = decode_lines(iter(lambda: stream.read(64 * 1024), b''), encoding='utf-8-sig')
+        return import_ads(parse_rows(lines, fmt), user, batch_size=batch_size)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from exchange_app.startup import cold_start, package_totals, parse_importtime
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает новый процесс с -X importtime до первого ответа на GET и печатает '
+        'самые дорогие модули и пакеты по времени импорта'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/', help='Путь первого запроса')
+        parser.add_argument('--top', type=int, default=25)
+
+    def handle(self, *args, **options):
+        result, output = cold_start(options['path'], importtime=True)
+        modules = parse_importtime(output)
+        total = sum(own for _, own, _ in modules)
+
+        self.stdout.write(
+            f"{result['status']}: django.setup {result['setup_ms']} мс, первый ответ {result['first_request_ms']} мс, "
+            f"модулей {len(modules)}, импорт {total / 1000:.1f} мс (с накладными расходами importtime)"
+        )
+        self.stdout.write('\nПакеты (собственное время, мс):')
+        for package, own in package_totals(modules).most_common(options['top']):
+            self.stdout.write(f'{own / 1000:10.1f}  {package}')
+        self.stdout.write('\nМодули (с вложенными импортами, мс):')
+        for name, own, cumulative in sorted(modules, key=lambda module: -module[2])[:options['top']]:
+            self.stdout.write(f'{cumulative / 1000:10.1f} {own / 1000:8.1f}  {name}')
+        if result['lazy_modules_loaded']:
+            self.stdout.write(self.style.WARNING(
+                f"Загружены до первого ответа: {', '.join(result['lazy_modules_loaded'])}"
+            ))
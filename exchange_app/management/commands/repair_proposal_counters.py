@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from exchange_app import counters
+from exchange_app.models import Ad
+from exchange_app.signals import ads_changed
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики предложений на объявлениях по таблице предложений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        fixed = counters.recompute(Ad.objects.all(), options['batch_size'])
+        if fixed:
+            ads_changed(pks=fixed)
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено объявлений: {len(fixed)} за {time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from exchange_app.seeding import SEED_PASSWORD, seed_marketplace
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими пользователями, объявлениями и предложениями (Faker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--ads', type=int, default=10_000)
+        parser.add_argument('--proposals', type=int, default=5000)
+        parser.add_argument('--seed', type=int, help='Для воспроизводимых данных')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--locale', default='ru_RU')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = seed_marketplace(
+            options['users'], options['ads'], options['proposals'],
+            seed=options['seed'], batch_size=options['batch_size'], locale=options['locale'],
+        )
+        elapsed = time.perf_counter() - started
+        counts = result.as_dict()
+        self.stdout.write(self.style.SUCCESS(
+            'Создано: пользователей {users}, объявлений {ads}, предложений {proposals}'.format(**counts)
+            + f' за {elapsed:.1f} с (пароль: {SEED_PASSWORD})'
+        ))
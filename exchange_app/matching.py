@@ -0,0 +1,224 @@
+import threading
+from collections import defaultdict, deque
+
+from django.db import transaction
+
+from .cache import bump_generation, get_generation
+from .models import ExchangeProposal
+
+NAMESPACE = 'proposal-graph'
+DEFAULT_MAX_LENGTH = 4
+MAX_LENGTH = 6
+
+
+class ExchangeGraph:
+    """Граф ожидающих предложений.
+
+    Вершины — объявления, ребро ``ad_sender → ad_receiver`` — предложение:
+    владелец ad_sender готов отдать его за ad_receiver. Простой цикл
+    ``a → b → c → a`` — обмен по кругу, в котором каждый участник отдаёт
+    своё объявление и получает то, которое просил. Цикл длины 2 — встречные
+    предложения.
+    """
+
+    def __init__(self):
+        # networkx загружается с первым графом, а не при старте воркера:
+        # сигналам предложений граф нужен, только если он уже построен.
+        import networkx as nx
+
+        self.graph = nx.DiGraph()
+        self.ads_by_user = defaultdict(set)
+
+    @classmethod
+    def from_rows(cls, rows):
+        graph = cls()
+        for row in rows:
+            graph.add(*row)
+        return graph
+
+    @classmethod
+    def from_db(cls):
+        rows = ExchangeProposal.objects.filter(status='pending').values_list(
+            'pk', 'ad_sender_id', 'ad_receiver_id', 'ad_sender__user_id', 'ad_receiver__user_id',
+        )
+        return cls.from_rows(rows.iterator(chunk_size=10_000))
+
+    def __len__(self):
+        return self.graph.number_of_edges()
+
+    def add(self, proposal, sender, receiver, sender_user, receiver_user):
+        self.graph.add_node(sender, user=sender_user)
+        self.graph.add_node(receiver, user=receiver_user)
+        self.graph.add_edge(sender, receiver, proposal=proposal)
+        self.ads_by_user[sender_user].add(sender)
+        self.ads_by_user[receiver_user].add(receiver)
+
+    def remove(self, sender, receiver):
+        if not self.graph.has_edge(sender, receiver):
+            return
+        self.graph.remove_edge(sender, receiver)
+        for node in (sender, receiver):
+            if self.graph.degree(node) == 0:
+                user = self.graph.nodes[node]['user']
+                self.graph.remove_node(node)
+                self.ads_by_user[user].discard(node)
+                if not self.ads_by_user[user]:
+                    del self.ads_by_user[user]
+
+    def user_ads(self, user):
+        return sorted(self.ads_by_user.get(user, ()))
+
+    def _distances_to(self, target, limit):
+        """Сколько рёбер от каждой вершины до ``target`` (обратный BFS до ``limit``)."""
+        distances = {target: 0}
+        queue = deque([target])
+        while queue:
+            node = queue.popleft()
+            distance = distances[node] + 1
+            if distance > limit:
+                continue
+            for previous in self.graph.predecessors(node):
+                if previous not in distances:
+                    distances[previous] = distance
+                    queue.append(previous)
+        return distances
+
+    def _cycles_from(self, start, max_length, above_start=False):
+        """Циклы длины 2..max_length, начинающиеся в ``start``.
+
+        Поиск в глубину отсекает ветки, из которых нельзя вернуться к старту
+        за оставшееся число шагов, поэтому стоимость зависит от окрестности
+        вершины, а не от размера графа. С ``above_start`` обходятся только
+        вершины больше стартовой: каждый цикл находится ровно один раз, из
+        своей наименьшей вершины.
+        """
+        distances = self._distances_to(start, max_length - 1)
+        path = [start]
+        on_path = {start}
+        stack = [iter(self.graph.successors(start))]
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                on_path.discard(path.pop())
+                continue
+            if node == start:
+                if len(path) >= 2:
+                    yield list(path)
+                continue
+            if node in on_path or (above_start and node < start):
+                continue
+            if len(path) + distances.get(node, max_length) > max_length:
+                continue
+            path.append(node)
+            on_path.add(node)
+            stack.append(iter(self.graph.successors(node)))
+
+    def cycles_through(self, starts, max_length=DEFAULT_MAX_LENGTH, limit=None):
+        """Циклы через любую из вершин ``starts`` (например, объявления пользователя)."""
+        found = {}
+        for start in starts:
+            if start not in self.graph:
+                continue
+            for cycle in self._cycles_from(start, max_length):
+                found.setdefault(_canonical(cycle), None)
+                if limit is not None and len(found) >= limit:
+                    return list(found)
+        return list(found)
+
+    def all_cycles(self, max_length=DEFAULT_MAX_LENGTH):
+        # nx.simple_cycles(length_bound=...) на сотнях тысяч рёбер работает
+        # минутами; перебор от наименьшей вершины с отсечением — секунды.
+        for start in sorted(self.graph):
+            for cycle in self._cycles_from(start, max_length, above_start=True):
+                yield tuple(cycle)
+
+    def describe(self, cycle):
+        steps = []
+        for index, sender in enumerate(cycle):
+            receiver = cycle[(index + 1) % len(cycle)]
+            steps.append({
+                'proposal': self.graph.edges[sender, receiver]['proposal'],
+                'user': self.graph.nodes[sender]['user'],
+                'ad_sender': sender,
+                'ad_receiver': receiver,
+            })
+        return {'length': len(cycle), 'steps': steps}
+
+
+def _canonical(cycle):
+    # Один и тот же цикл находится из каждой его вершины; начинаем с меньшей.
+    index = cycle.index(min(cycle))
+    return tuple(cycle[index:] + cycle[:index])
+
+
+# Граф живёт в памяти процесса и обновляется по сигналам. Номер поколения в
+# общем кэше показывает, не менялись ли предложения в других процессах:
+# если после нашего инкремента номер «перескочил», граф перестраивается.
+_lock = threading.RLock()
+_graph = None
+_generation = None
+
+
+def get_graph():
+    global _graph, _generation
+    with _lock:
+        generation = get_generation(NAMESPACE)
+        if _graph is None or generation != _generation:
+            _graph = ExchangeGraph.from_db()
+            _generation = generation
+        return _graph
+
+
+def reset():
+    global _graph, _generation
+    with _lock:
+        _graph = _generation = None
+
+
+def _apply(added, removed):
+    global _generation
+    with _lock:
+        generation = bump_generation(NAMESPACE)
+        if _graph is None or _generation is None or generation != _generation + 1:
+            return
+        for sender, receiver in removed:
+            _graph.remove(sender, receiver)
+        for row in added:
+            _graph.add(*row)
+        _generation = generation
+
+
+def proposals_changed(added=(), removed=()):
+    """Обновляет граф после коммита.
+
+    ``added`` — строки (id, ad_sender, ad_receiver, владелец ad_sender,
+    владелец ad_receiver) новых ожидающих предложений, ``removed`` — пары
+    (ad_sender, ad_receiver) предложений, которые перестали ожидать ответа.
+    """
+    added, removed = list(added), list(removed)
+    transaction.on_commit(lambda: _apply(added, removed))
+
+
+def _invalidate():
+    bump_generation(NAMESPACE)
+    reset()
+
+
+def invalidate():
+    """Для массовых изменений мимо сигналов: граф перестроится при следующем чтении."""
+    transaction.on_commit(_invalidate)
+
+
+def proposal_row(proposal):
+    return (
+        proposal.pk, proposal.ad_sender_id, proposal.ad_receiver_id,
+        proposal.ad_sender.user_id, proposal.ad_receiver.user_id,
+    )
+
+
+def cycles_for_user(user, max_length=DEFAULT_MAX_LENGTH, limit=None):
+    graph = get_graph()
+    with _lock:
+        cycles = graph.cycles_through(graph.user_ads(user.pk), max_length, limit)
+        return [graph.describe(cycle) for cycle in cycles]
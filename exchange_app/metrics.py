@@ -0,0 +1,160 @@
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+
+# При нескольких процессах (uvicorn --workers) задайте PROMETHEUS_MULTIPROC_DIR
+# до запуска: значения пишутся в файлы и собираются в /metrics из всех воркеров.
+
+REQUEST_LATENCY = Histogram(
+    'exchange_http_request_duration_seconds',
+    'Время обработки запроса',
+    ['view', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_DB_QUERIES = Histogram(
+    'exchange_http_request_db_queries',
+    'Число SQL-запросов на HTTP-запрос',
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+REQUEST_DB_TIME = Histogram(
+    'exchange_http_request_db_seconds',
+    'Суммарное время SQL-запросов на HTTP-запрос',
+    ['view'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+RESPONSE_SIZE = Histogram(
+    'exchange_http_response_size_bytes',
+    'Размер тела ответа',
+    ['view'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+CACHE_REQUESTS = Counter(
+    'exchange_cache_requests',
+    'Обращения к кэшу приложения',
+    ['view', 'namespace', 'result'],
+)
+
+
+class RequestStats:
+    __slots__ = ('request', 'queries', 'db_time')
+
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.db_time = 0.0
+
+
+# Контекстная переменная доходит и до потоков sync_to_async, поэтому
+# запросы асинхронного ORM тоже учитываются.
+_current = ContextVar('exchange_request_stats', default=None)
+
+
+def _count_queries(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def install_query_counter(connection):
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_queries)
+
+
+@receiver(connection_created)
+def _connection_created(sender, connection, **kwargs):
+    install_query_counter(connection)
+
+
+def record_cache(namespace, hit):
+    stats = _current.get()
+    view = _view_name(stats.request) if stats is not None else '<none>'
+    CACHE_REQUESTS.labels(view, namespace, 'hit' if hit else 'miss').inc()
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match._func_path
+
+
+class MetricsMiddleware:
+    """Пишет в Prometheus задержку, число и время SQL-запросов и размер ответа
+    для каждого URL name (ad-list, api-ads-list, ...)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            stats = self._stop(token)
+        self._observe(request, response, started, stats)
+        return response
+
+    async def __acall__(self, request):
+        started, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            stats = self._stop(token)
+        self._observe(request, response, started, stats)
+        return response
+
+    @staticmethod
+    def _start(request):
+        return time.perf_counter(), _current.set(RequestStats(request))
+
+    @staticmethod
+    def _stop(token):
+        stats = _current.get()
+        _current.reset(token)
+        return stats
+
+    @staticmethod
+    def _observe(request, response, started, stats):
+        view = _view_name(request)
+        REQUEST_LATENCY.labels(view, request.method).observe(time.perf_counter() - started)
+        REQUEST_DB_QUERIES.labels(view).observe(stats.queries)
+        REQUEST_DB_TIME.labels(view).observe(stats.db_time)
+        if not response.streaming:
+            RESPONSE_SIZE.labels(view).observe(len(response.content))
+
+
+def metrics_view(request):
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from exchange_app.search import create_search_index, drop_search_index
+
+
+def forwards(apps, schema_editor):
+    create_search_index(schema_editor, apps.get_model('exchange_app', 'Ad'))
+
+
+def backwards(apps, schema_editor):
+    drop_search_index(schema_editor, apps.get_model('exchange_app', 'Ad'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
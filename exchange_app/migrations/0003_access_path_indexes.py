@@ -0,0 +1,56 @@
+# Generated by Django 5.1.6 on 2026-10-17 23:55
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def drop_duplicate_proposals(apps, schema_editor):
+    ExchangeProposal = apps.get_model('exchange_app', 'ExchangeProposal')
+    keep = (
+        ExchangeProposal.objects
+        .values('ad_sender', 'ad_receiver')
+        .annotate(first_id=Min('id'))
+        .values('first_id')
+    )
+    ExchangeProposal.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange_app', '0002_ad_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['created_at', 'id'], name='ad_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['category', 'created_at', 'id'], name='ad_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['condition', 'created_at', 'id'], name='ad_condition_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='ad_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['ad_sender', 'status', 'created_at'], name='proposal_sender_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeproposal',
+            index=models.Index(fields=['ad_receiver', 'status', 'created_at'], name='proposal_receiver_status_idx'),
+        ),
+        migrations.RunPython(drop_duplicate_proposals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='exchangeproposal',
+            constraint=models.UniqueConstraint(fields=('ad_sender', 'ad_receiver'), name='unique_proposal_pair', violation_error_message='Предложение уже существует'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-18 00:57
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def drop_self_proposals(apps, schema_editor):
+    ExchangeProposal = apps.get_model('exchange_app', 'ExchangeProposal')
+    ExchangeProposal.objects.filter(ad_sender=F('ad_receiver')).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange_app', '0003_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_self_proposals, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='exchangeproposal',
+            constraint=models.CheckConstraint(condition=models.Q(('ad_sender', models.F('ad_receiver')), _negated=True), name='proposal_sender_not_receiver', violation_error_message='Нельзя создавать предложение на обмен с самим собой'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.6 on 2026-10-18 01:30
+
+from django.db import migrations, models
+from django.db.models import F
+
+from exchange_app.search import create_search_index, drop_search_index
+
+
+def drop_sqlite_search_index(apps, schema_editor):
+    # SQLite добавляет NOT NULL-столбец через пересоздание таблицы, а вместе
+    # со старой таблицей пропадают триггеры полнотекстового индекса.
+    if schema_editor.connection.vendor == 'sqlite':
+        drop_search_index(schema_editor, apps.get_model('exchange_app', 'Ad'))
+
+
+def create_sqlite_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        create_search_index(schema_editor, apps.get_model('exchange_app', 'Ad'))
+
+
+def updated_from_created(apps, schema_editor):
+    for name in ('Ad', 'ExchangeProposal'):
+        apps.get_model('exchange_app', name).objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange_app', '0004_proposal_sender_not_receiver'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_sqlite_search_index, create_sqlite_search_index),
+        migrations.AddField(
+            model_name='ad',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='exchangeproposal',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(updated_from_created, migrations.RunPython.noop),
+        migrations.RunPython(create_sqlite_search_index, drop_sqlite_search_index),
+    ]
@@ -0,0 +1,80 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from exchange_app.search import create_search_index, drop_search_index
+
+
+def drop_sqlite_search_index(apps, schema_editor):
+    # Как в 0005: SQLite пересоздаёт таблицу и теряет триггеры индекса.
+    if schema_editor.connection.vendor == 'sqlite':
+        drop_search_index(schema_editor, apps.get_model('exchange_app', 'Ad'))
+
+
+def create_sqlite_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        create_search_index(schema_editor, apps.get_model('exchange_app', 'Ad'))
+
+
+BATCH_SIZE = 1000
+
+
+def fill_counters(apps, schema_editor):
+    # Копия пересчёта из counters.py на исторических моделях: миграция не
+    # должна меняться вместе с кодом приложения.
+    Ad = apps.get_model('exchange_app', 'Ad')
+    ExchangeProposal = apps.get_model('exchange_app', 'ExchangeProposal')
+
+    def count(field, **filters):
+        counted = (
+            ExchangeProposal.objects.filter(**{field: OuterRef('pk')}, **filters)
+            .order_by().values(field).annotate(total=Count('pk')).values('total')
+        )
+        return Coalesce(Subquery(counted), Value(0))
+
+    expressions = {
+        'received_pending_count': count('ad_receiver', status='pending'),
+        'received_accepted_count': count('ad_receiver', status='accepted'),
+        'received_rejected_count': count('ad_receiver', status='rejected'),
+        'sent_count': count('ad_sender'),
+    }
+    last = 0
+    while True:
+        batch = list(Ad.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:BATCH_SIZE])
+        if not batch:
+            return
+        last = batch[-1]
+        Ad.objects.filter(pk__in=batch).update(**expressions)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exchange_app', '0005_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_sqlite_search_index, create_sqlite_search_index),
+        migrations.AddField(
+            model_name='ad',
+            name='received_pending_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='received_accepted_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='received_rejected_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='ad',
+            name='sent_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+        migrations.RunPython(create_sqlite_search_index, drop_sqlite_search_index),
+    ]
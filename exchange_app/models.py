@@ -1,6 +1,6 @@
 from django.db import models
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 
@@ -25,10 +25,59 @@ class Ad(models.Model):
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
     condition = models.CharField(max_length=50, choices=CONDITION_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Денормализованные счётчики предложений: меняются только UPDATE с F()
+    # в транзакции самого предложения (exchange_app/counters.py).
+    received_pending_count = models.PositiveIntegerField(default=0, editable=False)
+    received_accepted_count = models.PositiveIntegerField(default=0, editable=False)
+    received_rejected_count = models.PositiveIntegerField(default=0, editable=False)
+    sent_count = models.PositiveIntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('received_pending_count', 'received_accepted_count', 'received_rejected_count', 'sent_count')
+
+    class Meta:
+        indexes = [
+            # Лента объявлений и курсорная пагинация по (created_at, id)
+            models.Index(fields=['created_at', 'id'], name='ad_created_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='ad_category_created_idx'),
+            models.Index(fields=['condition', 'created_at', 'id'], name='ad_condition_created_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='ad_user_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Категория на момент загрузки: при её смене нужно сбросить кэш обеих.
+        instance._loaded_category = instance.__dict__.get('category')
+        return instance
 
     def __str__(self):
         return f"{self.title} ({self.get_category_display()})"
 
+    def save(self, *args, **kwargs):
+        # Загруженное раньше объявление не должно затирать счётчики, которые
+        # успели измениться с тех пор.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        # Сигналы уже сбросили кэш старой категории; следующая смена уходит из текущей.
+        self._loaded_category = self.category
+
+class ExchangeProposalQuerySet(models.QuerySet):
+    def for_user(self, user, direction=None):
+        # Подзапрос по объявлениям пользователя вместо JOIN, чтобы фильтр
+        # по отправителю/получателю шёл по индексам proposal_*_status_idx.
+        user_ads = Ad.objects.filter(user=user).values('pk')
+        if direction == 'sent':
+            return self.filter(ad_sender__in=user_ads)
+        if direction == 'received':
+            return self.filter(ad_receiver__in=user_ads)
+        return self.filter(models.Q(ad_sender__in=user_ads) | models.Q(ad_receiver__in=user_ads))
+
+
 class ExchangeProposal(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Ожидает'),
@@ -53,17 +102,103 @@ class ExchangeProposal(models.Model):
         default='pending'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ExchangeProposalQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['ad_sender', 'ad_receiver'],
+                name='unique_proposal_pair',
+                violation_error_message='Предложение уже существует',
+            ),
+            models.CheckConstraint(
+                condition=~models.Q(ad_sender=models.F('ad_receiver')),
+                name='proposal_sender_not_receiver',
+                violation_error_message='Нельзя создавать предложение на обмен с самим собой',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['ad_sender', 'status', 'created_at'], name='proposal_sender_status_idx'),
+            models.Index(fields=['ad_receiver', 'status', 'created_at'], name='proposal_receiver_status_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Статус на момент загрузки: уведомления шлются только при его смене.
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
 
     def __str__(self):
         return f"Предложение {self.id}: {self.ad_sender} -> {self.ad_receiver}"
 
+    def owner_ids(self):
+        """Владельцы ad_sender и ad_receiver: без запросов, если объявления уже загружены, иначе один запрос."""
+        sender_field, receiver_field = self._meta.get_field('ad_sender'), self._meta.get_field('ad_receiver')
+        if sender_field.is_cached(self) and receiver_field.is_cached(self):
+            return self.ad_sender.user_id, self.ad_receiver.user_id
+        owners = dict(
+            Ad.objects.filter(pk__in=(self.ad_sender_id, self.ad_receiver_id)).values_list('pk', 'user_id')
+        )
+        return owners.get(self.ad_sender_id), owners.get(self.ad_receiver_id)
+
     def clean(self):
-        if self.ad_sender == self.ad_receiver:
+        if self.ad_sender_id == self.ad_receiver_id:
             raise ValidationError("Нельзя создавать предложение на обмен с самим собой")
-        
-        if self.ad_sender.user == self.ad_receiver.user:
+
+        sender_user, receiver_user = self.owner_ids()
+        if sender_user == receiver_user:
             raise ValidationError("Нельзя создавать предложение между своими объявлениями")
 
+    def constraint_error(self, error):
+        """ValidationError для IntegrityError от ограничения из Meta.constraints или None."""
+        message = str(error)
+        for constraint in self._meta.constraints:
+            columns = [self._meta.get_field(name).column for name in getattr(constraint, 'fields', ())]
+            # PostgreSQL называет ограничение, SQLite для уникальности — только столбцы.
+            if constraint.name in message or (
+                columns and 'UNIQUE' in message.upper() and all(column in message for column in columns)
+            ):
+                return ValidationError(
+                    constraint.get_violation_error_message(), code=constraint.violation_error_code,
+                )
+        return None
+
     def save(self, *args, **kwargs):
-        self.full_clean()
-        super().save(*args, **kwargs)
+        # Уникальность пары и ad_sender ≠ ad_receiver проверяет база при записи:
+        # SELECT перед INSERT не спасает от двух одновременных запросов, а
+        # внешние ключи и так проверяются ограничениями.
+        self.clean_fields(exclude=['ad_sender', 'ad_receiver'])
+        self.clean()
+        update_fields = kwargs.get('update_fields')
+        try:
+            with transaction.atomic():
+                if not self._state.adding and (update_fields is None or 'status' in update_fields):
+                    # Статус из заблокированной строки, а не с момента загрузки:
+                    # счётчики и уведомления считают переход от того, что в базе.
+                    self._loaded_status = (
+                        ExchangeProposal.objects.select_for_update()
+                        .filter(pk=self.pk).values_list('status', flat=True).first()
+                    )
+                super().save(*args, **kwargs)
+        except IntegrityError as error:
+            validation_error = self.constraint_error(error)
+            if validation_error is None:
+                raise
+            raise validation_error from error
+        self._loaded_status = self.status
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            # Как в save(): счётчики уменьшаются по статусу из базы, а уже
+            # удалённое параллельным запросом предложение не вычитается дважды.
+            status = (
+                ExchangeProposal.objects.select_for_update()
+                .filter(pk=self.pk).values_list('status', flat=True).first()
+            )
+            if status is None:
+                return 0, {}
+            self.status = status
+            return super().delete(*args, **kwargs)
@@ -0,0 +1,226 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from django.http import Http404
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Постраничный вывод по ключу (created_at, id) вместо OFFSET.
+
+    Каждая страница — это один запрос ``WHERE (created_at, id) < курсор
+    ORDER BY created_at DESC, id DESC LIMIT n + 1`` без COUNT(*), поэтому
+    страница N стоит столько же, сколько первая.
+
+    Сортировка queryset перед created_at (например, ``-search_rank`` у
+    поиска, см. search.py) сохраняется и становится началом ключа: курсор
+    хранит её значения в ``k`` и сравнивается с ними так же.
+    """
+
+    field = 'created_at'
+
+    def __init__(self, queryset, page_size):
+        self.queryset = queryset
+        self.page_size = page_size
+        self.prefix = self._prefix(queryset.query.order_by)
+
+    def _prefix(self, ordering):
+        prefix = []
+        for key in ordering:
+            if key.lstrip('-') in (self.field, 'pk', 'id'):
+                break
+            prefix.append(key)
+        return prefix
+
+    def encode_cursor(self, obj, reverse=False):
+        position = {'v': getattr(obj, self.field).isoformat(), 'id': obj.pk}
+        if self.prefix:
+            position['k'] = [getattr(obj, key.lstrip('-')) for key in self.prefix]
+        if reverse:
+            position['r'] = 1
+        raw = json.dumps(position, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            position = json.loads(raw)
+            prefix = list(position.get('k', ()))
+            if len(prefix) != len(self.prefix):
+                raise ValueError(cursor)
+            values = [*prefix, datetime.fromisoformat(position['v']), int(position['id'])]
+            return values, bool(position.get('r'))
+        except (ValueError, TypeError, KeyError):
+            raise InvalidCursor(cursor)
+
+    @staticmethod
+    def _after(keys, values):
+        # (k1, k2, …) за курсором в порядке keys: k1 дальше, либо k1 равен и
+        # k2 дальше, и т. д. — без OFFSET и на любой базе.
+        condition, equal = Q(), {}
+        for key, value in zip(keys, values):
+            name = key.lstrip('-')
+            lookup = 'lt' if key.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _window(self, cursor):
+        keys = [*self.prefix, f'-{self.field}', '-pk']
+        queryset = self.queryset
+        reverse = False
+
+        if cursor:
+            values, reverse = self.decode_cursor(cursor)
+            if reverse:
+                keys = [key[1:] if key.startswith('-') else f'-{key}' for key in keys]
+            queryset = queryset.filter(self._after(keys, values))
+
+        queryset = queryset.order_by(*keys)
+        return queryset[:self.page_size + 1], lambda rows: self._build_page(rows, cursor, reverse)
+
+    def _build_page(self, rows, cursor, reverse):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(cursor)
+
+        if not rows:
+            return CursorPage(rows)
+
+        return CursorPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]) if has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], reverse=True) if has_previous else None,
+        )
+
+    def page(self, cursor=None):
+        queryset, build_page = self._window(cursor)
+        return build_page(list(queryset))
+
+    async def apage(self, cursor=None):
+        queryset, build_page = self._window(cursor)
+        return build_page([obj async for obj in queryset])
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(queryset, self.get_page_size(request))
+        try:
+            self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound('Неверный курсор')
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.page.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+def page_url(request, cursor, param='cursor'):
+    query = request.GET.copy()
+    query[param] = cursor
+    return f'?{query.urlencode()}'
+
+
+def pagination_context(request, page, param='cursor'):
+    context = {'page_obj': page, 'is_paginated': page.has_other_pages()}
+    if page.has_next():
+        context['next_page_url'] = page_url(request, page.next_cursor, param)
+    if page.has_previous():
+        context['previous_page_url'] = page_url(request, page.previous_cursor, param)
+    return context
+
+
+class KeysetPaginationMixin:
+    """Подменяет offset-пагинацию ListView на KeysetPaginator."""
+
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        try:
+            page = KeysetPaginator(queryset, page_size).page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404('Неверный курсор')
+        return None, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get('page_obj')
+        if page is not None:
+            context.update(pagination_context(self.request, page, self.cursor_kwarg))
+        return context
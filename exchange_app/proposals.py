@@ -0,0 +1,106 @@
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Now
+
+from . import counters, events, matching
+from .models import ExchangeProposal
+from .signals import counters_changed
+
+ACCEPTED = 'accepted'
+REJECTED = 'rejected'
+PENDING = 'pending'
+
+# id, объявления и их владельцы: владельцы нужны для уведомлений, категория
+# получателя — для сброса кэша после изменения его счётчиков.
+ROW_FIELDS = (
+    'pk', 'ad_sender_id', 'ad_receiver_id', 'ad_sender__user_id', 'ad_receiver__user_id', 'ad_receiver__category',
+)
+
+
+class DecisionResult:
+    def __init__(self):
+        self.accepted = []
+        self.rejected = []
+        self.auto_rejected = []
+        self.skipped = []
+
+    def as_dict(self):
+        return {
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'auto_rejected': self.auto_rejected,
+            'skipped': self.skipped,
+        }
+
+
+def decide_proposals(user, accept=(), reject=()):
+    """Принимает и отклоняет предложения, адресованные объявлениям ``user``.
+
+    Все изменения — один UPDATE с CASE в одной транзакции, без save() и
+    full_clean() на каждую строку. Принятие предложения отклоняет остальные
+    ожидающие предложения с участием обоих его объявлений (они уже обменены).
+    Если два принимаемых предложения делят объявление, принимается первое
+    по порядку в ``accept``. Каждый id попадает ровно в один список:
+    конфликтующее принимаемое предложение (как и чужое, но задевающее
+    обменянные объявления) отклоняется вместе с остальными и числится в
+    ``auto_rejected``; в ``skipped`` — только те, что остались без изменений.
+    """
+    result = DecisionResult()
+    accept = list(dict.fromkeys(accept))
+    reject = [pk for pk in dict.fromkeys(reject) if pk not in accept]
+
+    with transaction.atomic():
+        candidates = {
+            row[0]: row[1:]
+            for row in ExchangeProposal.objects
+            .select_for_update(of=('self',))
+            .filter(pk__in=accept + reject, ad_receiver__user=user, status=PENDING)
+            .values_list(*ROW_FIELDS)
+        }
+
+        exchanged = set()
+        for pk in accept:
+            ads = candidates.get(pk, ())[:2]
+            if not ads or exchanged & set(ads):
+                result.skipped.append(pk)
+                continue
+            exchanged.update(ads)
+            result.accepted.append(pk)
+
+        for pk in reject:
+            (result.rejected if pk in candidates else result.skipped).append(pk)
+
+        conflicts = {}
+        if exchanged:
+            conflicts = {
+                row[0]: row[1:]
+                for row in ExchangeProposal.objects
+                .select_for_update(of=('self',))
+                .filter(Q(ad_sender__in=exchanged) | Q(ad_receiver__in=exchanged), status=PENDING)
+                .exclude(pk__in=result.accepted + result.rejected)
+                .values_list(*ROW_FIELDS)
+            }
+            result.auto_rejected = sorted(conflicts)
+            result.skipped = [pk for pk in result.skipped if pk not in conflicts]
+
+        changed = result.accepted + result.rejected + result.auto_rejected
+        if changed:
+            ExchangeProposal.objects.filter(pk__in=changed).update(
+                status=Case(When(pk__in=result.accepted, then=Value(ACCEPTED)), default=Value(REJECTED)),
+                updated_at=Now(),
+            )
+            # UPDATE не отправляет post_save: граф обменов, счётчики и уведомления — сами.
+            rows = [candidates.get(pk) or conflicts[pk] for pk in changed]
+            matching.proposals_changed(removed=[row[:2] for row in rows])
+            accepted = set(result.accepted)
+            deltas = counters.Deltas()
+            for pk, (sender, receiver, sender_user, receiver_user, _) in zip(changed, rows):
+                status = ACCEPTED if pk in accepted else REJECTED
+                deltas.status_changed(receiver, PENDING, status)
+                events.publish(
+                    [sender_user, receiver_user],
+                    events.proposal_event('proposal.status', pk, status, sender, receiver),
+                )
+            counters_changed(deltas, {row[4] for row in rows})
+
+    return result
@@ -0,0 +1,49 @@
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# orjson сериализует dict, list, str и числа на C; всё остальное (Decimal,
+# ленивые строки перевода, UUID) отдаётся стандартному кодировщику DRF.
+_fallback = JSONEncoder().default
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        option = orjson.OPT_NON_STR_KEYS
+        if self._indent(accepted_media_type):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_fallback, option=option)
+
+    @staticmethod
+    def _indent(accepted_media_type):
+        # Как у JSONRenderer: ``Accept: application/json; indent=4`` включает отступы.
+        for param in (accepted_media_type or '').split(';')[1:]:
+            key, _, value = param.partition('=')
+            if key.strip() == 'indent' and value.strip().isdigit():
+                return int(value) > 0
+        return False
+
+
+class ORJSONParser(BaseParser):
+    media_type = 'application/json'
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return {}
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+def json_bytes(data):
+    return ORJSONRenderer().render(data)
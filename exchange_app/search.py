@@ -0,0 +1,113 @@
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+# Полнотекстовый индекс объявлений.
+# SQLite: внешняя FTS5-таблица над exchange_app_ad, синхронизируется триггерами.
+# PostgreSQL: GIN-индекс по выражению to_tsvector(title || description).
+FTS_TABLE = 'exchange_app_ad_fts'
+SEARCH_CONFIG = 'russian'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def search_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    return SearchVector('title', 'description', config=SEARCH_CONFIG)
+
+
+def _fts5_query(tokens):
+    # Последнее слово ищем по префиксу: поиск запускается на каждое нажатие клавиши.
+    quoted = ['"%s"' % token for token in tokens]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _tsquery(tokens):
+    return ' & '.join('%s:*' % token for token in tokens)
+
+
+def search_ads(queryset, text):
+    """Фильтрует объявления по поисковой строке и сортирует по релевантности.
+
+    Каждой записи добавляется поле ``search_rank`` (чем больше, тем релевантнее).
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return queryset
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        table = queryset.model._meta.db_table
+        # Ранг — аннотация, а не extra(select=...): по ней фильтрует курсор
+        # пагинации (pagination.KeysetPaginator).
+        queryset = queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE} MATCH %s', f'{FTS_TABLE}.rowid = {table}.id'],
+            params=[_fts5_query(tokens)],
+        ).annotate(search_rank=RawSQL(f'-{FTS_TABLE}.rank', (), output_field=FloatField()))
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        query = SearchQuery(_tsquery(tokens), config=SEARCH_CONFIG, search_type='raw')
+        # Выражение совпадает с выражением индекса ad_search_gin, поэтому фильтр идёт по GIN.
+        queryset = queryset.alias(search_match=search_vector()).filter(search_match=query).annotate(
+            search_rank=SearchRank(search_vector(), query),
+        )
+    else:
+        condition = Q()
+        for token in tokens:
+            condition &= Q(title__icontains=token) | Q(description__icontains=token)
+        return queryset.filter(condition)
+
+    return queryset.order_by('-search_rank', '-created_at')
+
+
+def create_search_index(schema_editor, model):
+    vendor = schema_editor.connection.vendor
+    table = model._meta.db_table
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"title, description, content='{table}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, title, description) "
+            f"VALUES (new.id, new.title, new.description); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+            f"VALUES ('delete', old.id, old.title, old.description); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF title, description ON {table} BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+            f"VALUES ('delete', old.id, old.title, old.description); "
+            f"INSERT INTO {FTS_TABLE}(rowid, title, description) "
+            f"VALUES (new.id, new.title, new.description); END"
+        )
+        schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+
+        schema_editor.add_index(model, GinIndex(search_vector(), name='ad_search_gin'))
+
+
+def drop_search_index(schema_editor, model):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS ad_search_gin')
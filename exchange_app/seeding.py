@@ -0,0 +1,133 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from faker import Faker
+
+from . import counters, matching
+from .models import Ad, ExchangeProposal
+from .signals import ads_changed, similar_ads_changed
+
+SEED_PASSWORD = 'marketplace'
+
+# Доли примерно как на живой площадке: б/у вещей и одежды больше всего,
+# большинство предложений ещё ждут ответа.
+CATEGORY_WEIGHTS = {'electronics': 30, 'books': 20, 'clothing': 35, 'other': 15}
+CONDITION_WEIGHTS = {'new': 25, 'used': 65, 'broken': 10}
+STATUS_WEIGHTS = {'pending': 60, 'accepted': 15, 'rejected': 25}
+
+ITEMS = {
+    'electronics': ['Смартфон', 'Ноутбук', 'Наушники', 'Планшет', 'Фотоаппарат', 'Колонка', 'Монитор'],
+    'books': ['Роман', 'Учебник', 'Сборник рассказов', 'Детектив', 'Словарь', 'Энциклопедия'],
+    'clothing': ['Куртка', 'Платье', 'Кроссовки', 'Свитер', 'Джинсы', 'Пальто', 'Шарф'],
+    'other': ['Велосипед', 'Настольная игра', 'Лампа', 'Палатка', 'Гитара', 'Кофемашина'],
+}
+
+
+class SeedResult:
+    def __init__(self):
+        self.users = 0
+        self.ads = 0
+        self.proposals = 0
+
+    def as_dict(self):
+        return {'users': self.users, 'ads': self.ads, 'proposals': self.proposals}
+
+
+def _weighted(rng, weights, count):
+    return rng.choices(list(weights), weights=list(weights.values()), k=count)
+
+
+def _batches(objects, batch_size):
+    for start in range(0, len(objects), batch_size):
+        yield objects[start:start + batch_size]
+
+
+def _bulk_create(model, objects, batch_size):
+    created = []
+    for batch in _batches(objects, batch_size):
+        with transaction.atomic():
+            created.extend(model.objects.bulk_create(batch))
+    return created
+
+
+def _users(fake, count):
+    # Хэш пароля считается один раз: PBKDF2 на каждого пользователя занял бы
+    # больше времени, чем вся остальная генерация.
+    password = make_password(SEED_PASSWORD)
+    offset = User.objects.count()
+    return [
+        User(username=f'{fake.user_name()}_{offset + i}', email=fake.email(), password=password)
+        for i in range(count)
+    ]
+
+
+def _ads(fake, rng, users, count):
+    categories = _weighted(rng, CATEGORY_WEIGHTS, count)
+    conditions = _weighted(rng, CONDITION_WEIGHTS, count)
+    return [
+        Ad(
+            user=rng.choice(users),
+            title=f'{rng.choice(ITEMS[category])} {fake.word()}',
+            description=fake.paragraph(nb_sentences=3),
+            image_url=fake.image_url(),
+            category=category,
+            condition=condition,
+        )
+        for category, condition in zip(categories, conditions)
+    ]
+
+
+def _proposals(fake, rng, ads, count):
+    """Случайные пары объявлений разных владельцев без повторов."""
+    pairs = set()
+    attempts = count * 10
+    while len(pairs) < count and attempts:
+        attempts -= 1
+        sender, receiver = rng.sample(ads, 2)
+        if sender.user_id != receiver.user_id:
+            pairs.add((sender, receiver))
+
+    statuses = _weighted(rng, STATUS_WEIGHTS, len(pairs))
+    return [
+        ExchangeProposal(
+            ad_sender=sender,
+            ad_receiver=receiver,
+            comment=fake.sentence() if rng.random() < 0.5 else '',
+            status=status,
+        )
+        for (sender, receiver), status in zip(pairs, statuses)
+    ]
+
+
+def seed_marketplace(users, ads, proposals, seed=None, batch_size=1000, locale='ru_RU'):
+    """Заполняет базу пользователями, объявлениями и предложениями пачками через bulk_create.
+
+    Все пользователи получают пароль ``SEED_PASSWORD``. Предложений может
+    получиться меньше запрошенного, если уникальных пар разных владельцев
+    не хватает.
+    """
+    fake = Faker(locale)
+    fake.seed_instance(seed)
+    rng = random.Random(seed)
+    result = SeedResult()
+
+    created_users = _bulk_create(User, _users(fake, users), batch_size)
+    result.users = len(created_users)
+    if not created_users:
+        return result
+
+    created_ads = _bulk_create(Ad, _ads(fake, rng, created_users, ads), batch_size)
+    result.ads = len(created_ads)
+    if len(created_ads) < 2:
+        return result
+
+    result.proposals = len(_bulk_create(ExchangeProposal, _proposals(fake, rng, created_ads, proposals), batch_size))
+
+    # bulk_create не отправляет post_save, поэтому счётчики и кэши — сами.
+    counters.recompute(Ad.objects.filter(pk__gte=created_ads[0].pk, pk__lte=created_ads[-1].pk), batch_size)
+    ads_changed({ad.category for ad in created_ads})
+    matching.invalidate()
+    similar_ads_changed(ad.pk for ad in created_ads)
+    return result
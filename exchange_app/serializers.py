@@ -1,27 +1,169 @@
 
+from operator import attrgetter
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import timezone
+from django.utils.functional import cached_property
 from rest_framework import serializers
 
 from .models import Ad, ExchangeProposal
 
-class AdSerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
+    """``fields`` оставляет только перечисленные поля, ``expand`` заменяет
+    первичные ключи из ``expandable_fields`` вложенными объектами."""
+
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in expand:
+            if name in self.fields:
+                self.fields[name] = self.expandable_fields[name](read_only=True)
+
+
+class AdSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Ad
         fields = '__all__'
         read_only_fields = ['user', 'created_at']
 
-class ExchangeProposalSerializer(serializers.ModelSerializer):
+class AdAutocompleteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Ad
+        fields = ['id', 'title', 'category', 'condition']
+        read_only_fields = fields
+
+class ExchangeProposalSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {'ad_sender': AdSerializer, 'ad_receiver': AdSerializer}
+
     class Meta:
         model = ExchangeProposal
         fields = '__all__'
-        read_only_fields = ['ad_sender', 'status', 'created_at']
+        read_only_fields = ['status', 'created_at']
+        # Уникальность пары проверяет ограничение БД при сохранении, без
+        # отдельного SELECT, который не защищает от одновременных запросов.
+        validators = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            return
+        querysets = {
+            'ad_sender': Ad.objects.filter(user=request.user),
+            'ad_receiver': Ad.objects.exclude(user=request.user),
+        }
+        for name, queryset in querysets.items():
+            field = self.fields.get(name)
+            if isinstance(field, serializers.RelatedField) and not field.read_only:
+                field.queryset = queryset
+
+    def get_extra_kwargs(self):
+        extra_kwargs = super().get_extra_kwargs()
+        if self.instance is not None:
+            # Объявления задаются при создании: существующее предложение
+            # нельзя перевести на другие, в том числе чужие, объявления.
+            for name in ('ad_sender', 'ad_receiver'):
+                extra_kwargs.setdefault(name, {})['read_only'] = True
+        return extra_kwargs
+
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(error.messages)
+
+    def update(self, instance, validated_data):
+        try:
+            return super().update(instance, validated_data)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(error.messages)
+
+
+class ProposalDecisionSerializer(serializers.Serializer):
+    accept = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=1000)
+    reject = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=1000)
 
     def validate(self, data):
-        
-        if data['ad_receiver'] == self.context['request'].user.ad:
-            raise serializers.ValidationError("Нельзя создать предложение на своё объявление")
+        if not data['accept'] and not data['reject']:
+            raise serializers.ValidationError('Укажите предложения для принятия или отклонения')
         return data
 
-    def create(self, validated_data):
-        
-        validated_data['ad_sender'] = self.context['request'].user.ad
-        return super().create(validated_data)
\ No newline at end of file
+
+def _datetime(value, tz):
+    # Тот же формат, что у serializers.DateTimeField: текущая зона и 'Z' для UTC.
+    if timezone.is_aware(value):
+        value = value.astimezone(tz)
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+_PLAIN_FIELDS = (serializers.CharField, serializers.ChoiceField, serializers.IntegerField, serializers.BooleanField)
+
+
+class LeanListSerializer(serializers.BaseSerializer):
+    """Быстрый сериализатор только для чтения для списков.
+
+    Набор полей и их порядок берутся из ``source_serializer``, но значения
+    читаются напрямую из атрибутов модели: внешние ключи — через ``<поле>_id``
+    без обращения к связанному объекту, строки и числа — как есть. Вывод
+    совпадает с ``source_serializer``; ``fields`` и ``expand`` работают так
+    же, как в DynamicFieldsMixin.
+    """
+
+    source_serializer = None
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        getters = self.getters()
+        if fields is not None:
+            getters = [getter for getter in getters if getter[0] in fields]
+        expanded = {name: self.expandable_fields[name]() for name in expand}
+        self.active_getters = [
+            (name, attrgetter(name), expanded[name].to_representation) if name in expanded else (name, get, convert)
+            for name, get, convert in getters
+        ]
+
+    @classmethod
+    def getters(cls):
+        if '_getters' not in cls.__dict__:
+            cls._getters = [cls._getter(field) for field in cls.source_serializer().fields.values()]
+        return cls._getters
+
+    @staticmethod
+    def _getter(field):
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            return field.field_name, attrgetter(f'{field.source}_id'), None
+        if isinstance(field, serializers.DateTimeField):
+            return field.field_name, attrgetter(field.source), _datetime
+        if isinstance(field, _PLAIN_FIELDS):
+            return field.field_name, attrgetter(field.source), None
+        return field.field_name, attrgetter(field.source), field.to_representation
+
+    @cached_property
+    def current_timezone(self):
+        # Текущая зона хранится в asgiref.Local; читать её на каждое значение дорого.
+        return timezone.get_current_timezone()
+
+    def to_representation(self, instance):
+        tz = self.current_timezone
+        data = {}
+        for name, get, convert in self.active_getters:
+            value = get(instance)
+            if value is not None and convert is not None:
+                value = _datetime(value, tz) if convert is _datetime else convert(value)
+            data[name] = value
+        return data
+
+
+class AdListSerializer(LeanListSerializer):
+    source_serializer = AdSerializer
+
+
+class ExchangeProposalListSerializer(LeanListSerializer):
+    source_serializer = ExchangeProposalSerializer
+    expandable_fields = {'ad_sender': AdListSerializer, 'ad_receiver': AdListSerializer}
@@ -0,0 +1,121 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import counters, events
+from .auth import forget_user
+from .cache import ad_namespace, bump_generation, category_namespace, record_changes
+from .matching import proposal_row, proposals_changed
+from .models import Ad, ExchangeProposal
+
+
+# Поколение индекса похожих объявлений (similar.py). Журнал изменений пишется
+# здесь, а не в similar.py: модуль с numpy загружен не в каждом процессе, а
+# догнать изменения должны индексы всех воркеров.
+SIMILAR_NAMESPACE = 'similar-index'
+
+
+def similar_ads_changed(pks):
+    """Записывает созданные, изменённые и удалённые объявления в журнал индекса после коммита."""
+    pks = list(pks)
+    if pks:
+        transaction.on_commit(lambda: record_changes(SIMILAR_NAMESPACE, pks))
+
+
+def _bump_ad_generations(categories, pks):
+    for category in categories:
+        bump_generation(category_namespace(category))
+    for pk in pks:
+        bump_generation(ad_namespace(pk))
+
+
+def ads_changed(categories=None, pks=()):
+    if categories is None:
+        categories = [value for value, _ in Ad.CATEGORY_CHOICES]
+    categories, pks = set(categories), set(pks)
+    # Второй сброс после коммита не даёт закэшировать данные, которые
+    # параллельный запрос прочитал до завершения транзакции.
+    _bump_ad_generations(categories, pks)
+    transaction.on_commit(lambda: _bump_ad_generations(categories, pks))
+
+
+def counters_changed(deltas, categories=None):
+    """Применяет изменения счётчиков предложений и сбрасывает кэш этих объявлений."""
+    pks = counters.apply(deltas)
+    if not pks:
+        return
+    if categories is None:
+        categories = Ad.objects.filter(pk__in=pks).values_list('category', flat=True).distinct()
+    ads_changed(categories, pks)
+
+
+def _proposal_categories(instance):
+    # Форма и сериализатор уже загрузили оба объявления — без лишнего запроса.
+    fields = [instance._meta.get_field(name) for name in ('ad_sender', 'ad_receiver')]
+    if all(field.is_cached(instance) for field in fields):
+        return {field.get_cached_value(instance).category for field in fields}
+    return None
+
+
+@receiver(post_save, sender=Ad)
+@receiver(post_delete, sender=Ad)
+def ad_changed(sender, instance, **kwargs):
+    categories = {instance.category, getattr(instance, '_loaded_category', None)} - {None}
+    ads_changed(categories, [instance.pk])
+    similar_ads_changed([instance.pk])
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def proposal_saved(sender, instance, **kwargs):
+    if instance.status == 'pending':
+        proposals_changed(added=[proposal_row(instance)])
+    else:
+        proposals_changed(removed=[(instance.ad_sender_id, instance.ad_receiver_id)])
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def proposal_counted(sender, instance, created, **kwargs):
+    deltas = counters.Deltas()
+    if created:
+        deltas.added(instance.ad_sender_id, instance.ad_receiver_id, instance.status)
+    else:
+        deltas.status_changed(instance.ad_receiver_id, getattr(instance, '_loaded_status', None), instance.status)
+    counters_changed(deltas, _proposal_categories(instance))
+
+
+@receiver(post_save, sender=ExchangeProposal)
+def proposal_notify(sender, instance, created, **kwargs):
+    if created:
+        kind = 'proposal.created'
+    elif instance.status != getattr(instance, '_loaded_status', None):
+        kind = 'proposal.status'
+    else:
+        return
+    sender_user, receiver_user = instance.owner_ids()
+    # О новом предложении узнаёт получатель, о смене статуса — обе стороны.
+    users = [receiver_user] if created else [sender_user, receiver_user]
+    events.publish(users, events.proposal_event(
+        kind, instance.pk, instance.status, instance.ad_sender_id, instance.ad_receiver_id,
+    ))
+
+
+@receiver(post_delete, sender=ExchangeProposal)
+def proposal_deleted(sender, instance, **kwargs):
+    proposals_changed(removed=[(instance.ad_sender_id, instance.ad_receiver_id)])
+    deltas = counters.Deltas()
+    deltas.removed(instance.ad_sender_id, instance.ad_receiver_id, instance.status)
+    counters_changed(deltas, _proposal_categories(instance))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def user_logged_out_forget(sender, request, user, **kwargs):
+    if user is not None:
+        forget_user(user.pk)
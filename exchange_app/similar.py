@@ -0,0 +1,423 @@
+import logging
+import os
+import threading
+import zlib
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+
+from .cache import changes_between, get_generation
+from .models import Ad
+from .search import tokenize
+from .signals import SIMILAR_NAMESPACE as NAMESPACE
+
+logger = logging.getLogger(__name__)
+
+# Похожие объявления для предложений обмена.
+#
+# Каждое объявление — вектор признакового хэширования (hashing trick) слов
+# заголовка и описания: слово → (ячейка, знак) по crc32, заголовок весит
+# вдвое больше, вектор нормирован. Сходство — скалярное произведение плюс
+# бонусы за совпадение категории и состояния.
+#
+# Модуль тянет numpy, поэтому импортируется только там, где нужен индекс
+# (подсказки, сборка); журнал изменений объявлений ведёт signals.py.
+#
+# Чтобы не сканировать весь миллион строк, векторы разбиты на кластеры
+# (сферический k-means) и на диске лежат подряд по кластерам: запрос
+# просматривает только ``nprobe`` ближайших кластеров. Новые и изменённые
+# объявления дописываются в «хвост» в памяти до следующей пересборки.
+
+DIM = 64
+TITLE_WEIGHT = 2.0
+STEM_LENGTH = 6
+CATEGORY_BOOST = 0.3
+CONDITION_BOOST = 0.1
+NPROBE = 8
+MAX_CLUSTERS = 256
+# Журнал догоняется, если индекс отстал не больше чем на MAX_REPLAY
+# поколений; объявления перечитываются пачками по REPLAY_BATCH.
+MAX_REPLAY = 1000
+REPLAY_BATCH = 1000
+INDEX_FIELDS = ('id', 'user_id', 'title', 'description', 'category', 'condition')
+
+CATEGORIES = [value for value, _ in Ad.CATEGORY_CHOICES]
+CONDITIONS = [value for value, _ in Ad.CONDITION_CHOICES]
+
+
+@lru_cache(maxsize=200_000)
+def _feature(token):
+    # Грубая основа слова вместо морфологии: «ноутбук» и «ноутбука» совпадают.
+    digest = zlib.crc32(token[:STEM_LENGTH].encode())
+    return digest % DIM, 1.0 if digest & 0x80000000 else -1.0
+
+
+def vectorize(title, description):
+    vector = np.zeros(DIM, dtype=np.float32)
+    for text, weight in ((title, TITLE_WEIGHT), (description, 1.0)):
+        for token in tokenize(text):
+            if len(token) > 2:
+                bucket, sign = _feature(token)
+                vector[bucket] += sign * weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _code(choices, value):
+    return choices.index(value) if value in choices else -1
+
+
+def ad_row(ad):
+    """(id, владелец, вектор, категория, состояние) для индекса."""
+    return (
+        ad.pk, ad.user_id, vectorize(ad.title, ad.description),
+        _code(CATEGORIES, ad.category), _code(CONDITIONS, ad.condition),
+    )
+
+
+def _kmeans(vectors, clusters, iterations=10, sample=50_000, seed=0):
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample:
+        vectors = vectors[rng.choice(len(vectors), sample, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(clusters):
+            members = vectors[labels == cluster]
+            if len(members):
+                centroid = members.sum(axis=0)
+                norm = np.linalg.norm(centroid)
+                if norm:
+                    centroids[cluster] = centroid / norm
+    return centroids
+
+
+def _assign(vectors, centroids, batch=65_536):
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch):
+        labels[start:start + batch] = np.argmax(vectors[start:start + batch] @ centroids.T, axis=1)
+    return labels
+
+
+class _Tail:
+    """Растущие массивы для объявлений, добавленных после сборки."""
+
+    def __init__(self):
+        self.size = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.users = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, DIM), dtype=np.float32)
+        self.categories = np.empty(0, dtype=np.int8)
+        self.conditions = np.empty(0, dtype=np.int8)
+        self.clusters = np.empty(0, dtype=np.int32)
+        self.alive = np.empty(0, dtype=bool)
+        self.rows = {}
+
+    def _grow(self):
+        capacity = max(64, 2 * len(self.ids))
+        for name in ('ids', 'users', 'vectors', 'categories', 'conditions', 'clusters', 'alive'):
+            old = getattr(self, name)
+            new = np.zeros((capacity, *old.shape[1:]), dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def append(self, row, cluster):
+        if self.size == len(self.ids):
+            self._grow()
+        index = self.size
+        ad_id, user, vector, category, condition = row
+        self.ids[index], self.users[index], self.vectors[index] = ad_id, user, vector
+        self.categories[index], self.conditions[index] = category, condition
+        self.clusters[index], self.alive[index] = cluster, True
+        self.rows[ad_id] = index
+        self.size += 1
+
+
+class SimilarAdsIndex:
+    def __init__(self, vectors, ids, users, categories, conditions, offsets, centroids, alive=None, generation=None):
+        # Основная часть отсортирована по кластерам: строки кластера c лежат
+        # в offsets[c]:offsets[c + 1]. ``vectors`` может быть np.memmap.
+        self.vectors = vectors
+        self.ids = ids
+        self.users = users
+        self.categories = categories
+        self.conditions = conditions
+        self.offsets = offsets
+        self.centroids = centroids
+        self.alive = np.ones(len(ids), dtype=bool) if alive is None else np.array(alive, dtype=bool)
+        self._order = np.argsort(ids, kind='stable')
+        self._sorted_ids = ids[self._order]
+        self.tail = _Tail()
+        # Поколение журнала изменений, с которого индекс начал строиться.
+        self.generation = generation
+
+    @classmethod
+    def build(cls, rows):
+        rows = list(rows)
+        vectors = np.array([row[2] for row in rows], dtype=np.float32).reshape(-1, DIM)
+        clusters = min(MAX_CLUSTERS, max(1, int(np.sqrt(len(rows)) / 4)))
+        centroids = _kmeans(vectors, clusters) if clusters > 1 else np.zeros((1, DIM), dtype=np.float32)
+        labels = _assign(vectors, centroids) if clusters > 1 else np.zeros(len(rows), dtype=np.int32)
+
+        order = np.argsort(labels, kind='stable')
+        offsets = np.searchsorted(labels[order], np.arange(clusters + 1)).astype(np.int64)
+
+        def column(index, dtype):
+            return np.array([row[index] for row in rows], dtype=dtype)[order]
+
+        return cls(
+            vectors[order], column(0, np.int64), column(1, np.int64),
+            column(3, np.int8), column(4, np.int8), offsets, centroids,
+        )
+
+    @classmethod
+    def from_db(cls, chunk_size=10_000):
+        # Поколение — до чтения таблицы: изменения, попавшие в сборку, потом
+        # лишь повторятся из журнала, а не потеряются.
+        generation = get_generation(NAMESPACE)
+        queryset = Ad.objects.only(*INDEX_FIELDS)
+        index = cls.build(ad_row(ad) for ad in queryset.iterator(chunk_size=chunk_size))
+        index.generation = generation
+        return index
+
+    def __len__(self):
+        return int(self.alive.sum() + self.tail.alive[:self.tail.size].sum())
+
+    def _base_row(self, ad_id):
+        position = np.searchsorted(self._sorted_ids, ad_id)
+        if position < len(self._sorted_ids) and self._sorted_ids[position] == ad_id:
+            return self._order[position]
+        return None
+
+    def remove(self, ad_id):
+        row = self._base_row(ad_id)
+        if row is not None:
+            self.alive[row] = False
+        row = self.tail.rows.pop(ad_id, None)
+        if row is not None:
+            self.tail.alive[row] = False
+
+    def add(self, row):
+        self.remove(row[0])
+        cluster = int(np.argmax(self.centroids @ row[2])) if len(self.centroids) > 1 else 0
+        self.tail.append(row, cluster)
+
+    def _score(self, vectors, categories, conditions, query):
+        _, _, vector, category, condition = query
+        return (
+            vectors @ vector
+            + CATEGORY_BOOST * (categories == category)
+            + CONDITION_BOOST * (conditions == condition)
+        )
+
+    def query(self, row, k=10, nprobe=NPROBE):
+        """Топ-k (id, оценка) объявлений других владельцев, похожих на ``row``."""
+        ad_id, user, vector = row[:3]
+        if len(self.centroids) > 1:
+            probe = np.argsort(self.centroids @ vector)[::-1][:nprobe]
+        else:
+            probe = np.array([0])
+
+        ids, scores = [], []
+        for cluster in probe:
+            start, end = self.offsets[cluster], self.offsets[cluster + 1]
+            if start == end:
+                continue
+            score = self._score(self.vectors[start:end], self.categories[start:end], self.conditions[start:end], row)
+            mask = self.alive[start:end] & (self.users[start:end] != user) & (self.ids[start:end] != ad_id)
+            ids.append(self.ids[start:end][mask])
+            scores.append(score[mask])
+
+        tail = self.tail
+        if tail.size:
+            size = tail.size
+            mask = tail.alive[:size] & (tail.users[:size] != user) & (tail.ids[:size] != ad_id)
+            mask &= np.isin(tail.clusters[:size], probe)
+            ids.append(tail.ids[:size][mask])
+            scores.append(self._score(tail.vectors[:size][mask], tail.categories[:size][mask], tail.conditions[:size][mask], row))
+
+        if not ids:
+            return []
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+        if len(ids) > k:
+            top = np.argpartition(scores, -k)[-k:]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    def save(self, directory):
+        """Сохраняет индекс с хвостом; открывается обратно через ``load`` с mmap."""
+        os.makedirs(directory, exist_ok=True)
+        tail, size = self.tail, self.tail.size
+        parts = []
+        for cluster in range(len(self.offsets) - 1):
+            start, end = self.offsets[cluster], self.offsets[cluster + 1]
+            base = np.arange(start, end)[self.alive[start:end]]
+            extra = np.flatnonzero(tail.alive[:size] & (tail.clusters[:size] == cluster))
+            parts.append((base, extra))
+
+        total = sum(len(base) + len(extra) for base, extra in parts)
+        vectors_path = os.path.join(directory, 'vectors.npy')
+        vectors = np.lib.format.open_memmap(vectors_path + '.tmp', mode='w+', dtype=np.float32, shape=(total, DIM))
+        columns = {name: [] for name in ('ids', 'users', 'categories', 'conditions')}
+        offsets, position = [0], 0
+        for base, extra in parts:
+            count = len(base) + len(extra)
+            vectors[position:position + len(base)] = self.vectors[base]
+            vectors[position + len(base):position + count] = tail.vectors[extra]
+            for name in columns:
+                columns[name].append(getattr(self, name)[base])
+                columns[name].append(getattr(tail, name)[extra])
+            position += count
+            offsets.append(position)
+        vectors.flush()
+        del vectors
+
+        meta_path = os.path.join(directory, 'meta.npz')
+        with open(meta_path + '.tmp', 'wb') as stream:
+            np.savez(
+                stream,
+                offsets=np.array(offsets, dtype=np.int64),
+                centroids=self.centroids,
+                generation=np.array(-1 if self.generation is None else self.generation, dtype=np.int64),
+                **{name: np.concatenate(values) for name, values in columns.items()},
+            )
+        # Сначала векторы, затем метаданные: читатель ориентируется на mtime meta.npz.
+        os.replace(vectors_path + '.tmp', vectors_path)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    @classmethod
+    def load(cls, directory):
+        with np.load(os.path.join(directory, 'meta.npz')) as meta:
+            arrays = {name: meta[name] for name in meta.files}
+        vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+        generation = int(arrays['generation']) if 'generation' in arrays else -1
+        return cls(
+            vectors, arrays['ids'], arrays['users'], arrays['categories'], arrays['conditions'],
+            arrays['offsets'], arrays['centroids'], generation=None if generation < 0 else generation,
+        )
+
+
+# Индекс процесса. Файлы на диске пересобирает команда build_similar_index.
+# Каждое изменение объявлений в любом процессе поднимает общее поколение и
+# пишет id в журнал (signals.similar_ads_changed); перед запросом индекс
+# догоняет журнал от своего поколения, перечитывая эти объявления из базы.
+# Обработчик запроса таблицу целиком не читает: без индекса — IndexNotReady,
+# если журнал не дотягивается — отвечает старый индекс до пересборки.
+# Фоновая сборка из воркера — только с SIMILAR_INDEX_BUILD_IN_BACKGROUND.
+_lock = threading.RLock()
+_index = None
+_loaded_mtime = None
+_generation = None
+_builder = None
+
+
+class IndexNotReady(Exception):
+    """Индекса нет ни на диске, ни в памяти процесса."""
+
+
+def index_dir():
+    return getattr(settings, 'SIMILAR_INDEX_DIR', None)
+
+
+def _meta_mtime():
+    directory = index_dir()
+    try:
+        return os.stat(os.path.join(directory, 'meta.npz')).st_mtime_ns if directory else None
+    except FileNotFoundError:
+        return None
+
+
+def _build():
+    global _index, _generation
+    try:
+        index = SimilarAdsIndex.from_db()
+        with _lock:
+            _index, _generation = index, index.generation
+    except Exception:
+        logger.exception('Не удалось собрать индекс похожих объявлений')
+    finally:
+        connections.close_all()
+
+
+def _build_in_background():
+    global _builder
+    if not getattr(settings, 'SIMILAR_INDEX_BUILD_IN_BACKGROUND', False):
+        return
+    with _lock:
+        if _builder is None or not _builder.is_alive():
+            _builder = threading.Thread(target=_build, name='similar-index-build', daemon=True)
+            _builder.start()
+
+
+def _read_changes(start, end):
+    """Строки изменённых объявлений и id удалённых за поколения ``start`` + 1 … ``end``.
+
+    None, если журнал не сохранился. Только чтение — без ``_lock``.
+    """
+    changed = changes_between(NAMESPACE, start, end, MAX_REPLAY)
+    if changed is None:
+        return None
+    rows, removed = [], []
+    changed = sorted(changed)
+    for offset in range(0, len(changed), REPLAY_BATCH):
+        batch = changed[offset:offset + REPLAY_BATCH]
+        ads = {ad.pk: ad for ad in Ad.objects.filter(pk__in=batch).only(*INDEX_FIELDS)}
+        for ad_id in batch:
+            if ad_id in ads:
+                rows.append(ad_row(ads[ad_id]))
+            else:
+                removed.append(ad_id)
+    return rows, removed
+
+
+def get_index():
+    """Индекс процесса с изменениями объявлений из всех процессов.
+
+    Поднимает ``IndexNotReady``, если индекса нет: его собирает
+    build_similar_index.
+    """
+    global _index, _loaded_mtime, _generation
+    generation = get_generation(NAMESPACE)
+    with _lock:
+        mtime = _meta_mtime()
+        if mtime is not None and mtime != _loaded_mtime:
+            _index, _loaded_mtime = SimilarAdsIndex.load(index_dir()), mtime
+            _generation = _index.generation
+        if _index is None:
+            _build_in_background()
+            raise IndexNotReady
+        if _generation == generation:
+            return _index
+        index, start = _index, _generation
+
+    # Запросы к базе — вне блокировки: остальные подсказки тем временем
+    # отвечают по индексу, а изменения подставляются под ней одним шагом.
+    changes = _read_changes(start, generation) if start is not None else None
+    if changes is None:
+        logger.warning('Журнал изменений индекса похожих объявлений потерян, нужна пересборка')
+        _build_in_background()
+        return index
+    rows, removed = changes
+    with _lock:
+        if _index is index and _generation == start:
+            for ad_id in removed:
+                index.remove(ad_id)
+            for row in rows:
+                index.add(row)
+            _generation = generation
+        return _index
+
+
+def reset():
+    global _index, _loaded_mtime, _generation
+    with _lock:
+        _index = _loaded_mtime = _generation = None
+
+
+def similar_ads(ad, k=10):
+    index = get_index()
+    with _lock:
+        return index.query(ad_row(ad), k)
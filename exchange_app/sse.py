@@ -0,0 +1,104 @@
+"""Server-Sent Events о предложениях в обход обработчика запросов Django.
+
+Обработчик ASGI в Django держит на каждый запрос отдельный поток
+(ThreadSensitiveContext) и соединение с БД до конца ответа — для потока
+событий это поток и соединение на каждого открытого клиента. Поэтому
+``EVENTS_PATH`` обслуживает ``EventStreamRouter`` из test_project/asgi.py:
+пользователь определяется по сессии в общем пуле потоков, дальше
+соединение — только корутина с очередью asyncio.
+"""
+import asyncio
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+from django.http import HttpRequest, parse_cookie
+
+from . import events
+
+EVENTS_PATH = '/proposals/events/'
+HEARTBEAT_INTERVAL = 15
+RETRY_MS = 5000
+
+HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def session_user_id(cookie_header):
+    """id пользователя из cookie сессии или None — та же проверка, что в AuthenticationMiddleware."""
+    session_key = parse_cookie(cookie_header).get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    user = get_user(request)
+    return user.pk if user.is_authenticated else None
+
+
+def _authenticate(cookie_header):
+    try:
+        return session_user_id(cookie_header)
+    finally:
+        # Как по request_finished: соединение потока пула живёт CONN_MAX_AGE.
+        close_old_connections()
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream_events(user_id, receive, send):
+    subscription = events.get_broker().subscribe(user_id)
+    disconnected = asyncio.ensure_future(_disconnected(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': HEADERS})
+        # Первая строка сразу: клиент видит, что подписка установлена.
+        await send({'type': 'http.response.body', 'body': f'retry: {RETRY_MS}\n\n'.encode(), 'more_body': True})
+        while True:
+            getter = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait(
+                {getter, disconnected}, timeout=HEARTBEAT_INTERVAL, return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                getter.cancel()
+                return
+            if getter in done:
+                body = events.format_sse(getter.result())
+            else:
+                # Комментарий не даёт прокси закрыть простаивающее соединение.
+                getter.cancel()
+                body = b': ping\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        disconnected.cancel()
+        subscription.close()
+
+
+async def _plain_response(send, status, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': body.encode()})
+
+
+class EventStreamRouter:
+    """Отдаёт ``EVENTS_PATH`` сам, остальные запросы — приложению Django."""
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != EVENTS_PATH:
+            return await self.application(scope, receive, send)
+        if scope['method'] != 'GET':
+            return await _plain_response(send, 405, 'Method Not Allowed')
+
+        cookie = dict(scope['headers']).get(b'cookie', b'').decode('latin-1')
+        user_id = await sync_to_async(_authenticate, thread_sensitive=False)(cookie)
+        if user_id is None:
+            return await _plain_response(send, 401, 'Unauthorized')
+        await stream_events(user_id, receive, send)
@@ -0,0 +1,86 @@
+"""Замеры холодного старта: от запуска интерпретатора до первого ответа.
+
+Каждый замер — отдельный процесс Python, который делает то же, что воркер:
+``get_wsgi_application()`` (django.setup, приложения, сигналы) и первый
+запрос через WSGI (URLconf, представления, шаблоны). С ``-X importtime``
+интерпретатор печатает время импорта каждого модуля.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+# Тяжёлые пакеты, которые не должны загружаться до первого запроса: их
+# модули импортируются лениво, там, где они нужны.
+LAZY_MODULES = ('fastapi', 'fastapi_users', 'sqlalchemy', 'pydantic', 'numpy', 'networkx')
+
+BOOTSTRAP = '''
+import io, json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+ready = time.perf_counter()
+environ = {{
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': {path!r}, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+    'wsgi.errors': sys.stderr,
+}}
+statuses = []
+response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+b''.join(response)
+response.close()
+finished = time.perf_counter()
+print(json.dumps({{
+    'status': statuses[0],
+    'setup_ms': round((ready - started) * 1000, 1),
+    'first_request_ms': round((finished - started) * 1000, 1),
+    'lazy_modules_loaded': [name for name in {lazy!r} if name in sys.modules],
+}}))
+'''
+
+
+def cold_start(path='/', importtime=False, env=None):
+    """Запускает новый процесс до первого ответа на GET ``path``.
+
+    Возвращает замеры процесса и, с ``importtime``, вывод ``-X importtime``.
+    """
+    script = BOOTSTRAP.format(settings_module=settings.SETTINGS_MODULE, path=path, lazy=LAZY_MODULES)
+    command = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', script]
+    started = time.perf_counter()
+    completed = subprocess.run(
+        command, cwd=Path(settings.BASE_DIR), env={**os.environ, **(env or {})},
+        capture_output=True, text=True, check=False,
+    )
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f'Процесс завершился с кодом {completed.returncode}:\n{completed.stderr[-2000:]}')
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['process_ms'] = round(elapsed * 1000, 1)
+    return result, completed.stderr if importtime else ''
+
+
+def parse_importtime(output):
+    """Строки ``-X importtime`` → список (модуль, собственное время мкс, с вложенными мкс)."""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        if not own.strip().isdigit():
+            continue  # заголовок
+        modules.append((name.strip(), int(own), int(cumulative)))
+    return modules
+
+
+def package_totals(modules):
+    """Собственное время импорта, сложенное по пакетам верхнего уровня."""
+    totals = Counter()
+    for name, own, _ in modules:
+        totals[name.partition('.')[0]] += own
+    return totals
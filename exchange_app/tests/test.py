@@ -1,7 +1,34 @@
-from django.test import TestCase, Client
+import asyncio
+import json
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, models
+from django.test import TestCase, Client, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
+from exchange_app import counters, events
+from exchange_app.events import InProcessBroker
+from exchange_app.exporting import CHUNK_SIZE
+from exchange_app.forms import ExchangeProposalForm
 from exchange_app.models import Ad, ExchangeProposal
+from exchange_app.proposals import decide_proposals
+from exchange_app.serializers import AdSerializer
+from exchange_app.sse import EVENTS_PATH, EventStreamRouter, session_user_id, stream_events
+from exchange_app.startup import cold_start, package_totals, parse_importtime
+from exchange_app.tests.utils import QueryBudgetMixin
+from test_project.database import database_config
 
 
 class AdTests(TestCase):
@@ -166,3 +193,1367 @@ class AdditionalExchangeProposalTests(TestCase):
     #         'status': 'accepted',
     #     })
     #     self.assertEqual(response.status_code, 404)
+
+
+class AdSearchTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='rita', password='testpass')
+        self.phone = Ad.objects.create(title='Смартфон Nokia', description='Рабочий телефон', category='electronics', condition='used', user=self.user)
+        self.book = Ad.objects.create(title='Книга о телефонах', description='История связи', category='books', condition='new', user=self.user)
+        self.coat = Ad.objects.create(title='Пальто', description='Тёплое зимнее', category='clothing', condition='used', user=self.user)
+
+    def test_search_matches_title_and_description(self):
+        response = self.client.get(reverse('ad-list'), {'search': 'телефон'})
+        self.assertContains(response, 'Смартфон Nokia')
+        self.assertNotContains(response, 'Пальто')
+
+    def test_search_by_prefix(self):
+        response = self.client.get(reverse('ad-list'), {'search': 'пальт'})
+        self.assertContains(response, 'Пальто')
+        self.assertNotContains(response, 'Смартфон Nokia')
+
+    def test_search_combined_with_category(self):
+        response = self.client.get(reverse('ad-list'), {'search': 'телефон', 'category': 'books'})
+        self.assertContains(response, 'Книга о телефонах')
+        self.assertNotContains(response, 'Смартфон Nokia')
+
+    def test_search_index_follows_update_and_delete(self):
+        self.coat.title = 'Куртка'
+        self.coat.save()
+        self.book.delete()
+        response = self.client.get(reverse('ad-list'), {'search': 'куртка'})
+        self.assertContains(response, 'Куртка')
+        response = self.client.get(reverse('ad-list'), {'search': 'книга'})
+        self.assertNotContains(response, 'Книга о телефонах')
+
+    def test_api_search(self):
+        response = self.client.get('/api/ads/', {'search': 'nokia'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([ad['id'] for ad in response.json()['results']], [self.phone.pk])
+
+    def test_search_pages_keep_rank_order(self):
+        # Чем раньше создано, тем чаще слово: релевантность обратна дате.
+        # Последние два одинаковы — при равном ранге новее идёт первым.
+        texts = [' '.join(['гитара'] * (6 - i) + ['струны'] * i) for i in range(5)] + ['гитара струны'] * 2
+        ads = [
+            Ad.objects.create(title=f'Объявление {i}', description=text, category='other', condition='used', user=self.user)
+            for i, text in enumerate(texts)
+        ]
+        expected = [ad.pk for ad in ads[:5]] + [ads[6].pk, ads[5].pk]
+
+        data = self.client.get('/api/ads/', {'search': 'гитара', 'page_size': 2}).json()
+        ids = [ad['id'] for ad in data['results']]
+        while data['next']:
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get(data['next']).json()
+            self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+            ids.extend(ad['id'] for ad in data['results'])
+        self.assertEqual(ids, expected)
+
+        data = self.client.get(data['previous']).json()
+        self.assertEqual([ad['id'] for ad in data['results']], expected[4:6])
+
+
+class AdPaginationTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='rita', password='testpass')
+        self.ads = [
+            Ad.objects.create(title=f'Ad {i}', description='desc', category='books' if i % 2 else 'other', condition='new', user=self.user)
+            for i in range(25)
+        ]
+
+    def test_list_walks_all_pages_without_duplicates(self):
+        seen = []
+        url = reverse('ad-list')
+        params = {'category': 'books'}
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(ad.pk for ad in response.context['ads'])
+            next_url = response.context.get('next_page_url')
+            if not next_url:
+                break
+            url, params = reverse('ad-list') + next_url, {}
+        expected = [ad.pk for ad in reversed(self.ads) if ad.category == 'books']
+        self.assertEqual(seen, expected)
+
+    def test_previous_page_returns_first_page(self):
+        first = self.client.get(reverse('ad-list'))
+        second = self.client.get(reverse('ad-list') + first.context['next_page_url'])
+        back = self.client.get(reverse('ad-list') + second.context['previous_page_url'])
+        self.assertEqual(list(back.context['ads']), list(first.context['ads']))
+        self.assertNotIn('previous_page_url', back.context)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('ad-list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_api_cursor_pagination(self):
+        response = self.client.get('/api/ads/', {'page_size': 20})
+        data = response.json()
+        self.assertEqual(len(data['results']), 20)
+        self.assertIsNone(data['previous'])
+        data = self.client.get(data['next']).json()
+        self.assertEqual([ad['id'] for ad in data['results']], [ad.pk for ad in reversed(self.ads[:5])])
+        self.assertIsNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='rita', password='testpass')
+        self.other = User.objects.create_user(username='alex', password='testpass')
+        self.client.login(username='rita', password='testpass')
+        self.add_rows(1)
+
+    def add_rows(self, count):
+        for _ in range(count):
+            mine = Ad.objects.create(title='Mine', description='desc', category='books', condition='new', user=self.user)
+            theirs = Ad.objects.create(title='Theirs', description='desc', category='books', condition='used', user=self.other)
+            ExchangeProposal.objects.create(ad_sender=mine, ad_receiver=theirs)
+            ExchangeProposal.objects.create(ad_sender=theirs, ad_receiver=mine)
+
+    def assertEndpointBudget(self, budget, url, params=None):
+        self.assertConstantQueries(
+            budget,
+            lambda: self.assertEqual(self.client.get(url, params).status_code, 200),
+            lambda: self.add_rows(10),
+        )
+
+    def test_ad_list(self):
+        # Сессия, пользователь, страница объявлений и счётчики фильтров при промахе кэша.
+        self.assertEndpointBudget(4, reverse('ad-list'))
+
+    def test_proposal_list(self):
+        self.assertEndpointBudget(3, reverse('proposal-list'))
+
+    def test_api_ads(self):
+        self.assertEndpointBudget(3, '/api/ads/')
+
+    def test_api_proposals(self):
+        # Плюс агрегат для ETag до выборки страницы.
+        self.assertEndpointBudget(4, '/api/proposals/')
+
+
+class DatabaseIndexTests(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='rita', password='testpass')
+        self.user2 = User.objects.create_user(username='alex', password='testpass')
+        self.ad1 = Ad.objects.create(title='Ad1', description='desc', category='books', condition='used', user=self.user1)
+        self.ad2 = Ad.objects.create(title='Ad2', description='desc', category='books', condition='used', user=self.user2)
+
+    def test_proposal_pair_is_unique(self):
+        ExchangeProposal.objects.create(ad_sender=self.ad1, ad_receiver=self.ad2)
+        with self.assertRaises(ValidationError):
+            ExchangeProposal.objects.create(ad_sender=self.ad1, ad_receiver=self.ad2)
+        ExchangeProposal.objects.create(ad_sender=self.ad2, ad_receiver=self.ad1)
+
+    def test_explain_queries_command(self):
+        out = StringIO()
+        call_command('explain_queries', stdout=out)
+        self.assertIn('ad_category_created_idx', out.getvalue())
+        self.assertIn('proposal_receiver_status_idx', out.getvalue())
+
+
+class ProposalScopeTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        self.alex = User.objects.create_user(username='alex', password='testpass')
+        self.oleg = User.objects.create_user(username='oleg', password='testpass')
+        rita_ad = Ad.objects.create(title='Rita ad', description='desc', category='books', condition='new', user=self.rita)
+        alex_ad = Ad.objects.create(title='Alex ad', description='desc', category='books', condition='new', user=self.alex)
+        oleg_ad = Ad.objects.create(title='Oleg ad', description='desc', category='books', condition='new', user=self.oleg)
+        self.sent = ExchangeProposal.objects.create(ad_sender=rita_ad, ad_receiver=alex_ad)
+        self.received = ExchangeProposal.objects.create(ad_sender=oleg_ad, ad_receiver=rita_ad, status='accepted')
+        self.foreign = ExchangeProposal.objects.create(ad_sender=alex_ad, ad_receiver=oleg_ad)
+        self.client.login(username='rita', password='testpass')
+
+    def proposals(self, params=None):
+        response = self.client.get(reverse('proposal-list'), params)
+        return {proposal.pk for proposal in response.context['object_list']}
+
+    def test_inbox_contains_sent_and_received_only(self):
+        self.assertEqual(self.proposals(), {self.sent.pk, self.received.pk})
+
+    def test_direction_and_status_filters(self):
+        self.assertEqual(self.proposals({'direction': 'sent'}), {self.sent.pk})
+        self.assertEqual(self.proposals({'direction': 'received'}), {self.received.pk})
+        self.assertEqual(self.proposals({'status': 'accepted'}), {self.received.pk})
+
+    def test_api_is_scoped_to_user(self):
+        data = self.client.get('/api/proposals/').json()
+        self.assertEqual({proposal['id'] for proposal in data['results']}, {self.sent.pk, self.received.pk})
+        response = self.client.get(f'/api/proposals/{self.foreign.pk}/')
+        self.assertEqual(response.status_code, 404)
+
+
+class ReceiverAutocompleteTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        self.alex = User.objects.create_user(username='alex', password='testpass')
+        self.mine = Ad.objects.create(title='Моя гитара', description='desc', category='other', condition='used', user=self.rita)
+        self.laptop = Ad.objects.create(title='Ноутбук Lenovo', description='desc', category='electronics', condition='used', user=self.alex)
+        self.novel = Ad.objects.create(title='Ноутбук для записей', description='desc', category='books', condition='new', user=self.alex)
+        self.client.login(username='rita', password='testpass')
+
+    def autocomplete(self, **params):
+        data = self.client.get(reverse('api-ads-autocomplete'), params).json()
+        return [ad['id'] for ad in data['results']]
+
+    def test_autocomplete_excludes_own_ads(self):
+        self.assertEqual(set(self.autocomplete()), {self.laptop.pk, self.novel.pk})
+
+    def test_autocomplete_prefix_and_category(self):
+        self.assertEqual(set(self.autocomplete(q='ноут')), {self.laptop.pk, self.novel.pk})
+        self.assertEqual(self.autocomplete(q='ноут', category='books'), [self.novel.pk])
+
+    def test_form_renders_only_selected_receiver(self):
+        for i in range(20):
+            Ad.objects.create(title=f'Other {i}', description='desc', category='books', condition='new', user=self.alex)
+        response = self.client.get(reverse('proposal-create'), {'ad_receiver': self.laptop.pk})
+        self.assertContains(response, 'Ноутбук Lenovo')
+        self.assertNotContains(response, 'Other 1')
+        self.assertNotContains(response, 'Ноутбук для записей')
+
+    def test_form_query_count_does_not_depend_on_catalogue(self):
+        self.assertConstantQueries(
+            4,
+            lambda: self.client.get(reverse('proposal-create')),
+            lambda: [
+                Ad.objects.create(title=f'Other {i}', description='desc', category='books', condition='new', user=self.alex)
+                for i in range(20)
+            ],
+        )
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='rita', password='testpass')
+        self.client.login(username='rita', password='testpass')
+
+    def test_csv_import_reports_row_errors(self):
+        body = (
+            'title,description,image_url,category,condition\n'
+            'Книга,Роман,,books,new\n'
+            'Плохая,Описание,,cars,new\n'
+            'Лампа,Настольная,https://example.com/l.jpg,other,used\n'
+        )
+        response = self.client.post(reverse('api-ads-bulk'), body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['created'], 2)
+        self.assertEqual([error['row'] for error in data['errors']], [2])
+        self.assertIn('category', data['errors'][0]['errors'])
+        self.assertEqual(Ad.objects.filter(user=self.user).count(), 2)
+
+    def test_ndjson_import(self):
+        rows = [
+            {'title': 'Стул', 'description': 'Деревянный', 'category': 'other', 'condition': 'used'},
+            {'title': 'Без описания', 'category': 'other', 'condition': 'used'},
+        ]
+        body = '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n'
+        response = self.client.post(reverse('api-ads-bulk'), body, content_type='application/x-ndjson')
+        data = response.json()
+        self.assertEqual(data['created'], 1)
+        self.assertEqual([error['row'] for error in data['errors']], [2, 3])
+        self.assertTrue(Ad.objects.filter(title='Стул', user=self.user).exists())
+
+    def test_committed_batches_invalidate_cache_when_later_batch_fails(self):
+        from exchange_app.importing import import_ads
+
+        def rows():
+            yield 1, {'title': 'Глобус', 'description': 'Настольный', 'category': 'other', 'condition': 'used'}
+            raise OSError('соединение оборвалось')
+
+        self.assertEqual(self.client.get('/api/ads/').json()['results'], [])
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(OSError):
+            import_ads(rows(), self.user, batch_size=1)
+        self.assertEqual([ad['title'] for ad in self.client.get('/api/ads/').json()['results']], ['Глобус'])
+
+    def test_unsupported_media_type(self):
+        response = self.client.post(reverse('api-ads-bulk'), {'title': 'x'}, content_type='application/json')
+        self.assertEqual(response.status_code, 415)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8') as source:
+            source.write('title,description,category,condition\nЧасы,Наручные,other,new\n')
+            source.flush()
+            out = StringIO()
+            call_command('import_ads', source.name, user='rita', stdout=out, stderr=StringIO())
+        self.assertIn('Создано: 1', out.getvalue())
+        self.assertTrue(Ad.objects.filter(title='Часы', user=self.user).exists())
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        self.alex = User.objects.create_user(username='alex', password='testpass')
+        self.book = Ad.objects.create(title='Книга', description='Роман, в двух томах', category='books', condition='new', user=self.rita)
+        self.lamp = Ad.objects.create(title='Лампа', description='desc', category='other', condition='used', user=self.alex)
+        self.proposal = ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.lamp)
+
+    def test_ads_csv_export_with_filters(self):
+        response = self.client.get(reverse('ad-export'), {'category': 'books'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,user,title,description,image_url,category,condition,created_at')
+        self.assertEqual(len(lines), 2)
+        self.assertIn('"Роман, в двух томах"', lines[1])
+
+    def test_ads_ndjson_export(self):
+        response = self.client.get(reverse('ad-export'), {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.book.pk, self.lamp.pk])
+
+    def test_proposal_export_is_scoped(self):
+        ExchangeProposal.objects.create(ad_sender=self.lamp, ad_receiver=self.book, status='rejected')
+        self.client.login(username='rita', password='testpass')
+        response = self.client.get(reverse('proposal-export'), {'format': 'ndjson', 'direction': 'sent'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.proposal.pk])
+
+
+class ExportMemoryTests(TestCase):
+    # Первый кусок — книги, остальные — «другое»: выгрузка ?category=books
+    # читает один кусок, полная — CHUNKS кусков. Миллион строк гоняет bench_export.
+    CHUNKS = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='rita', password='testpass')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s) '
+                'INSERT INTO exchange_app_ad (user_id, title, description, category, condition, created_at, updated_at, '
+                'received_pending_count, received_accepted_count, received_rejected_count, sent_count) '
+                "SELECT %s, 'Товар ' || n, 'Описание товара', CASE WHEN n <= %s THEN 'books' ELSE 'other' END, "
+                "'new', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, 0, 0, 0, 0 FROM seq",
+                [cls.CHUNKS * CHUNK_SIZE, user.pk, CHUNK_SIZE],
+            )
+
+    def export_peak(self, params):
+        """(строк, пик памяти Python) при чтении потоковой выгрузки."""
+        response = self.client.get(reverse('ad-export'), params)
+        tracemalloc.start()
+        try:
+            lines = sum(chunk.count(b'\n') for chunk in response.streaming_content)
+            return lines - 1, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_export_peak_memory_does_not_grow_with_rows(self):
+        rows, one_chunk = self.export_peak({'category': 'books'})
+        self.assertEqual(rows, CHUNK_SIZE)
+        rows, peak = self.export_peak({})
+        self.assertEqual(rows, self.CHUNKS * CHUNK_SIZE)
+        # Выгрузка целиком в память росла бы в CHUNKS раз.
+        self.assertLess(peak, 2 * one_chunk)
+
+
+class AdFacetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='rita', password='testpass')
+        for title, category, condition in [
+            ('Телефон', 'electronics', 'used'),
+            ('Телефон старый', 'electronics', 'broken'),
+            ('Роман', 'books', 'new'),
+            ('Учебник', 'books', 'used'),
+        ]:
+            Ad.objects.create(title=title, description='desc', category=category, condition=condition, user=self.user)
+
+    def test_counts_follow_search_and_other_filter(self):
+        facets = self.client.get(reverse('api-ads-facets')).json()
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual(facets['category'], {'electronics': 2, 'books': 2, 'clothing': 0, 'other': 0})
+
+        facets = self.client.get(reverse('api-ads-facets'), {'search': 'телефон'}).json()
+        self.assertEqual(facets['category']['electronics'], 2)
+        self.assertEqual(facets['condition'], {'new': 0, 'used': 1, 'broken': 1})
+
+        facets = self.client.get(reverse('api-ads-facets'), {'category': 'books'}).json()
+        self.assertEqual(facets['condition'], {'new': 1, 'used': 1, 'broken': 0})
+        self.assertEqual(facets['category']['electronics'], 2)
+        self.assertEqual(facets['total'], 2)
+
+    def test_counts_are_cached_and_invalidated_by_writes(self):
+        self.client.get(reverse('api-ads-facets'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('api-ads-facets'))
+        Ad.objects.create(title='Пальто', description='desc', category='clothing', condition='new', user=self.user)
+        facets = self.client.get(reverse('api-ads-facets')).json()
+        self.assertEqual(facets['category']['clothing'], 1)
+        Ad.objects.filter(category='clothing').get().delete()
+        facets = self.client.get(reverse('api-ads-facets')).json()
+        self.assertEqual(facets['category']['clothing'], 0)
+
+    def test_list_renders_counts(self):
+        response = self.client.get(reverse('ad-list'))
+        self.assertContains(response, 'Книги (2)')
+        self.assertContains(response, 'Все (4)')
+
+
+class AdCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        self.alex = User.objects.create_user(username='alex', password='testpass')
+        self.book = Ad.objects.create(title='Книга', description='desc', category='books', condition='new', user=self.rita)
+        self.lamp = Ad.objects.create(title='Лампа', description='desc', category='other', condition='used', user=self.alex)
+
+    def test_cached_list_is_served_without_ad_queries(self):
+        self.client.get(reverse('ad-list'), {'category': 'books'})
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('ad-list'), {'category': 'books'})
+        self.assertContains(response, 'Книга')
+
+    def test_write_invalidates_only_its_category(self):
+        self.client.get(reverse('ad-list'), {'category': 'books'})
+        self.client.get(reverse('ad-list'), {'category': 'other'})
+        self.lamp.title = 'Торшер'
+        self.lamp.save()
+        # Пересчитываются только счётчики фильтров, страница книг берётся из кэша.
+        with self.assertNumQueries(1):
+            self.client.get(reverse('ad-list'), {'category': 'books'})
+        self.assertContains(self.client.get(reverse('ad-list'), {'category': 'other'}), 'Торшер')
+
+    def test_category_change_invalidates_old_category(self):
+        self.client.get(reverse('ad-list'), {'category': 'books'})
+        book = Ad.objects.get(pk=self.book.pk)
+        book.category = 'other'
+        book.save()
+        self.assertNotContains(self.client.get(reverse('ad-list'), {'category': 'books'}), 'Книга')
+
+    def test_category_change_of_created_instance(self):
+        self.client.get(reverse('ad-list'), {'category': 'books'})
+        self.book.category = 'electronics'
+        self.book.save()
+        self.assertNotContains(self.client.get(reverse('ad-list'), {'category': 'books'}), 'Книга')
+
+    def test_repeated_category_change_of_same_instance(self):
+        self.book.category = 'electronics'
+        self.book.save()
+        self.client.get(reverse('ad-list'), {'category': 'electronics'})
+        self.book.category = 'other'
+        self.book.save()
+        self.assertNotContains(self.client.get(reverse('ad-list'), {'category': 'electronics'}), 'Книга')
+        self.assertContains(self.client.get(reverse('ad-list'), {'category': 'other'}), 'Книга')
+
+    def test_per_user_actions_are_not_cached(self):
+        self.client.login(username='rita', password='testpass')
+        response = self.client.get(reverse('ad-list'))
+        self.assertContains(response, reverse('ad-update', args=[self.book.pk]))
+        self.assertNotContains(response, reverse('ad-update', args=[self.lamp.pk]))
+        self.client.login(username='alex', password='testpass')
+        response = self.client.get(reverse('ad-list'))
+        self.assertContains(response, reverse('ad-update', args=[self.lamp.pk]))
+        self.assertContains(response, f"{reverse('proposal-create')}?ad_receiver={self.book.pk}")
+
+    def test_api_responses_are_cached_and_invalidated(self):
+        self.assertEqual(self.client.get('/api/ads/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/ads/')['X-Cache'], 'HIT')
+        detail = f'/api/ads/{self.book.pk}/'
+        self.assertEqual(self.client.get(detail)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(detail)['X-Cache'], 'HIT')
+        self.book.title = 'Учебник'
+        self.book.save()
+        response = self.client.get(detail)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['title'], 'Учебник')
+        self.assertEqual(self.client.get('/api/ads/')['X-Cache'], 'MISS')
+
+
+@override_settings(ROOT_URLCONF='test_project.async_urls')
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        self.alex = User.objects.create_user(username='alex', password='testpass')
+        self.book = Ad.objects.create(title='Книга', description='desc', category='books', condition='new', user=self.rita)
+        self.lamp = Ad.objects.create(title='Лампа', description='desc', category='other', condition='used', user=self.alex)
+        self.proposal = ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.lamp)
+
+    async def test_ad_list(self):
+        response = await self.async_client.get(reverse('ad-list'), {'category': 'books'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Книга')
+        self.assertNotContains(response, 'Лампа')
+
+    async def test_ad_list_shows_owner_actions(self):
+        await self.async_client.alogin(username='rita', password='testpass')
+        response = await self.async_client.get(reverse('ad-list'))
+        self.assertContains(response, reverse('ad-update', args=[self.book.pk]))
+
+    async def test_ad_detail(self):
+        response = await self.async_client.get(f'/api/ads/{self.book.pk}/')
+        self.assertEqual(response.json()['title'], 'Книга')
+        response = await self.async_client.get('/api/ads/999999/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_ad_detail_fields(self):
+        response = await self.async_client.get(f'/api/ads/{self.book.pk}/', {'fields': 'title'})
+        self.assertEqual(response.json(), {'title': 'Книга'})
+
+    async def test_ad_detail_writes_fall_back_to_viewset(self):
+        await self.async_client.alogin(username='rita', password='testpass')
+        response = await self.async_client.patch(
+            f'/api/ads/{self.book.pk}/', {'title': 'Учебник'}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(f'/api/ads/{self.book.pk}/')
+        self.assertEqual(response.json()['title'], 'Учебник')
+
+    async def test_proposal_list(self):
+        response = await self.async_client.get(reverse('proposal-list'))
+        self.assertEqual(response.status_code, 302)
+        await self.async_client.alogin(username='alex', password='testpass')
+        response = await self.async_client.get(reverse('proposal-list'), {'direction': 'received'})
+        self.assertContains(response, 'Книга')
+        self.assertContains(response, "new EventSource('/proposals/events/')")
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='rita', password='testpass')
+        Ad.objects.create(title='Книга', description='desc', category='books', condition='new', user=self.user)
+
+    def sample(self, name, **labels):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_metrics(self):
+        before = self.sample('exchange_http_request_duration_seconds_count', view='ad-list', method='GET')
+        queries = self.sample('exchange_http_request_db_queries_sum', view='ad-list')
+        self.client.get(reverse('ad-list'))
+        self.assertEqual(self.sample('exchange_http_request_duration_seconds_count', view='ad-list', method='GET'), before + 1)
+        self.assertGreater(self.sample('exchange_http_request_db_queries_sum', view='ad-list'), queries)
+
+    def test_cache_metrics(self):
+        labels = {'view': 'api-ads-list', 'namespace': 'api-ads'}
+        hits = self.sample('exchange_cache_requests_total', result='hit', **labels)
+        self.client.get('/api/ads/')
+        self.client.get('/api/ads/')
+        self.assertEqual(self.sample('exchange_cache_requests_total', result='hit', **labels), hits + 1)
+
+    async def test_async_request_metrics(self):
+        labels = {'view': 'ad-list', 'method': 'GET'}
+        before = self.sample('exchange_http_request_duration_seconds_count', **labels)
+        await self.async_client.get(reverse('ad-list'))
+        self.assertEqual(self.sample('exchange_http_request_duration_seconds_count', **labels), before + 1)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('ad-list'))
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'exchange_http_request_duration_seconds_count{method="GET",view="ad-list"}')
+
+
+class SeedMarketplaceTests(TestCase):
+    def test_seed(self):
+        from exchange_app.seeding import seed_marketplace
+
+        result = seed_marketplace(users=5, ads=40, proposals=30, seed=1)
+        self.assertEqual(result.as_dict(), {'users': 5, 'ads': 40, 'proposals': 30})
+        self.assertEqual(Ad.objects.count(), 40)
+        self.assertFalse(ExchangeProposal.objects.filter(ad_sender__user=models.F('ad_receiver__user')).exists())
+        self.assertTrue(self.client.login(username=User.objects.first().username, password='marketplace'))
+
+    def test_bench_endpoints(self):
+        from exchange_app import similar
+
+        # Маршрут подсказок без индекса отвечает 503; загруженный индекс не
+        # должен пережить тест.
+        self.addCleanup(similar.reset)
+        call_command('seed_marketplace', users=5, ads=40, proposals=30, seed=1, stdout=StringIO())
+        with tempfile.NamedTemporaryFile('w+', suffix='.json') as baseline:
+            out = StringIO()
+            call_command('bench_endpoints', requests=2, warmup=0, save=baseline.name, stdout=out)
+            endpoints = json.loads(out.getvalue())['endpoints']
+            self.assertEqual(endpoints['ad-list']['status'], 200)
+            self.assertEqual(endpoints['api-proposals-detail']['status'], 200)
+            self.assertNotIn('api-ads-bulk', endpoints)
+
+            saved = json.load(baseline)
+            saved['endpoints']['api-ads-list']['queries'] = 0
+            baseline.seek(0)
+            baseline.truncate()
+            json.dump(saved, baseline)
+            baseline.flush()
+
+            out = StringIO()
+            call_command('bench_endpoints', requests=2, warmup=0, baseline=baseline.name, stdout=out)
+            self.assertIn('api-ads-list', json.loads(out.getvalue())['regressions'])
+
+
+class FastSerializationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        self.alex = User.objects.create_user(username='alex', password='testpass')
+        self.book = Ad.objects.create(title='Книга', description='desc', category='books', condition='new', user=self.rita)
+        self.lamp = Ad.objects.create(title='Лампа', description='desc', category='other', condition='used', user=self.alex)
+        self.proposal = ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.lamp, comment='Меняю')
+
+    def test_list_serializers_match_model_serializers(self):
+        from exchange_app.serializers import (
+            AdListSerializer, AdSerializer, ExchangeProposalListSerializer, ExchangeProposalSerializer,
+        )
+
+        ads = list(Ad.objects.all())
+        self.assertEqual(AdListSerializer(ads, many=True).data, AdSerializer(ads, many=True).data)
+        proposals = list(ExchangeProposal.objects.all())
+        self.assertEqual(
+            ExchangeProposalListSerializer(proposals, many=True).data,
+            ExchangeProposalSerializer(proposals, many=True).data,
+        )
+
+    def test_api_renders_and_parses_json(self):
+        response = self.client.get('/api/ads/')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual({ad['title'] for ad in response.json()['results']}, {'Книга', 'Лампа'})
+
+        self.client.login(username='rita', password='testpass')
+        response = self.client.patch(f'/api/ads/{self.book.pk}/', {'title': 'Учебник'}, content_type='application/json')
+        self.assertEqual(response.json()['title'], 'Учебник')
+        response = self.client.patch(f'/api/ads/{self.book.pk}/', '{"title":', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        self.alex = User.objects.create_user(username='alex', password='testpass')
+        self.book = Ad.objects.create(title='Книга', description='desc', category='books', condition='new', user=self.rita)
+        self.lamp = Ad.objects.create(title='Лампа', description='desc', category='other', condition='used', user=self.alex)
+        self.proposal = ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.lamp)
+
+    def test_ad_fields(self):
+        response = self.client.get('/api/ads/', {'fields': 'id,title'})
+        self.assertEqual(response.json()['results'][0], {'id': self.lamp.pk, 'title': 'Лампа'})
+        response = self.client.get(f'/api/ads/{self.book.pk}/', {'fields': 'title'})
+        self.assertEqual(response.json(), {'title': 'Книга'})
+        response = self.client.get('/api/ads/', {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_ad_fields_defer_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/ads/', {'fields': 'id,title'})
+        sql = queries.captured_queries[-1]['sql']
+        self.assertIn('"title"', sql)
+        self.assertNotIn('"description"', sql)
+
+    def test_proposal_expand(self):
+        self.client.login(username='alex', password='testpass')
+        with self.assertNumQueries(4):  # сессия, пользователь, агрегат для ETag, предложения с объявлениями
+            response = self.client.get('/api/proposals/', {'expand': 'ad_sender,ad_receiver'})
+        result = response.json()['results'][0]
+        self.assertEqual(result['ad_sender']['title'], 'Книга')
+        self.assertEqual(result['ad_receiver']['title'], 'Лампа')
+
+        response = self.client.get(f'/api/proposals/{self.proposal.pk}/', {'fields': 'id,ad_sender', 'expand': 'ad_sender'})
+        # Создание предложения обновило счётчики (и updated_at) объявления.
+        self.book.refresh_from_db()
+        self.assertEqual(response.json(), {'id': self.proposal.pk, 'ad_sender': AdSerializer(self.book).data})
+
+
+class ExchangeCycleTests(TestCase):
+    def setUp(self):
+        from exchange_app import matching
+
+        cache.clear()
+        matching.reset()
+        self.users = [User.objects.create_user(username=name, password='testpass') for name in ('rita', 'alex', 'olga')]
+        self.ads = [
+            Ad.objects.create(title=f'Вещь {user.username}', description='desc', category='other', condition='used', user=user)
+            for user in self.users
+        ]
+        a, b, c = self.ads
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ring = [
+                ExchangeProposal.objects.create(ad_sender=a, ad_receiver=b),
+                ExchangeProposal.objects.create(ad_sender=b, ad_receiver=c),
+                ExchangeProposal.objects.create(ad_sender=c, ad_receiver=a),
+            ]
+
+    def test_cycle_api(self):
+        self.client.login(username='rita', password='testpass')
+        response = self.client.get('/api/proposals/cycles/')
+        cycles = response.json()['results']
+        self.assertEqual(len(cycles), 1)
+        self.assertEqual(cycles[0]['length'], 3)
+        self.assertEqual({step['proposal'] for step in cycles[0]['steps']}, {p.pk for p in self.ring})
+
+        response = self.client.get('/api/proposals/cycles/', {'max_length': 2})
+        self.assertEqual(response.json()['results'], [])
+        response = self.client.get('/api/proposals/cycles/', {'max_length': 9})
+        self.assertEqual(response.status_code, 400)
+
+    def test_graph_is_updated_incrementally(self):
+        from exchange_app import matching
+
+        graph = matching.get_graph()
+        a, b, _ = self.ads
+        with self.captureOnCommitCallbacks(execute=True):
+            ExchangeProposal.objects.create(ad_sender=b, ad_receiver=a)
+        self.assertIs(matching.get_graph(), graph)
+        self.assertEqual({c['length'] for c in matching.cycles_for_user(self.users[0])}, {2, 3})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ring[1].status = 'rejected'
+            self.ring[1].save()
+        self.assertIs(matching.get_graph(), graph)
+        self.assertEqual([c['length'] for c in matching.cycles_for_user(self.users[0])], [2])
+
+    def test_batch_command(self):
+        out, err = StringIO(), StringIO()
+        call_command('find_exchange_cycles', stdout=out, stderr=err)
+        cycles = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([cycle['length'] for cycle in cycles], [3])
+
+
+class SimilarAdsTests(TestCase):
+    def setUp(self):
+        from exchange_app import similar
+
+        self.index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.index_dir.cleanup)
+        override = override_settings(SIMILAR_INDEX_DIR=self.index_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        similar.reset()
+        self.addCleanup(similar.reset)
+
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        self.alex = User.objects.create_user(username='alex', password='testpass')
+        self.laptop = Ad.objects.create(title='Ноутбук Lenovo', description='Игровой ноутбук, зарядка в комплекте', category='electronics', condition='used', user=self.rita)
+        self.own = Ad.objects.create(title='Ноутбук HP', description='Ноутбук с зарядкой', category='electronics', condition='used', user=self.rita)
+        self.asus = Ad.objects.create(title='Ноутбук ASUS', description='Игровой ноутбука без зарядки', category='electronics', condition='used', user=self.alex)
+        self.dress = Ad.objects.create(title='Платье летнее', description='Красное платье', category='clothing', condition='new', user=self.alex)
+        call_command('build_similar_index', dir=self.index_dir.name, stdout=StringIO())
+
+    def suggestions(self, ad):
+        response = self.client.get(f'/api/ads/{ad.pk}/suggestions/')
+        return [result['id'] for result in response.json()['results']]
+
+    def tablet(self):
+        return Ad(title='Ноутбук Lenovo игровой', description='Игровой ноутбук, зарядка', category='electronics', condition='used', user=self.alex)
+
+    def test_ranking_excludes_owner(self):
+        self.assertEqual(self.suggestions(self.laptop), [self.asus.pk, self.dress.pk])
+
+    def test_index_updates_on_save_and_delete(self):
+        self.suggestions(self.laptop)
+        with self.captureOnCommitCallbacks(execute=True):
+            tablet = self.tablet()
+            tablet.save()
+        self.assertEqual(self.suggestions(self.laptop)[0], tablet.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tablet.delete()
+        self.assertNotIn(tablet.pk, self.suggestions(self.laptop))
+
+    def test_changes_from_other_process(self):
+        from exchange_app import similar
+        from exchange_app.cache import record_changes
+
+        self.assertEqual(self.suggestions(self.laptop), [self.asus.pk, self.dress.pk])
+        # Другой воркер: строки меняются мимо сигналов этого процесса, а он
+        # узнаёт о них только из журнала в общем кэше.
+        tablet, = Ad.objects.bulk_create([self.tablet()])
+        Ad.objects.filter(pk=self.asus.pk)._raw_delete(connection.alias)
+        record_changes(similar.NAMESPACE, [tablet.pk])
+        record_changes(similar.NAMESPACE, [self.asus.pk])
+
+        with self.assertNumQueries(1):
+            similar.get_index()
+        self.assertEqual(self.suggestions(self.laptop), [tablet.pk, self.dress.pk])
+
+    def test_lost_changes_keep_stale_index(self):
+        from exchange_app import similar
+
+        index = similar.get_index()
+        cache.delete(f'generation:{similar.NAMESPACE}')
+        with self.assertLogs('exchange_app.similar', 'WARNING'), mock.patch.object(similar, '_build') as build:
+            self.assertIs(similar.get_index(), index)
+        self.assertIsNone(similar._builder)
+        build.assert_not_called()
+
+    def test_missing_index_is_not_built_in_request(self):
+        from exchange_app import similar
+
+        self.index_dir.cleanup()
+        similar.reset()
+        with mock.patch.object(similar, '_build') as build:
+            response = self.client.get(f'/api/ads/{self.laptop.pk}/suggestions/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertIsNone(similar._builder)
+        build.assert_not_called()
+
+    @override_settings(SIMILAR_INDEX_BUILD_IN_BACKGROUND=True)
+    def test_background_build_is_opt_in(self):
+        from exchange_app import similar
+
+        self.index_dir.cleanup()
+        similar.reset()
+        with mock.patch.object(similar, '_build') as build:
+            with self.assertRaises(similar.IndexNotReady):
+                similar.get_index()
+            similar._builder.join()
+        similar._builder = None
+        build.assert_called_once_with()
+
+    def test_saved_index_is_memory_mapped(self):
+        import numpy as np
+        from exchange_app import similar
+
+        index = similar.get_index()
+        self.assertIsInstance(index.vectors, np.memmap)
+        self.assertEqual(self.suggestions(self.laptop), [self.asus.pk, self.dress.pk])
+
+
+class ProposalBatchTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        self.alex = User.objects.create_user(username='alex', password='testpass')
+        self.olga = User.objects.create_user(username='olga', password='testpass')
+        self.book = Ad.objects.create(title='Книга', description='desc', category='books', condition='new', user=self.rita)
+        self.lamp = Ad.objects.create(title='Лампа', description='desc', category='other', condition='used', user=self.alex)
+        self.vase = Ad.objects.create(title='Ваза', description='desc', category='other', condition='used', user=self.olga)
+        self.chair = Ad.objects.create(title='Стул', description='desc', category='other', condition='used', user=self.olga)
+
+        self.accepted = ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.lamp)
+        self.rival = ExchangeProposal.objects.create(ad_sender=self.vase, ad_receiver=self.lamp)
+        self.book_offer = ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.chair)
+        self.unrelated = ExchangeProposal.objects.create(ad_sender=self.chair, ad_receiver=self.book)
+        self.client.login(username='alex', password='testpass')
+
+    def statuses(self):
+        return dict(ExchangeProposal.objects.values_list('pk', 'status'))
+
+    def test_accept_rejects_conflicts(self):
+        response = self.client.post(
+            '/api/proposals/batch/', {'accept': [self.accepted.pk, self.unrelated.pk]}, content_type='application/json',
+        )
+        self.assertEqual(response.json(), {
+            'accepted': [self.accepted.pk],
+            'rejected': [],
+            'auto_rejected': sorted([self.rival.pk, self.book_offer.pk, self.unrelated.pk]),
+            'skipped': [],
+        })
+        self.assertEqual(self.statuses(), {
+            self.accepted.pk: 'accepted',
+            self.rival.pk: 'rejected',
+            self.book_offer.pk: 'rejected',
+            self.unrelated.pk: 'rejected',
+        })
+
+    def test_reject_and_validation(self):
+        response = self.client.post(
+            '/api/proposals/batch/', {'reject': [self.rival.pk, self.unrelated.pk]}, content_type='application/json',
+        )
+        self.assertEqual(response.json()['rejected'], [self.rival.pk])
+        self.assertEqual(response.json()['skipped'], [self.unrelated.pk])
+        self.assertEqual(self.statuses()[self.unrelated.pk], 'pending')
+        self.assertEqual(self.statuses()[self.accepted.pk], 'pending')
+        response = self.client.post('/api/proposals/batch/', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_constant_queries(self):
+        def grow():
+            for index in range(20):
+                ad = Ad.objects.create(title=f'Вещь {index}', description='desc', category='other', condition='used', user=self.olga)
+                ExchangeProposal.objects.create(ad_sender=ad, ad_receiver=self.lamp)
+
+        def request():
+            ids = list(ExchangeProposal.objects.filter(ad_receiver=self.lamp, status='pending').values_list('pk', flat=True))
+            self.client.post('/api/proposals/batch/', {'reject': ids}, content_type='application/json')
+
+        self.assertConstantQueries(10, request, grow)
+
+    def test_html_batch(self):
+        response = self.client.post(reverse('proposal-batch'), {'proposals': [self.accepted.pk], 'action': 'accept'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.statuses()[self.rival.pk], 'rejected')
+
+    def test_html_batch_requires_known_action(self):
+        for data in ({'proposals': [self.rival.pk]}, {'proposals': [self.rival.pk], 'action': 'delete'}):
+            response = self.client.post(reverse('proposal-batch'), data)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.statuses()[self.rival.pk], 'pending')
+
+
+class ProposalValidationTests(TestCase):
+    def setUp(self):
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        self.alex = User.objects.create_user(username='alex', password='testpass')
+        self.book = Ad.objects.create(title='Книга', description='desc', category='books', condition='used', user=self.rita)
+        self.other_book = Ad.objects.create(title='Словарь', description='desc', category='books', condition='used', user=self.rita)
+        self.lamp = Ad.objects.create(title='Лампа', description='desc', category='other', condition='used', user=self.alex)
+        self.client.force_login(self.rita)
+
+    def post_form(self):
+        return self.client.post(reverse('proposal-create'), {'ad_sender': self.book.pk, 'ad_receiver': self.lamp.pk})
+
+    def test_form_checks_without_extra_queries(self):
+        # Сессия, пользователь, два объявления из полей формы, INSERT и UPDATE
+        # счётчиков обоих объявлений (+ точка сохранения).
+        with CaptureQueriesContext(connection) as captured:
+            response = self.post_form()
+        self.assertEqual(response.status_code, 302)
+        statements = [query['sql'] for query in captured if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 6, statements)
+
+    def test_duplicate_is_form_error(self):
+        ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.lamp)
+        response = self.post_form()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Предложение уже существует')
+        self.assertEqual(ExchangeProposal.objects.count(), 1)
+
+    def test_concurrent_duplicate_hits_constraint(self):
+        # Второй запрос прошёл валидацию до того, как первый записал пару.
+        form = ExchangeProposalForm({'ad_sender': self.book.pk, 'ad_receiver': self.lamp.pk}, user=self.rita)
+        self.assertTrue(form.is_valid(), form.errors)
+        ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.lamp)
+        with self.assertRaisesMessage(ValidationError, 'Предложение уже существует'):
+            form.save()
+
+    def test_database_constraints(self):
+        with self.assertRaisesMessage(ValidationError, 'с самим собой'):
+            ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.book)
+        with self.assertRaisesMessage(ValidationError, 'между своими объявлениями'):
+            ExchangeProposal(ad_sender_id=self.book.pk, ad_receiver_id=self.other_book.pk).save()
+        with self.assertRaises(IntegrityError):
+            ExchangeProposal.objects.bulk_create([ExchangeProposal(ad_sender=self.lamp, ad_receiver=self.lamp)])
+
+    def test_api_create(self):
+        payload = {'ad_sender': self.book.pk, 'ad_receiver': self.lamp.pk, 'comment': 'Меняемся?'}
+        response = self.client.post('/api/proposals/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['ad_sender'], self.book.pk)
+
+        response = self.client.post('/api/proposals/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Предложение уже существует', response.json())
+
+        response = self.client.post(
+            '/api/proposals/', {'ad_sender': self.lamp.pk, 'ad_receiver': self.book.pk}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ad_sender', response.json())
+
+    def test_api_update_is_sender_only_and_keeps_ads(self):
+        proposal = ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.lamp)
+        olga = User.objects.create_user(username='olga', password='testpass')
+        vase = Ad.objects.create(title='Ваза', description='desc', category='other', condition='used', user=olga)
+        url = f'/api/proposals/{proposal.pk}/'
+
+        response = self.client.patch(
+            url, {'ad_receiver': vase.pk, 'ad_sender': self.other_book.pk, 'comment': 'Обновил'}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        proposal.refresh_from_db()
+        self.assertEqual((proposal.ad_sender_id, proposal.ad_receiver_id, proposal.comment), (self.book.pk, self.lamp.pk, 'Обновил'))
+
+        self.client.force_login(self.alex)
+        response = self.client.patch(url, {'ad_receiver': vase.pk}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertTrue(ExchangeProposal.objects.filter(pk=proposal.pk, ad_receiver=self.lamp).exists())
+
+
+class DatabaseConfigTests(TestCase):
+    def test_sqlite_default_is_tuned(self):
+        config = database_config(Path('/srv/app'), {})
+        self.assertEqual(config['NAME'], Path('/srv/app/db.sqlite3'))
+        self.assertEqual(config['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('PRAGMA journal_mode=WAL', config['OPTIONS']['init_command'])
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+
+        config = database_config(Path('/srv/app'), {'DATABASE_URL': 'sqlite:////tmp/x.sqlite3', 'SQLITE_TUNING': '0'})
+        self.assertEqual((config['NAME'], config['OPTIONS']), (Path('/tmp/x.sqlite3'), {}))
+
+    def test_postgres_url(self):
+        environ = {'DATABASE_URL': 'postgres://rita:p%40ss@db:5433/exchange?sslmode=require', 'DB_CONN_MAX_AGE': '300'}
+        config = database_config(Path('/srv/app'), environ)
+        self.assertEqual(
+            {key: config[key] for key in ('ENGINE', 'NAME', 'USER', 'PASSWORD', 'HOST', 'PORT', 'CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')},
+            {
+                'ENGINE': 'django.db.backends.postgresql', 'NAME': 'exchange', 'USER': 'rita', 'PASSWORD': 'p@ss',
+                'HOST': 'db', 'PORT': '5433', 'CONN_MAX_AGE': 300, 'CONN_HEALTH_CHECKS': True,
+            },
+        )
+        self.assertEqual(config['OPTIONS'], {'sslmode': 'require'})
+
+        self.assertNotIn('DISABLE_SERVER_SIDE_CURSORS', config)
+
+        config = database_config(Path('/srv/app'), {**environ, 'DB_PGBOUNCER': '1'})
+        self.assertTrue(config['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertNotIn('pool', config['OPTIONS'])
+
+
+class RecordingBroker(InProcessBroker):
+    published = []
+
+    def publish(self, user_id, event):
+        self.published.append((user_id, event['type'], event['status']))
+        super().publish(user_id, event)
+
+
+@override_settings(EVENTS_BACKEND='exchange_app.tests.test.RecordingBroker')
+class ProposalEventsTests(TestCase):
+    def setUp(self):
+        events.reset()
+        self.addCleanup(events.reset)
+        RecordingBroker.published = []
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        self.alex = User.objects.create_user(username='alex', password='testpass')
+        self.book = Ad.objects.create(title='Книга', description='desc', category='books', condition='new', user=self.rita)
+        self.lamp = Ad.objects.create(title='Лампа', description='desc', category='other', condition='used', user=self.alex)
+
+    def test_created_and_status_events(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            proposal = ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.lamp)
+        self.assertEqual(RecordingBroker.published, [(self.alex.pk, 'proposal.created', 'pending')])
+
+        RecordingBroker.published = []
+        proposal = ExchangeProposal.objects.get(pk=proposal.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            proposal.comment = 'без смены статуса'
+            proposal.save()
+        self.assertEqual(RecordingBroker.published, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            decide_proposals(self.alex, reject=[proposal.pk])
+        self.assertEqual(sorted(RecordingBroker.published), sorted([
+            (self.rita.pk, 'proposal.status', 'rejected'),
+            (self.alex.pk, 'proposal.status', 'rejected'),
+        ]))
+
+    def test_session_user_id(self):
+        self.client.force_login(self.rita)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        self.assertEqual(session_user_id(cookie), self.rita.pk)
+        self.assertIsNone(session_user_id(''))
+        self.assertIsNone(session_user_id(f'{settings.SESSION_COOKIE_NAME}=missing'))
+
+    async def test_stream_delivers_until_disconnect(self):
+        sent, disconnect = asyncio.Queue(), asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        stream = asyncio.create_task(stream_events(self.rita.pk, receive, sent.put))
+        self.assertEqual((await sent.get())['status'], 200)
+        self.assertTrue((await sent.get())['body'].startswith(b'retry:'))
+
+        events.get_broker().publish(self.rita.pk, events.proposal_event('proposal.created', 7, 'pending', 1, 2))
+        body = (await asyncio.wait_for(sent.get(), 1))['body']
+        self.assertTrue(body.startswith(b'event: proposal.created\ndata: {"type":"proposal.created","id":7'))
+
+        disconnect.set()
+        await asyncio.wait_for(stream, 1)
+        self.assertEqual(events.get_broker().subscriber_count(), 0)
+
+    async def test_router(self):
+        async def django_app(scope, receive, send):
+            await send({'type': 'django', 'path': scope['path']})
+
+        async def request(path, method='GET'):
+            messages = asyncio.Queue()
+            scope = {'type': 'http', 'path': path, 'method': method, 'headers': []}
+            await EventStreamRouter(django_app)(scope, None, messages.put)
+            return messages.get_nowait()
+
+        self.assertEqual(await request('/proposals/'), {'type': 'django', 'path': '/proposals/'})
+        self.assertEqual((await request(EVENTS_PATH))['status'], 401)
+        self.assertEqual((await request(EVENTS_PATH, 'POST'))['status'], 405)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        self.alex = User.objects.create_user(username='alex', password='testpass')
+        self.book = Ad.objects.create(title='Книга', description='desc', category='books', condition='new', user=self.rita)
+        self.lamp = Ad.objects.create(title='Лампа', description='desc', category='other', condition='used', user=self.alex)
+        self.proposal = ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.lamp)
+
+    def assertNotModified(self, url, params=None, queries=0, **headers):
+        etag = self.client.get(url, params)['ETag']
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, params, headers={'if-none-match': etag, **headers})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        return etag
+
+    def test_api_ads_list(self):
+        etag = self.assertNotModified('/api/ads/', {'category': 'books'})
+        self.assertNotEqual(self.client.get('/api/ads/', {'category': 'other'})['ETag'], etag)
+        self.book.title = 'Учебник'
+        self.book.save()
+        response = self.client.get('/api/ads/', {'category': 'books'}, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_api_ad_detail(self):
+        url = f'/api/ads/{self.book.pk}/'
+        response = self.client.get(url)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertNotModified(url)
+        response = self.client.get(url, headers={'if-modified-since': response['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_ad_list_page(self):
+        self.assertNotModified(reverse('ad-list'))
+        self.client.login(username='rita', password='testpass')
+        # Сессия и пользователь: страница зависит от того, кто её смотрит.
+        self.assertNotModified(reverse('ad-list'), queries=2)
+
+    def test_api_proposals(self):
+        self.client.login(username='alex', password='testpass')
+        # Сессия, пользователь и агрегат — без выборки страницы.
+        etag = self.assertNotModified('/api/proposals/', queries=3)
+        self.assertIn('private', self.client.get('/api/proposals/')['Cache-Control'])
+
+        decide_proposals(self.alex, accept=[self.proposal.pk])
+        response = self.client.get('/api/proposals/', headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['status'], 'accepted')
+
+    def test_api_proposals_expanded_ad_change(self):
+        self.client.login(username='alex', password='testpass')
+        params = {'expand': 'ad_sender'}
+        etag = self.assertNotModified('/api/proposals/', params, queries=3)
+        Ad.objects.filter(pk=self.book.pk).update(title='Учебник', updated_at=self.book.updated_at + timedelta(seconds=1))
+        self.assertEqual(self.client.get('/api/proposals/', params, headers={'if-none-match': etag}).status_code, 200)
+        self.assertNotModified(f'/api/proposals/{self.proposal.pk}/', params, queries=3)
+
+
+class ProposalCounterMixin:
+    def assertCounters(self, ad, pending=0, accepted=0, rejected=0, sent=0):
+        ad = Ad.objects.get(pk=ad.pk)
+        self.assertEqual(
+            (ad.received_pending_count, ad.received_accepted_count, ad.received_rejected_count, ad.sent_count),
+            (pending, accepted, rejected, sent),
+        )
+
+
+class ProposalCounterTests(ProposalCounterMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        self.alex = User.objects.create_user(username='alex', password='testpass')
+        self.book = Ad.objects.create(title='Книга', description='desc', category='books', condition='new', user=self.rita)
+        self.lamp = Ad.objects.create(title='Лампа', description='desc', category='other', condition='used', user=self.alex)
+        self.chair = Ad.objects.create(title='Стул', description='desc', category='other', condition='used', user=self.alex)
+
+    def test_create_decide_delete(self):
+        first = ExchangeProposal.objects.create(ad_sender=self.lamp, ad_receiver=self.book)
+        second = ExchangeProposal.objects.create(ad_sender=self.chair, ad_receiver=self.book)
+        ExchangeProposal.objects.create(ad_sender=self.book, ad_receiver=self.chair)
+        self.assertCounters(self.book, pending=2, sent=1)
+        self.assertCounters(self.chair, pending=1, sent=1)
+
+        # Принятие отклоняет остальные предложения с участием обменянных объявлений.
+        decide_proposals(self.rita, accept=[first.pk])
+        self.assertCounters(self.book, accepted=1, rejected=1, sent=1)
+        self.assertCounters(self.chair, rejected=1, sent=1)
+
+        second.delete()
+        self.assertCounters(self.book, accepted=1, sent=1)
+        self.assertCounters(self.chair, rejected=1)
+        # Каскадное удаление объявления уменьшает счётчики второй стороны.
+        self.lamp.delete()
+        self.assertCounters(self.book, sent=1)
+        self.assertEqual(counters.recompute(), [])
+
+    def test_stale_saves_keep_counters(self):
+        stale_book = Ad.objects.get(pk=self.book.pk)
+        proposal = ExchangeProposal.objects.create(ad_sender=self.lamp, ad_receiver=self.book)
+        stale_book.title = 'Учебник'
+        stale_book.save()
+        self.assertCounters(self.book, pending=1)
+
+        # Оба ответа читали предложение в статусе pending: считается только
+        # переход от статуса, который был в базе.
+        accepted, rejected = ExchangeProposal.objects.get(pk=proposal.pk), ExchangeProposal.objects.get(pk=proposal.pk)
+        accepted.status = 'accepted'
+        accepted.save()
+        rejected.status = 'rejected'
+        rejected.save()
+        self.assertCounters(self.book, rejected=1)
+
+    def test_shown_on_card_and_in_api(self):
+        self.client.get(reverse('ad-list'))
+        ExchangeProposal.objects.create(ad_sender=self.lamp, ad_receiver=self.book)
+        self.assertContains(self.client.get(reverse('ad-list')), 'Ожидающих предложений: 1')
+        data = self.client.get(f'/api/ads/{self.book.pk}/').json()
+        self.assertEqual(data['received_pending_count'], 1)
+        self.assertEqual(self.client.get('/api/ads/').json()['results'][-1]['received_pending_count'], 1)
+
+        self.client.force_login(self.rita)
+        response = self.client.patch(
+            f'/api/ads/{self.book.pk}/', {'received_pending_count': 5}, content_type='application/json',
+        )
+        self.assertEqual(response.json()['received_pending_count'], 1)
+
+    def test_repair_command(self):
+        ExchangeProposal.objects.create(ad_sender=self.lamp, ad_receiver=self.book)
+        Ad.objects.filter(pk=self.book.pk).update(received_pending_count=7, sent_count=3)
+        out = StringIO()
+        call_command('repair_proposal_counters', batch_size=1, stdout=out)
+        self.assertIn('Исправлено объявлений: 1', out.getvalue())
+        self.assertCounters(self.book, pending=1)
+        self.assertCounters(self.lamp, sent=1)
+
+
+class ProposalCounterConcurrencyTests(ProposalCounterMixin, TransactionTestCase):
+    WORKERS = 6
+
+    @staticmethod
+    def retrying(action):
+        # Общая память тестовой базы SQLite сразу отвечает "table is locked"
+        # вместо ожидания; транзакция откатывается целиком — повторяем её.
+        for _ in range(500):
+            try:
+                return action()
+            except OperationalError:
+                time.sleep(0.002)
+        return action()
+
+    def run_workers(self, *targets):
+        errors = []
+
+        def run(target):
+            try:
+                target()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_writes_keep_counters_consistent(self):
+        rita = User.objects.create_user(username='rita')
+        book = Ad.objects.create(title='Книга', description='desc', category='books', condition='new', user=rita)
+        senders = []
+        for i in range(self.WORKERS):
+            user = User.objects.create_user(username=f'user{i}')
+            senders.append([
+                Ad.objects.create(title=f'Вещь {i}-{j}', description='desc', category='other', condition='used', user=user)
+                for j in range(5)
+            ])
+
+        def offer(ads):
+            for ad in ads:
+                proposal = self.retrying(lambda: ExchangeProposal.objects.create(ad_sender=ad, ad_receiver=book))
+                if ad.pk % 3 == 0:
+                    self.retrying(proposal.delete)
+
+        def decide_some():
+            pending = ExchangeProposal.objects.filter(ad_receiver=book, status='pending').values_list('pk', flat=True)
+            decide_proposals(rita, reject=list(pending[:2]))
+
+        def decide():
+            for _ in range(20):
+                self.retrying(decide_some)
+
+        def edit():
+            stale = self.retrying(lambda: Ad.objects.get(pk=book.pk))
+            for i in range(20):
+                stale.title = f'Книга {i}'
+                self.retrying(stale.save)
+
+        self.run_workers(*(lambda ads=ads: offer(ads) for ads in senders), decide, edit)
+
+        received = ExchangeProposal.objects.filter(ad_receiver=book)
+        self.assertCounters(
+            book,
+            pending=received.filter(status='pending').count(),
+            rejected=received.filter(status='rejected').count(),
+        )
+        self.assertEqual(counters.recompute(), [])
+
+
+@override_settings(AUTH_CACHE=True, SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class AuthCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rita = User.objects.create_user(username='rita', password='testpass')
+        Ad.objects.create(title='Книга', description='desc', category='books', condition='new', user=self.rita)
+        self.client.login(username='rita', password='testpass')
+
+    def assertLoggedIn(self, logged_in=True):
+        response = self.client.get(reverse('ad-list'))
+        self.assertEqual(response.wsgi_request.user.is_authenticated, logged_in)
+
+    def test_authenticated_request_without_auth_queries(self):
+        self.client.get(reverse('ad-list'))
+        with self.assertNumQueries(0):
+            self.assertLoggedIn()
+
+    def test_session_from_model_backend_stays_valid(self):
+        self.client.force_login(self.rita, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertLoggedIn()
+        self.client.logout()
+        self.client.login(username='rita', password='testpass')
+        self.assertEqual(self.client.session['_auth_user_backend'], 'exchange_app.auth.CachedModelBackend')
+
+    def test_user_update_invalidates(self):
+        self.assertLoggedIn()
+        self.rita.is_active = False
+        self.rita.save()
+        self.assertLoggedIn(False)
+
+    def test_password_change_ends_other_sessions(self):
+        self.assertLoggedIn()
+        self.rita.set_password('newpass')
+        self.rita.save()
+        self.assertLoggedIn(False)
+
+    def test_logout_forgets_user(self):
+        self.assertLoggedIn()
+        self.assertIsNotNone(cache.get(f'auth-user:{self.rita.pk}'))
+        self.client.logout()
+        self.assertIsNone(cache.get(f'auth-user:{self.rita.pk}'))
+        self.assertLoggedIn(False)
+
+
+class StartupTests(TestCase):
+    def test_first_request_does_not_load_heavy_packages(self):
+        # Страница входа не обращается к БД, поэтому хватает пустой базы в памяти.
+        result, _ = cold_start('/accounts/login/', env={'DATABASE_URL': 'sqlite:///:memory:'})
+        self.assertEqual(result['status'], '200 OK')
+        self.assertEqual(result['lazy_modules_loaded'], [])
+
+    def test_parse_importtime(self):
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |   exchange_app.cache\n'
+            'import time:        80 |        200 | exchange_app.signals\n'
+        )
+        modules = parse_importtime(output)
+        self.assertEqual(modules, [('exchange_app.cache', 120, 120), ('exchange_app.signals', 80, 200)])
+        self.assertEqual(package_totals(modules), {'exchange_app': 200})
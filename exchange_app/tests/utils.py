@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """Проверки числа SQL-запросов для TestCase.
+
+    ``assertMaxQueries`` ограничивает запросы сверху, а ``assertConstantQueries``
+    дополнительно проверяет, что их число не зависит от количества строк на странице.
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using=DEFAULT_DB_ALIAS):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(
+                f'{number}. {query["sql"]}'
+                for number, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(f'{executed} запросов при бюджете {budget}:\n{queries}')
+
+    def assertConstantQueries(self, budget, request, grow, using=DEFAULT_DB_ALIAS):
+        # request() выполняется дважды: до и после grow(), который добавляет строки.
+        with self.assertMaxQueries(budget, using) as before:
+            request()
+        grow()
+        with self.assertMaxQueries(budget, using) as after:
+            request()
+        self.assertEqual(
+            len(before.captured_queries),
+            len(after.captured_queries),
+            'Число запросов растёт вместе с количеством строк',
+        )
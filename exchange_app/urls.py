@@ -1,13 +1,15 @@
 from django.urls import include, path
-from fastapi_users import router
 from rest_framework.routers import DefaultRouter
 from .views import (
     AdListView,
     AdCreateView,
     AdUpdateView,
     AdDeleteView,
+    AdExportView,
     AdViewSet,
+    ExchangeProposalBatchView,
     ExchangeProposalCreateView,
+    ExchangeProposalExportView,
     ExchangeProposalListView,
     ExchangeProposalUpdateView,
     ExchangeProposalViewSet,
@@ -18,10 +20,13 @@ router.register(r'api/ads', AdViewSet, basename='api-ads')
 router.register(r'api/proposals', ExchangeProposalViewSet, basename='api-proposals')
 urlpatterns = [
     path('', AdListView.as_view(), name='ad-list'),
+    path('ads/export/', AdExportView.as_view(), name='ad-export'),
     path('ad/new/', AdCreateView.as_view(), name='ad-create'),
     path('ad/<int:pk>/edit/', AdUpdateView.as_view(), name='ad-update'),
     path('accounts/signup/', SignUpView.as_view(), name='signup'),
     path('proposals/', ExchangeProposalListView.as_view(), name='proposal-list'),
+    path('proposals/export/', ExchangeProposalExportView.as_view(), name='proposal-export'),
+    path('proposals/batch/', ExchangeProposalBatchView.as_view(), name='proposal-batch'),
     path('proposals/create/', ExchangeProposalCreateView.as_view(), name='proposal-create'),
     path('proposals/<int:pk>/update/', ExchangeProposalUpdateView.as_view(), name='proposal-update'),
     path('', include(router.urls)),
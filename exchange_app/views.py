@@ -1,66 +1,188 @@
+import io
+
 from django.contrib import messages
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.paginator import Paginator
-from django.db.models import Q
-from django.http import HttpResponseForbidden
+from django.db.models import Count, Max
+from django.http import HttpResponseBadRequest, HttpResponseForbidden
+from django.core.cache import cache
 from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 
 # Create your views here.
 
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ValidationError as DjangoValidationError
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView
-from rest_framework.decorators import APIView
-
-from exchange_app.serializers import AdSerializer, ExchangeProposalSerializer
-from .models import Ad, ExchangeProposal, ValidationError
-from rest_framework import generics, viewsets, permissions
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, View
+
+from exchange_app.serializers import (
+    AdAutocompleteSerializer,
+    AdListSerializer,
+    AdSerializer,
+    ExchangeProposalListSerializer,
+    ExchangeProposalSerializer,
+    ProposalDecisionSerializer,
+)
+from .models import Ad, ExchangeProposal
+from rest_framework import permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import UnsupportedMediaType, ValidationError
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
 
+from . import matching
 from .forms import AdCreateForm, AdFilterForm, ExchangeProposalForm, ProposalFilterForm
-from rest_framework import permissions, status
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from django.shortcuts import get_object_or_404
-class AdListView(ListView):
+from .conditional import has_pending_messages, make_etag, not_modified, set_validators
+from .cache import ad_list_generations, ad_namespace, cached, category_namespace, get_generation, record, versioned_key
+from .exporting import export_response
+from .importing import CONTENT_TYPES, decode_lines, import_ads, parse_rows
+from .pagination import KeysetPagination, KeysetPaginationMixin
+from .proposals import decide_proposals
+from .renderers import ORJSONParser, ORJSONRenderer
+from .search import search_ads
+
+AD_CACHE_TIMEOUT = 600
+
+API_RENDERER_CLASSES = [ORJSONRenderer, BrowsableAPIRenderer]
+API_PARSER_CLASSES = [ORJSONParser, FormParser, MultiPartParser]
+
+
+class SparseFieldsMixin:
+    """``?fields=a,b`` и ``?expand=ad_sender`` для list и retrieve.
+
+    Запрос к БД следует за ответом: невыбранные столбцы откладываются через
+    ``only()``, раскрываемые связи подтягиваются через ``select_related``.
+    """
+
+    # Поля, без которых не работают курсорная пагинация и условные запросы.
+    required_columns = ('id', 'created_at', 'updated_at')
+
+    def _parse_list(self, param, allowed):
+        value = self.request.query_params.get(param)
+        if not value:
+            return None
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = sorted(set(names) - set(allowed))
+        if unknown:
+            raise ValidationError({param: f'Неизвестные поля: {", ".join(unknown)}'})
+        return names
+
+    def get_sparse_options(self):
+        if self.action not in ('list', 'retrieve'):
+            return None, ()
+        if not hasattr(self, '_sparse_options'):
+            serializer_class = self.serializer_class
+            fields = self._parse_list('fields', serializer_class().fields)
+            expand = self._parse_list('expand', serializer_class.expandable_fields) or ()
+            if fields is not None:
+                expand = [name for name in expand if name in fields]
+            self._sparse_options = fields, tuple(expand)
+        return self._sparse_options
+
+    def shape_queryset(self, queryset):
+        fields, expand = self.get_sparse_options()
+        if expand:
+            queryset = queryset.select_related(*expand)
+        if fields is not None:
+            queryset = queryset.only(*{*fields, *self.required_columns})
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_sparse_options()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        if expand:
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+
+def api_representation(request):
+    # Браузерный API показывает имя пользователя, JSON от него не зависит.
+    renderer = request.accepted_renderer
+    return renderer.format, request.user.pk if renderer.format == 'api' else None
+
+
+class ListSerializerMixin:
+    """Для action='list' использует облегчённый ``list_serializer_class``."""
+
+    list_serializer_class = None
+
+    def get_serializer_class(self):
+        if self.action == 'list' and self.list_serializer_class is not None:
+            return self.list_serializer_class
+        return super().get_serializer_class()
+
+
+def render_ad_cards(ads, generations):
+    """Возвращает пары (объявление, HTML карточки), беря готовые карточки из кэша.
+
+    Ключ карточки содержит поколение её категории, поэтому любое изменение
+    объявлений категории делает старые карточки недостижимыми.
+    """
+    keys = {
+        ad.pk: versioned_key('ad-card', {ad.category: generations.get(category_namespace(ad.category))}, ad.pk)
+        for ad in ads
+    }
+    found = cache.get_many(keys.values())
+    missing = {}
+    cards = []
+    for ad in ads:
+        card = found.get(keys[ad.pk])
+        record('ad-card', card is not None)
+        if card is None:
+            card = missing[keys[ad.pk]] = render_to_string('Ad/ad_card.html', {'ad': ad})
+        cards.append((ad, mark_safe(card)))
+    if missing:
+        cache.set_many(missing, AD_CACHE_TIMEOUT)
+    return cards
+
+
+class AdListView(KeysetPaginationMixin, ListView):
     model = Ad
-    template_name = 'ad/ad_list.html'
+    template_name = 'Ad/ad_list.html'
     context_object_name = 'ads'
     paginate_by = 10
-    
+
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().order_by('-created_at')
         form = AdFilterForm(self.request.GET)
-        
+
         if form.is_valid():
-            search = form.cleaned_data.get('search')
-            category = form.cleaned_data.get('category')
-            condition = form.cleaned_data.get('condition')
-            
-
-            if search:
-                queryset = queryset.filter(
-                    Q(title__icontains=search) | 
-                    Q(description__icontains=search)
-                )
-            
-            if category:
-                queryset = queryset.filter(category=category)
-                
-            if condition:
-                queryset = queryset.filter(condition=condition)
-                
-        return queryset.order_by('-created_at')
+            queryset = form.filter_queryset(queryset)
+
+        return queryset
+
+    def get(self, request, *args, **kwargs):
+        # Фасеты на странице зависят от всех категорий, а не только от выбранной.
+        etag = make_etag(ad_list_generations(), sorted(request.GET.lists()), request.user.pk)
+        if has_pending_messages(request):
+            return super().get(request, *args, **kwargs)
+        return (
+            not_modified(request, etag, private=True)
+            or set_validators(super().get(request, *args, **kwargs), etag, private=True)
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        self.generations = ad_list_generations(self.request.GET.get('category'))
+        key = versioned_key('ad-list', self.generations, sorted(self.request.GET.lists()), page_size)
+        page, _ = cached('ad-list', key, lambda: super(AdListView, self).paginate_queryset(queryset, page_size), AD_CACHE_TIMEOUT)
+        return page
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['form'] = AdFilterForm(self.request.GET)
+        context['ad_cards'] = render_ad_cards(context['ads'], self.generations)
+        form = AdFilterForm(self.request.GET)
+        context['facets'] = form.get_facets()
+        form.add_facet_counts(context['facets'])
+        context['form'] = form
         return context
 class AdCreateView(CreateView):
     model = Ad
     form_class = AdCreateForm  
-    template_name = 'ad/ad_form.html'
+    template_name = 'Ad/ad_form.html'
     success_url = reverse_lazy('ad-list')
 
     def dispatch(self, request, *args, **kwargs):
@@ -78,7 +200,7 @@ class AdCreateView(CreateView):
 class AdUpdateView(UpdateView):
     model = Ad
     fields = ['title', 'description', 'image_url', 'category', 'condition']
-    template_name = 'ad/ad_form.html'
+    template_name = 'Ad/ad_form.html'
     success_url = reverse_lazy('ad-list')
     
     def dispatch(self, request, *args, **kwargs):
@@ -90,7 +212,7 @@ class AdUpdateView(UpdateView):
 class AdDeleteView(LoginRequiredMixin, DeleteView):
     model = Ad
     success_url = reverse_lazy('ad-list')
-    template_name = 'ad/ad_confirm_delete.html'
+    template_name = 'Ad/ad_confirm_delete.html'
 
     def dispatch(self, request, *args, **kwargs):
 
@@ -125,7 +247,7 @@ def ad_list(request):
         'category_choices': Ad.CATEGORY_CHOICES,
         'condition_choices': Ad.CONDITION_CHOICES,
     }
-    return render(request, 'ad/ad_list.html', context)
+    return render(request, 'Ad/ad_list.html', context)
 
 
 
@@ -134,7 +256,7 @@ def ad_list(request):
 class ExchangeProposalCreateView(LoginRequiredMixin, CreateView):
     model = ExchangeProposal
     form_class = ExchangeProposalForm
-    template_name = 'exchange/proposal_form.html'
+    template_name = 'Exchange/proposal_form.html'
     success_url = reverse_lazy('proposal-list')
 
     def get_form_kwargs(self):
@@ -142,41 +264,63 @@ class ExchangeProposalCreateView(LoginRequiredMixin, CreateView):
         kwargs['user'] = self.request.user
         return kwargs
 
+    def get_initial(self):
+        initial = super().get_initial()
+        if self.request.GET.get('ad_receiver'):
+            initial['ad_receiver'] = self.request.GET['ad_receiver']
+        return initial
+
     def form_valid(self, form):
-        if form.instance.ad_sender.user != self.request.user:
-            form.add_error('ad_sender', 'Неверное объявление-отправитель')
+        # Дубликат, отправленный одновременно с другим запросом, ловит
+        # ограничение БД: показываем его как ошибку формы.
+        try:
+            return super().form_valid(form)
+        except DjangoValidationError as error:
+            form.add_error(None, error)
             return self.form_invalid(form)
-        
-        return super().form_valid(form)
+
+
 class ExchangeProposalUpdateView(LoginRequiredMixin, UpdateView):
     model = ExchangeProposal
     fields = ['status']
-    template_name = 'exchange/proposal_update.html'
+    template_name = 'Exchange/proposal_update.html'
     success_url = reverse_lazy('proposal-list')
 
     def get_queryset(self):
         return super().get_queryset().filter(ad_receiver__user=self.request.user)
 
-class ExchangeProposalListView(LoginRequiredMixin, ListView):
+
+class ExchangeProposalBatchView(LoginRequiredMixin, View):
+    """Принять или отклонить отмеченные предложения одной кнопкой."""
+
+    def post(self, request):
+        action = request.POST.get('action')
+        if action not in ('accept', 'reject'):
+            return HttpResponseBadRequest('Неизвестное действие: ожидается accept или reject')
+        ids = [int(pk) for pk in request.POST.getlist('proposals') if pk.isdigit()]
+        result = decide_proposals(request.user, **{action: ids})
+
+        messages.success(
+            request,
+            f'Принято: {len(result.accepted)}, отклонено: {len(result.rejected) + len(result.auto_rejected)}, '
+            f'пропущено: {len(result.skipped)}',
+        )
+        return redirect('proposal-list')
+
+
+class ExchangeProposalListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = ExchangeProposal
-    template_name = 'exchange/proposal_list.html'
+    template_name = 'Exchange/proposal_list.html'
+    paginate_by = 20
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('ad_sender', 'ad_receiver')
         form = ProposalFilterForm(self.request.GET)
 
         if form.is_valid():
-            data = form.cleaned_data
-
-            if data.get('direction') == 'sent':
-                queryset = queryset.filter(ad_sender__user=self.request.user)
-            elif data.get('direction') == 'received':
-                queryset = queryset.filter(ad_receiver__user=self.request.user)
+            return form.filter_queryset(queryset, self.request.user)
 
-            if data.get('status'):
-                queryset = queryset.filter(status=data['status'])
-
-        return queryset
+        return queryset.for_user(self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -184,27 +328,210 @@ class ExchangeProposalListView(LoginRequiredMixin, ListView):
         return context
     
 
-class AdViewSet(viewsets.ModelViewSet):
+class AdExportView(View):
+    fields = ['id', 'user', 'title', 'description', 'image_url', 'category', 'condition', 'created_at']
+
+    def get(self, request):
+        queryset = Ad.objects.all()
+        form = AdFilterForm(request.GET)
+        if form.is_valid():
+            queryset = form.filter_queryset(queryset)
+        return export_response(queryset, self.fields, request.GET.get('format'), 'ads')
+
+
+class ExchangeProposalExportView(LoginRequiredMixin, View):
+    fields = ['id', 'ad_sender', 'ad_receiver', 'comment', 'status', 'created_at']
+
+    def get(self, request):
+        queryset = ExchangeProposal.objects.all()
+        form = ProposalFilterForm(request.GET)
+        if form.is_valid():
+            queryset = form.filter_queryset(queryset, request.user)
+        else:
+            queryset = queryset.for_user(request.user)
+        return export_response(queryset, self.fields, request.GET.get('format'), 'proposals')
+
+
+class AdViewSet(SparseFieldsMixin, ListSerializerMixin, viewsets.ModelViewSet):
     queryset = Ad.objects.all()
     serializer_class = AdSerializer
+    list_serializer_class = AdListSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    renderer_classes = API_RENDERER_CLASSES
+    parser_classes = API_PARSER_CLASSES
+
+    def get_queryset(self):
+        queryset = super().get_queryset().order_by('-created_at')
+        if self.action == 'list':
+            form = AdFilterForm(self.request.query_params)
+            if form.is_valid():
+                queryset = form.filter_queryset(queryset)
+        return self.shape_queryset(queryset)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class ExchangeProposalViewSet(viewsets.ModelViewSet):
+    def _cached_response(self, key, compute):
+        data, hit = cached('api-ads', key, lambda: compute().data, AD_CACHE_TIMEOUT)
+        return Response(data, headers={'X-Cache': 'HIT' if hit else 'MISS'})
+
+    def list(self, request, *args, **kwargs):
+        generations = ad_list_generations(request.query_params.get('category'))
+        key = versioned_key('api-ads-list', generations, request.get_host(), sorted(request.query_params.lists()))
+        # ETag — тот же ключ кэша: для 304 не нужны ни БД, ни кэш ответа.
+        etag = make_etag(key, api_representation(request))
+        return not_modified(request, etag) or set_validators(
+            self._cached_response(key, lambda: super(AdViewSet, self).list(request, *args, **kwargs)), etag,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        namespace = ad_namespace(kwargs['pk'])
+        key = versioned_key(
+            'api-ads-detail', {namespace: get_generation(namespace)}, kwargs['pk'], sorted(request.query_params.lists()),
+        )
+        etag = make_etag(key, api_representation(request))
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        response = self._cached_response(key, lambda: super(AdViewSet, self).retrieve(request, *args, **kwargs))
+        last_modified = response.data.get('updated_at')
+        return not_modified(request, etag, last_modified) or set_validators(response, etag, last_modified)
+
+    @action(detail=False)
+    def facets(self, request):
+        return Response(AdFilterForm(request.query_params).get_facets())
+
+    @action(detail=False, url_path='autocomplete', serializer_class=AdAutocompleteSerializer)
+    def autocomplete(self, request):
+        queryset = Ad.objects.order_by('-created_at').only('id', 'title', 'category', 'condition', 'created_at')
+        if request.user.is_authenticated:
+            queryset = queryset.exclude(user=request.user)
+
+        category = request.query_params.get('category')
+        if category:
+            queryset = queryset.filter(category=category)
+
+        query = request.query_params.get('q')
+        if query:
+            queryset = search_ads(queryset, query)
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True)
+    def suggestions(self, request, pk=None):
+        """Объявления других пользователей, похожие на это, — кандидаты для обмена."""
+        ad = self.get_object()
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 50))
+        except ValueError:
+            raise ValidationError({'limit': 'Должно быть числом'})
+
+        # Индекс и numpy нужны только здесь: воркер загружает их по первому запросу.
+        from . import similar
+
+        try:
+            ranked = similar.similar_ads(ad, limit)
+        except similar.IndexNotReady:
+            return Response(
+                {'detail': 'Индекс похожих объявлений ещё собирается, повторите запрос позже'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '30'},
+            )
+        ads = Ad.objects.in_bulk([ad_id for ad_id, _ in ranked])
+        results = [
+            {**AdListSerializer(ads[ad_id]).data, 'score': round(score, 4)}
+            for ad_id, score in ranked if ad_id in ads
+        ]
+        return Response({'results': results})
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        media_type = request.content_type.split(';')[0].strip()
+        fmt = CONTENT_TYPES.get(media_type)
+        if fmt is None:
+            raise UnsupportedMediaType(media_type)
+
+        stream = request.stream or io.BytesIO()
+        lines = decode_lines(iter(lambda: stream.read(64 * 1024), b''))
+        result = import_ads(parse_rows(lines, fmt), request.user)
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED if result.created else status.HTTP_400_BAD_REQUEST)
+
+class ExchangeProposalViewSet(SparseFieldsMixin, ListSerializerMixin, viewsets.ModelViewSet):
     queryset = ExchangeProposal.objects.all()
     serializer_class = ExchangeProposalSerializer
+    list_serializer_class = ExchangeProposalListSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    renderer_classes = API_RENDERER_CLASSES
+    parser_classes = API_PARSER_CLASSES
 
-    def perform_create(self, serializer):
-        serializer.save(ad_sender=self.request.user.ad)
+    def get_queryset(self):
+        queryset = self.shape_queryset(super().get_queryset())
+        form = ProposalFilterForm(self.request.query_params)
+
+        if self.action == 'list' and form.is_valid():
+            return form.filter_queryset(queryset, self.request.user)
+        if self.action in ('update', 'partial_update', 'destroy'):
+            # Комментарий меняет и предложение отзывает только отправитель;
+            # получатель отвечает через batch.
+            return queryset.for_user(self.request.user, direction='sent')
+
+        return queryset.for_user(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        # Один агрегат вместо выборки страницы: число строк ловит удаления,
+        # максимум updated_at — изменения, в том числе раскрытых объявлений.
+        _, expand = self.get_sparse_options()
+        aggregates = {'count': Count('pk'), 'updated_at': Max('updated_at')}
+        for name in expand:
+            aggregates[f'{name}_updated_at'] = Max(f'{name}__updated_at')
+        state = self.filter_queryset(self.get_queryset()).order_by().aggregate(**aggregates)
+
+        etag = make_etag(request.user.pk, sorted(request.query_params.lists()), sorted(state.items()), api_representation(request))
+        last_modified = max((value for name, value in state.items() if name != 'count' and value), default=None)
+        return not_modified(request, etag, last_modified, private=True) or set_validators(
+            super().list(request, *args, **kwargs), etag, last_modified, private=True,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        _, expand = self.get_sparse_options()
+        stamps = [instance.updated_at, *(getattr(instance, name).updated_at for name in expand)]
+        etag = make_etag(instance.pk, stamps, sorted(request.query_params.lists()), api_representation(request))
+        return not_modified(request, etag, max(stamps), private=True) or set_validators(
+            Response(self.get_serializer(instance).data), etag, max(stamps), private=True,
+        )
+
+    @action(detail=False, methods=['post'], serializer_class=ProposalDecisionSerializer)
+    def batch(self, request):
+        """Принимает и отклоняет предложения пачкой: ``{"accept": [...], "reject": [...]}``."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = decide_proposals(request.user, **serializer.validated_data)
+        return Response(result.as_dict())
+
+    @action(detail=False)
+    def cycles(self, request):
+        """Обмены по кругу через объявления пользователя из ожидающих предложений."""
+        try:
+            max_length = int(request.query_params.get('max_length', matching.DEFAULT_MAX_LENGTH))
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            raise ValidationError('max_length и limit должны быть числами')
+        if not 2 <= max_length <= matching.MAX_LENGTH:
+            raise ValidationError({'max_length': f'Допустимо от 2 до {matching.MAX_LENGTH}'})
+
+        cycles = matching.cycles_for_user(request.user, max_length, max(1, min(limit, 100)))
+        return Response({'results': cycles})
 
 
 
 class AdDeleteView(LoginRequiredMixin, DeleteView):
     model = Ad
-    template_name = 'ad/ad_confirm_delete.html'  
+    template_name = 'Ad/ad_confirm_delete.html'  
     success_url = reverse_lazy('ad-list')  
 
     def dispatch(self, request, *args, **kwargs):
@@ -0,0 +1,39 @@
+from django import forms
+from django.urls import reverse
+
+
+class AutocompleteSelect(forms.Select):
+    """Select для ModelChoiceField, который не перебирает весь queryset.
+
+    В HTML попадает только выбранный вариант; остальные подгружаются
+    скриптом из API автодополнения. Проверка при отправке формы остаётся
+    за ModelChoiceField и сводится к выборке одной строки по id.
+    """
+
+    template_name = 'widgets/autocomplete_select.html'
+
+    def __init__(self, url_name, attrs=None, choices=()):
+        super().__init__(attrs, choices)
+        self.url_name = url_name
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['autocomplete_url'] = reverse(self.url_name)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [v for v in value if v]
+        choices = [('', '---------')]
+        if selected and hasattr(self.choices, 'queryset'):
+            field = self.choices.field
+            try:
+                instances = self.choices.queryset.filter(pk__in=selected)
+                choices += [(obj.pk, field.label_from_instance(obj)) for obj in instances]
+            except (ValueError, TypeError):
+                pass
+
+        all_choices, self.choices = self.choices, choices
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = all_choices
@@ -2,6 +2,9 @@
 ASGI config for test_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with uvicorn, e.g.::
+
+    uvicorn test_project.asgi:application --workers 4
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -12,5 +15,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_project.settings')
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', '1')
+
+django_application = get_asgi_application()
+
+# Импорт после django.setup(), который выполняет get_asgi_application().
+from exchange_app.sse import EventStreamRouter  # noqa: E402
 
-application = get_asgi_application()
+# Поток событий /proposals/events/ обслуживается мимо обработчика Django.
+application = EventStreamRouter(django_application)
@@ -0,0 +1,16 @@
+"""
+URL configuration for the ASGI entry point.
+
+Hot read paths are served by async views; everything else falls through to
+the regular synchronous URLconf.
+"""
+from django.urls import include, path
+
+from exchange_app.async_views import AsyncAdListView, AsyncExchangeProposalListView, ad_detail
+
+urlpatterns = [
+    path('', AsyncAdListView.as_view(), name='ad-list'),
+    path('proposals/', AsyncExchangeProposalListView.as_view(), name='proposal-list'),
+    path('api/ads/<int:pk>/', ad_detail, name='api-ads-detail'),
+    path('', include('test_project.urls')),
+]
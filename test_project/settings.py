@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import os
 from pathlib import Path
 
+from .database import database_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'exchange_app.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +57,10 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'test_project.urls'
+# Под ASGI (test_project.asgi) горячие страницы обслуживают асинхронные представления.
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', '') == '1'
+
+ROOT_URLCONF = 'test_project.async_urls' if ASYNC_VIEWS else 'test_project.urls'
 
 TEMPLATES = [
     {
@@ -78,14 +84,66 @@ WSGI_APPLICATION = 'test_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Индекс похожих объявлений (python manage.py build_similar_index).
+SIMILAR_INDEX_DIR = BASE_DIR / 'data' / 'similar_index'
+# Собирать индекс из базы в фоновом потоке воркера, если его нет на диске
+# или журнал изменений потерян. По умолчанию этим занимается только команда.
+SIMILAR_INDEX_BUILD_IN_BACKGROUND = False
+
+# DATABASE_URL, DB_CONN_MAX_AGE и остальные переменные описаны в test_project/database.py.
+# По умолчанию — BASE_DIR / 'db.sqlite3' в режиме WAL.
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(BASE_DIR),
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Без REDIS_URL используется локальная память процесса (подходит для одного воркера).
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'exchange-app',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Сессии и пользователь сессии из кэша (exchange_app/auth.py): без SELECT
+# сессии и пользователя на каждый запрос. По умолчанию включено с общим
+# кэшем Redis; AUTH_CACHE=1 включает и с локальной памятью (один воркер).
+AUTH_CACHE = os.environ.get('AUTH_CACHE', '1' if REDIS_URL else '0') == '1'
+
+SESSION_ENGINE = (
+    'django.contrib.sessions.backends.cached_db' if AUTH_CACHE else 'django.contrib.sessions.backends.db'
+)
+
+# Путь бэкенда хранится в сессии: ModelBackend остаётся в списке, чтобы
+# сессии, открытые до CachedModelBackend, не разлогинились. Новые входы
+# получают первый бэкенд.
+AUTHENTICATION_BACKENDS = [
+    'exchange_app.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Уведомления о предложениях (SSE): через Redis доходят до подписчиков во всех
+# воркерах, без него — только в пределах процесса.
+EVENTS_BACKEND = (
+    'exchange_app.events.RedisBroker' if REDIS_URL else 'exchange_app.events.InProcessBroker'
+)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 